@@ -0,0 +1,220 @@
+"""
+Micro-benchmarks of the core code paths on synthetic decks of different sizes.
+
+Every path is timed on decks from the real 41 cards up to 100k. The results are written
+to a JSON file, and a run compared with a baseline fails when a path got slower than
+the baseline by more than the tolerance:
+
+    python -m benchmarks.bench_core --save benchmarks/baseline.json
+    python -m benchmarks.bench_core --baseline benchmarks/baseline.json [--tolerance 0.25]
+
+Baselines are machine specific, compare runs made on the same machine only.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Coroutine
+
+from cards.cards_reader import CardsReader
+from bot.deck import CardLocation, Deck, get_card_with_history
+from bot.location import Location, MenuLocation, Message
+from cards.card import Card
+from utils import chunks, unique
+
+SIZES = [41, 1_000, 10_000, 100_000]
+
+CSV_COLUMNS = [
+    'Название', 'Описание (основной текст)', 'Совет (толкование карты)', 'Ключевое значение (слова, словосочетания)',
+]
+
+
+def make_deck(directory: Path, size: int) -> Path:
+    """Write a deck of size cards with empty images, return the path of its CSV file."""
+    images = directory / 'images'
+    images.mkdir(parents=True, exist_ok=True)
+    csv_path = directory / 'card_descriptions.csv'
+    with open(csv_path, 'w', encoding='utf-8', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_COLUMNS)
+        for index in range(size):
+            name = f'Карта {index}'
+            writer.writerow([name, f'Описание карты {index}. ' * 20, f'Толкование карты {index}. ' * 10, 'слово'])
+            (images / f'{name}.png').touch()
+    return csv_path
+
+
+class _Message(SimpleNamespace):
+    async def reply_text(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    async def reply_photo(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+
+def _run(coroutine: Coroutine[Any, Any, object]) -> object:
+    # The stubbed replies never suspend, so no event loop is needed and none is measured
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError('the handler waited for something')
+
+
+def _press(location: MenuLocation, text: str) -> Callable[[], object]:
+    """Run the handler of the location for a message with the text, without Telegram."""
+    update: Any = SimpleNamespace(message=_Message(text=text, from_user=None), effective_chat=None)
+    context: Any = SimpleNamespace(user_data={})
+    callback = location._handlers[-1].callback
+    return lambda: _run(callback(update, context))
+
+
+@dataclass
+class Case:
+    name: str
+    # Prepares the deck of the given size in the directory, returns the function to time
+    prepare: Callable[[Path, int], Callable[[], object]]
+
+
+def _read_cards(directory: Path, size: int) -> Callable[[], object]:
+    reader = CardsReader(make_deck(directory, size))
+    return reader.read_cards
+
+
+def _ingest(directory: Path, size: int) -> Callable[[], object]:
+    reader = CardsReader(make_deck(directory, size))
+    return reader.ingest
+
+
+def _deck(size: int) -> Deck:
+    cards = [Card(f'Карта {index}', f'Описание {index}', f'Толкование {index}', '', '') for index in range(size)]
+    return Deck('Бенчмарк', cards, 'Взять карту')
+
+
+def _render(directory: Path, size: int) -> Callable[[], object]:
+    deck = _deck(size)
+    indexes = iter(range(10 ** 9))
+    return lambda: deck.render(next(indexes) % size)
+
+
+def _get_card_with_history(directory: Path, size: int) -> Callable[[], object]:
+    deck = _deck(size)
+    context: Any = SimpleNamespace(user_data={})
+    return lambda: get_card_with_history(context, deck)
+
+
+def _card_view_dispatch(directory: Path, size: int) -> Callable[[], object]:
+    deck = _deck(size)
+    view = CardLocation(f'Бенчмарк карты {size}', {deck.name: deck})
+    view.add_func_button_with_context('Взять ещё одну карту', view.show_next_card, [view])
+    return _press(view, 'Взять ещё одну карту')
+
+
+def _dispatch(directory: Path, size: int) -> Callable[[], object]:
+    # Location names are unique, every size gets its own
+    menu = MenuLocation(f'Бенчмарк {size}', Message('Меню'))
+    children: list[Location] = [
+        MenuLocation(f'Пункт {index} из {size}', Message(f'Пункт {index}')) for index in range(size)
+    ]
+    menu.add_children_buttons(children)
+    # The last button is the slowest one to find
+    return _press(menu, f'Пункт {size - 1} из {size} (soon)')
+
+
+def _unique(directory: Path, size: int) -> Callable[[], object]:
+    values = [index % (size // 2 + 1) for index in range(size)]
+    return lambda: unique(values)
+
+
+def _chunks(directory: Path, size: int) -> Callable[[], object]:
+    values = list(range(size))
+    return lambda: list(chunks(values, 3))
+
+
+CASES = [
+    Case('CardsReader.read_cards', _read_cards),
+    Case('CardsReader.ingest', _ingest),
+    Case('Deck.render', _render),
+    Case('get_card_with_history', _get_card_with_history),
+    Case('CardLocation dispatch', _card_view_dispatch),
+    Case('MenuLocation dispatch', _dispatch),
+    Case('utils.unique', _unique),
+    Case('utils.chunks', _chunks),
+]
+
+
+def measure(case: Case, size: int, repeats: int, min_time: float) -> float:
+    """Median seconds per call over the repeats, every repeat runs for at least min_time."""
+    timings: list[float] = []
+    with tempfile.TemporaryDirectory() as directory:
+        function = case.prepare(Path(directory), size)
+        for _ in range(repeats):
+            calls = 0
+            started = time.perf_counter()
+            while True:
+                function()
+                calls += 1
+                elapsed = time.perf_counter() - started
+                if elapsed >= min_time:
+                    break
+            timings.append(elapsed / calls)
+    return statistics.median(timings)
+
+
+def run(sizes: list[int], repeats: int = 5, min_time: float = 0.05) -> dict[str, dict[str, float]]:
+    results: dict[str, dict[str, float]] = {}
+    for case in CASES:
+        for size in sizes:
+            seconds = measure(case, size, repeats, min_time)
+            results.setdefault(case.name, {})[str(size)] = seconds
+            print(f'{case.name:<32} {size:>7} cards {seconds * 1000:12.4f} ms')
+    return results
+
+
+def compare(
+    results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], tolerance: float,
+) -> list[str]:
+    """Describe every path which got slower than its baseline by more than the tolerance."""
+    regressions: list[str] = []
+    for name, sizes in results.items():
+        for size, seconds in sizes.items():
+            expected = baseline.get(name, {}).get(size)
+            if expected and seconds > expected * (1 + tolerance):
+                regressions.append(
+                    f'{name} at {size} cards: {seconds * 1000:.4f} ms, baseline {expected * 1000:.4f} ms'
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the core code paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='deck sizes to measure')
+    parser.add_argument('--repeats', type=int, default=5, help='repeats of every measurement')
+    parser.add_argument('--save', type=Path, help='file to write the results to, as a new baseline')
+    parser.add_argument('--baseline', type=Path, help='results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    args = parser.parse_args()
+    # Building locations logs every card
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = run(args.sizes, args.repeats)
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding='utf-8')), args.tolerance)
+        for regression in regressions:
+            print(f'regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Throughput of the multi-worker mode for different numbers of workers.
+
+The workers run the real conversation against an offline bot, so the numbers show how
+update processing scales with the processes, without the network in the way.
+
+Usage: python -m benchmarks.bench_sharding [--updates N] [--workers 1 2 4]
+"""
+
+import argparse
+import time
+from typing import Any
+
+from bot.offline import create_offline_application
+from bot.sharding import ShardedRunner
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict[str, Any]:
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'}, 'from': user,
+        },
+    }
+
+
+def wait_processed(runner: ShardedRunner, count: int, timeout: float = 600) -> None:
+    deadline = time.monotonic() + timeout
+    while runner.processed() < count:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'only {runner.processed()} of {count} updates processed')
+        time.sleep(0.005)
+
+
+def measure(workers: int, updates: int, chats: int) -> float:
+    """Return the throughput in updates per second."""
+    runner = ShardedRunner(workers, create_offline_application)
+    runner.start()
+    try:
+        # Warm up every worker, so the start of the processes is not measured
+        for chat_id in range(workers):
+            runner.dispatch(make_update(chat_id, chat_id, '/start'))
+        wait_processed(runner, workers)
+
+        started = time.perf_counter()
+        for update_id in range(updates):
+            runner.dispatch(make_update(workers + update_id, update_id % chats, 'Взять карту'))
+        wait_processed(runner, workers + updates)
+        return updates / (time.perf_counter() - started)
+    finally:
+        runner.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Throughput of the sharded multi-worker mode')
+    parser.add_argument('--updates', type=int, default=2000, help='number of updates per run')
+    parser.add_argument('--chats', type=int, default=1000, help='number of distinct chats')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts to measure')
+    args = parser.parse_args()
+
+    baseline: float | None = None
+    for workers in args.workers:
+        throughput = measure(workers, args.updates, args.chats)
+        baseline = baseline or throughput
+        print(f'{workers} workers: {throughput:8.1f} updates/s, scaling x{throughput / baseline:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Analytics of the bot: which cards are drawn, by whom, when and how fast the bot answered.
+
+Handlers only append events to an in-memory ring buffer. A background task writes the
+buffer in batches to an append-only SQLite log in a worker thread, so the event loop never
+waits for the disk. The log is aggregated offline:
+
+    python -m bot.analytics analytics.sqlite cards|daily|latency
+"""
+
+import argparse
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from dataclasses import astuple, dataclass
+from pathlib import Path
+from typing import Any, cast
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+
+SPREAD_SEPARATOR = ' | '
+
+
+@dataclass
+class Event:
+    timestamp: float
+    kind: str  # 'draw', 'spread' or 'navigation'
+    user_id: int | None
+    card: str | None = None  # the cards of a spread are joined with SPREAD_SEPARATOR
+    location: str | None = None
+    latency_ms: float | None = None
+
+
+class EventStore:
+    """Append-only SQLite log of events."""
+
+    def __init__(self, db_path: str | Path) -> None:
+        self.db_path = Path(db_path)
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                timestamp REAL NOT NULL, kind TEXT NOT NULL, user_id INTEGER,
+                card TEXT, location TEXT, latency_ms REAL
+            )
+        ''')
+        self._connection.commit()
+
+    def append(self, events: list[Event]) -> None:
+        with self._connection:
+            self._connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)', map(astuple, events))
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class Analytics:
+    def __init__(self, capacity: int = 10000, batch_size: int = 500, flush_interval: float = 5.0) -> None:
+        self._buffer: deque[Event] = deque(maxlen=capacity)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._store: EventStore | None = None
+        self._buttons: set[str] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._flusher: asyncio.Task[None] | None = None
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None
+
+    def open(self, db_path: str | Path, buttons: set[str]) -> None:
+        """Start recording events; only the given button texts are stored, not free user input."""
+        self._store = EventStore(db_path)
+        self._buttons = buttons
+        logger.info(f'analytics events are written to {db_path}')
+
+    def record(self, event: Event) -> None:
+        if not self._store:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            # The store can't keep up, the oldest event is overwritten
+            self.dropped += 1
+        self._buffer.append(event)
+        if self._wakeup and len(self._buffer) >= self._batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        if not self._store or not self._buffer:
+            return
+        batch = list(self._buffer)
+        self._buffer.clear()
+        try:
+            await asyncio.to_thread(self._store.append, batch)
+        except sqlite3.Error as e:
+            logger.error(f'failed to write {len(batch)} analytics events: {e}')
+
+    async def start(self) -> None:
+        if self._store and not self._flusher:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        self._wakeup = None
+        await self.flush()
+        if self.dropped:
+            logger.warning(f'{self.dropped} analytics events were dropped')
+
+    def location_of(self, text: str) -> str:
+        return text if text in self._buttons else '<text>'
+
+    async def _flush_periodically(self) -> None:
+        assert self._wakeup
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+analytics = Analytics()
+
+
+def _pending(context: ContextTypes.DEFAULT_TYPE) -> dict[str, Any]:
+    # The same context object is passed to every handler group of one update
+    return cast(dict[str, Any], context.__dict__.setdefault('analytics', {}))
+
+
+def record_draw(context: ContextTypes.DEFAULT_TYPE, card_name: str) -> None:
+    """Remember a card drawn while handling the current update."""
+    _pending(context).setdefault('cards', []).append(card_name)
+
+
+def record_spread(context: ContextTypes.DEFAULT_TYPE, card_names: list[str]) -> None:
+    """Remember a spread laid out while handling the current update, its cards are recorded as draws too."""
+    _pending(context).setdefault('spreads', []).append(SPREAD_SEPARATOR.join(card_names))
+
+
+def record_button(context: ContextTypes.DEFAULT_TYPE, button: str) -> None:
+    """Remember the inline keyboard button pressed by the current update."""
+    _pending(context)['button'] = button
+
+
+async def begin_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    _pending(context)['started'] = time.perf_counter()
+
+
+def update_latency_ms(context: ContextTypes.DEFAULT_TYPE) -> float | None:
+    """Milliseconds since the current update started to be handled."""
+    started = _pending(context).get('started')
+    return (time.perf_counter() - started) * 1000 if started is not None else None
+
+
+async def finish_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    pending = _pending(context)
+    latency_ms = update_latency_ms(context)
+    now = time.time()
+    user_id = update.effective_user.id if update.effective_user else None
+
+    text = update.message.text if update.message and update.message.text else pending.get('button')
+    if text:
+        location = analytics.location_of(text)
+        analytics.record(Event(now, 'navigation', user_id, location=location, latency_ms=latency_ms))
+    for card in pending.get('cards', []):
+        analytics.record(Event(now, 'draw', user_id, card=card, latency_ms=latency_ms))
+    for spread in pending.get('spreads', []):
+        analytics.record(Event(now, 'spread', user_id, card=spread, latency_ms=latency_ms))
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(db_path: str | Path, kind: str) -> list[tuple[Any, ...]]:
+    connection = sqlite3.connect(db_path)
+    try:
+        if kind == 'cards':
+            return connection.execute(
+                "SELECT card, COUNT(*) FROM events WHERE kind = 'draw' GROUP BY card ORDER BY 2 DESC, 1"
+            ).fetchall()
+        if kind == 'daily':
+            return connection.execute(
+                "SELECT date(timestamp, 'unixepoch'), COUNT(DISTINCT user_id) FROM events GROUP BY 1 ORDER BY 1"
+            ).fetchall()
+        if kind == 'latency':
+            latencies: dict[int, list[float]] = {}
+            rows = connection.execute(
+                "SELECT CAST(strftime('%H', timestamp, 'unixepoch') AS INTEGER), latency_ms FROM events "
+                "WHERE kind = 'navigation' AND latency_ms IS NOT NULL"
+            )
+            for hour, latency in rows:
+                latencies.setdefault(hour, []).append(latency)
+            return [
+                (hour, len(values), round(sum(values) / len(values), 2), round(_percentile(values, 0.95), 2))
+                for hour, values in sorted(latencies.items())
+            ]
+        raise ValueError(f'unknown report: {kind}')
+    finally:
+        connection.close()
+
+
+_REPORT_HEADERS = {
+    'cards': ('card', 'draws'),
+    'daily': ('day (UTC)', 'active users'),
+    'latency': ('hour (UTC)', 'updates', 'mean ms', 'p95 ms'),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Aggregate the analytics log of the bot')
+    parser.add_argument('db_path', type=Path, help='SQLite file with analytics events')
+    parser.add_argument('report', choices=sorted(_REPORT_HEADERS), help='report to build')
+    args = parser.parse_args()
+
+    print('\t'.join(_REPORT_HEADERS[args.report]))
+    for row in report(args.db_path, args.report):
+        print('\t'.join(str(value) for value in row))
+
+
+if __name__ == '__main__':
+    main()
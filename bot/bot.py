@@ -2,11 +2,34 @@ from telegram.ext._handlers.messagehandler import MessageHandler
 from bot.location import Location
 from telegram.ext._handlers.commandhandler import CommandHandler
 from telegram.ext._handlers.conversationhandler import ConversationHandler
-from .menu import main_menu_location
+from .analytics import analytics, begin_update, finish_update
+from .collage import collages
+from .dedup import skip_duplicate
+from .health import monitor
+from .inline import CALLBACK_PREFIX, close_media_cache, navigate, open_media_cache, start_inline
+from .reminders import reminders
+from .profiling import begin_update as begin_profiling, finish_update as finish_profiling
+from .profiling import profile_on_signal, profiler, start_profiling
+from .journal import CALLBACK_PREFIX as JOURNAL_PREFIX, journal, write_readings
+from .menu import journal_view, main_menu_location
+from .persistence import SqlitePersistence
+from .rendering import remember_locale
+from .shutdown import TrackingUpdateProcessor, coordinator
+from .stats import show_stats, stats, track_update
+from .throttle import FloodLimit, Throttle, throttle_update
+from .traffic import record_update, recorder
+from .transport import ApiServer, RoutingRequest, TransportConfig
+from bot.location import MenuLocation
+import asyncio
 import logging
+import signal
+from functools import partial
+from pathlib import Path
+from typing import Any, Sequence
 
 from telegram import ReplyKeyboardRemove, Update
-from telegram.ext import ContextTypes, BaseHandler, filters
+from telegram.ext import Application, CallbackQueryHandler, ContextTypes, BaseHandler, TypeHandler, filters
+from telegram.request import BaseRequest
 
 from utils import prepare_logging
 
@@ -26,15 +49,20 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
-def create_fallbacks() -> list[BaseHandler[Update, ContextTypes.DEFAULT_TYPE, object]]:
+def create_fallbacks(admin_filter: filters.User) -> list[BaseHandler[Update, ContextTypes.DEFAULT_TYPE, object]]:
     fallbacks: list[BaseHandler[Update, ContextTypes.DEFAULT_TYPE, object]]
-    fallbacks = [CommandHandler("cancel", cancel)]
+    fallbacks = [
+        CommandHandler("cancel", cancel),
+        CommandHandler("stats", show_stats, filters=admin_filter),
+        CommandHandler("profile", start_profiling, filters=admin_filter),
+    ]
     logger.info(f"number of fallbacks: {len(fallbacks)}")
     return fallbacks
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.error("Exception while handling an update:", exc_info=context.error)
+    stats.record_error()
 
 
 async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Location:
@@ -42,10 +70,12 @@ async def handle_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return main_menu_location
 
 
-def create_entry_points() -> list[BaseHandler[Update, ContextTypes.DEFAULT_TYPE, object]]:
+def create_entry_points(admin_filter: filters.User) -> list[BaseHandler[Update, ContextTypes.DEFAULT_TYPE, object]]:
     entry_points: list[BaseHandler[Update, ContextTypes.DEFAULT_TYPE, object]]
     entry_points = [
         CommandHandler("start", handle_main_menu),
+        CommandHandler("stats", show_stats, filters=admin_filter),
+        CommandHandler("profile", start_profiling, filters=admin_filter),
         *main_menu_location._handlers,
         MessageHandler(filters.Regex('.*'), handle_main_menu),
     ]
@@ -66,3 +96,131 @@ def create_states() -> dict[object, list[BaseHandler[Update, ContextTypes.DEFAUL
     logger.info(f"created states: {created_states}")
 
     return states
+
+
+def create_conversation_handler(
+    persistent: bool = False, admins: Sequence[int] = (),
+) -> ConversationHandler[ContextTypes.DEFAULT_TYPE]:
+    # Telegram user ids allowed to call /stats and /profile of this bot, the other bots of the process have their own
+    admin_filter = filters.User(admins)
+    return ConversationHandler(
+        entry_points=create_entry_points(admin_filter),
+        states=create_states(),
+        fallbacks=create_fallbacks(admin_filter),
+        name='oracle',
+        persistent=persistent,
+    )
+
+
+def collect_button_names() -> set[str]:
+    names = {'/start', '/cancel', '/stats', '/profile'}
+    for location in create_states():
+        if isinstance(location, MenuLocation):
+            names.update(location._get_button_names())
+    return names
+
+
+async def post_init(application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+    await analytics.start()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profile_on_signal)
+        if coordinator.deadline is not None:
+            coordinator.install(application)
+    except (NotImplementedError, AttributeError):
+        logger.info('signal handlers are not supported on this platform')
+    monitor.start(application)
+    reminders.start(application)
+    coordinator.ready = True
+
+
+async def post_shutdown(application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+    coordinator.ready = False
+    monitor.stop()
+    await reminders.stop()
+    reminders.close()
+    await analytics.stop()
+    recorder.close()
+    close_media_cache()
+    journal.close()
+    collages.close()
+
+
+def build_application(
+    token: str, persistence_path: str | Path | None = None, request: BaseRequest | None = None,
+    analytics_path: str | Path | None = None, admins: Sequence[int] = (), transport: TransportConfig | None = None,
+    record_path: str | Path | None = None, navigation: str = 'reply', flood_limit: FloodLimit | None = None,
+    shutdown_deadline: float | None = None, media_cache_path: str | Path | None = None,
+    health_port: int | None = None, health_listen: str = '127.0.0.1', journal_path: str | Path | None = None,
+    collage_cache_path: str | Path | None = None, collage_cache_bytes: int = 100 * 1024 * 1024,
+    api_server: ApiServer | None = None, reminders_path: str | Path | None = None,
+    shared_request: BaseRequest | None = None,
+) -> Application[Any, Any, Any, Any, Any, Any]:
+    """
+    Build the bot application, optionally with state persisted to a shared SQLite file.
+
+    With the 'inline' navigation /start shows the menu with an inline keyboard, and its
+    buttons edit the message; texts typed or sent by reply keyboards are still handled.
+    Users are throttled only with a flood_limit, replays and benchmarks run without it.
+    With a shutdown_deadline the stop signals drain the updates in flight first, which
+    only works with run_polling; the workers of the sharded mode drain their own queues.
+    A shared_request sends the API calls of several bots through the same connection pools,
+    each bot still polls for updates with its own connection.
+    """
+    buttons = collect_button_names()
+    profiler.buttons = buttons
+    monitor.buttons = buttons
+    # Like the other services of the process, set only when given: the later bots of a hosting config get no options
+    if health_port is not None:
+        monitor.port = health_port
+        monitor.listen = health_listen
+    if analytics_path:
+        analytics.open(analytics_path, buttons)
+    if record_path:
+        recorder.open(record_path, buttons)
+    if shutdown_deadline is not None:
+        coordinator.deadline = shutdown_deadline
+    if media_cache_path:
+        open_media_cache(media_cache_path)
+    if journal_path:
+        journal.open(journal_path)
+    if reminders_path:
+        reminders.open(reminders_path)
+    if collage_cache_path:
+        collages.open(collage_cache_path, collage_cache_bytes)
+    builder = Application.builder().token(token).post_init(post_init).post_shutdown(post_shutdown)
+    builder = builder.concurrent_updates(TrackingUpdateProcessor())
+    if api_server:
+        builder = builder.base_url(api_server.base_url).base_file_url(api_server.base_file_url)
+        builder = builder.local_mode(api_server.local_mode)
+    if persistence_path:
+        builder = builder.persistence(SqlitePersistence(persistence_path))
+    if request:
+        builder = builder.request(request).get_updates_request(request)
+    elif shared_request:
+        builder = builder.request(shared_request)
+    elif transport:
+        builder = builder.request(RoutingRequest(transport))
+    application = builder.build()
+    if record_path:
+        application.add_handler(TypeHandler(Update, record_update), group=-6)
+    application.add_handler(TypeHandler(Update, skip_duplicate), group=-5)
+    if flood_limit:
+        # Every bot has its own buckets, a user of two bots is limited by each of them separately
+        application.add_handler(TypeHandler(Update, partial(
+            throttle_update, limiter=Throttle(flood_limit), admins=frozenset(admins),
+        )), group=-4)
+    # After the duplicates and the flood are dropped, they do not touch user_data
+    application.add_handler(TypeHandler(Update, remember_locale), group=-3)
+    application.add_handler(TypeHandler(Update, begin_update), group=-2)
+    application.add_handler(TypeHandler(Update, begin_profiling), group=-1)
+    if navigation == 'inline':
+        application.add_handler(CommandHandler('start', start_inline))
+        application.add_handler(CallbackQueryHandler(navigate, pattern=f'^{CALLBACK_PREFIX}:'))
+    application.add_handler(CallbackQueryHandler(journal_view.turn_page, pattern=f'^{JOURNAL_PREFIX}:'))
+    application.add_handler(create_conversation_handler(persistent=persistence_path is not None, admins=admins))
+    application.add_handler(TypeHandler(Update, finish_profiling), group=1)
+    application.add_handler(TypeHandler(Update, finish_update), group=2)
+    application.add_handler(TypeHandler(Update, track_update), group=3)
+    application.add_handler(TypeHandler(Update, write_readings), group=4)
+    application.add_error_handler(error_handler)
+    return application
@@ -0,0 +1,155 @@
+"""
+Collages of the cards of a spread, sent as one down-scaled photo instead of several PNGs.
+
+A collage is rendered in a worker thread, so the event loop does not wait for Pillow, and
+cached on disk by the deck and the ordered card indexes, with the file_ids Telegram gave
+it on the first upload by every bot. The least recently used collages are removed over the byte budget.
+Pillow is optional: without it spreads are sent as text.
+"""
+
+import asyncio
+import io
+import json
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+from telegram import Bot, Message as TgMessage
+
+from bot.inline import bot_key
+from utils import prepare_logging
+
+try:
+    from PIL import Image
+    HAS_PILLOW = True
+except ImportError:
+    HAS_PILLOW = False
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+COLLAGE_HEIGHT = 800
+GAP = 16
+BACKGROUND = (255, 255, 255)
+
+
+def render_collage(image_paths: Sequence[str], height: int = COLLAGE_HEIGHT, quality: int = 85) -> bytes:
+    """The images scaled to the height, side by side, as a JPEG."""
+    if not HAS_PILLOW:
+        raise RuntimeError('Pillow is not installed')
+    images = []
+    for image_path in image_paths:
+        with Image.open(image_path) as image:
+            width = max(1, image.width * height // image.height)
+            images.append(image.convert('RGB').resize((width, height), Image.Resampling.LANCZOS))
+    collage = Image.new('RGB', (sum(scaled.width for scaled in images) + GAP * (len(images) + 1), height + 2 * GAP),
+                        BACKGROUND)
+    left = GAP
+    for scaled in images:
+        collage.paste(scaled, (left, GAP))
+        left += scaled.width + GAP
+    output = io.BytesIO()
+    collage.save(output, 'JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class CollageCache:
+    """Rendered collages by key in a directory, with their sizes and file_ids in the order of use."""
+
+    def __init__(self, render: Callable[[Sequence[str]], bytes] = render_collage) -> None:
+        self._render = render
+        self._directory: Path | None = None
+        self._max_bytes = 0
+        # key: [size in bytes, file_id by bot], the least recently used first
+        self._entries: OrderedDict[str, tuple[int, dict[str, str]]] = OrderedDict()
+        self.total_bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._directory is not None and (HAS_PILLOW or self._render is not render_collage)
+
+    def open(self, directory: str | Path, max_bytes: int = 100 * 1024 * 1024) -> None:
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        if not self.enabled:
+            logger.warning('Pillow is not installed, spreads are sent without collages')
+        try:
+            entries = json.loads((self._directory / 'index.json').read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            entries = {}
+        except ValueError as e:
+            logger.warning(f'collage index in {directory} is not loaded: {e}')
+            entries = {}
+        self._entries = OrderedDict(
+            (key, self._entry(*entry)) for key, entry in entries.items() if self.path(key).exists()
+        )
+        self.total_bytes = sum(size for size, _ in self._entries.values())
+        self._evict()
+
+    def close(self) -> None:
+        if self._directory:
+            (self._directory / 'index.json').write_text(json.dumps(self._entries), encoding='utf-8')
+            logger.info(f'{len(self._entries)} collages, {self.total_bytes} bytes, in {self._directory}')
+
+    @staticmethod
+    def _entry(size: int, file_ids: Any) -> tuple[int, dict[str, str]]:
+        # A file_id of an older index is of an unknown bot
+        return int(size), file_ids if isinstance(file_ids, dict) else {}
+
+    @staticmethod
+    def key(deck_key: str, indexes: Sequence[int]) -> str:
+        return '-'.join([deck_key, *map(str, indexes)])
+
+    def path(self, key: str) -> Path:
+        assert self._directory
+        return self._directory / f'{key}.jpg'
+
+    def cached(self, key: str) -> str | None:
+        """The path of the collage if it is rendered already."""
+        return str(self.path(key)) if self._directory and key in self._entries else None
+
+    async def get(self, key: str, image_paths: Sequence[str]) -> str | None:
+        """The path of the collage, rendered in a worker thread on a miss; None if collages are off or failed."""
+        if not self.enabled:
+            return None
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return str(self.path(key))
+        try:
+            size = await asyncio.to_thread(self._render_to_file, key, image_paths)
+        except (OSError, ValueError, RuntimeError) as e:
+            logger.error(f'failed to render collage {key}: {e}')
+            return None
+        self._entries[key] = (size, {})
+        self.total_bytes += size
+        self._evict()
+        return str(self.path(key))
+
+    def photo(self, image_path: str, bot: Bot) -> str | Path:
+        """What the bot sends for the collage: its file_id if the bot uploaded it, else its path."""
+        entry = self._entries.get(Path(image_path).stem)
+        file_id = entry[1].get(bot_key(bot)) if entry else None
+        return file_id or Path(image_path)
+
+    def remember_file_id(self, image_path: str, bot: Bot, message: TgMessage) -> None:
+        entry = self._entries.get(Path(image_path).stem)
+        if entry and message.photo:
+            entry[1][bot_key(bot)] = message.photo[-1].file_id
+
+    def _render_to_file(self, key: str, image_paths: Sequence[str]) -> int:
+        data = self._render(image_paths)
+        self.path(key).write_bytes(data)
+        return len(data)
+
+    def _evict(self) -> None:
+        # The newest collage stays even if it alone is over the budget
+        while self.total_bytes > self._max_bytes and len(self._entries) > 1:
+            key, (size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.path(key).unlink(missing_ok=True)
+
+
+collages = CollageCache()
@@ -0,0 +1,190 @@
+"""
+Decks of cards shown by one generic card view state.
+
+A deck is only a list of cards, the text of a card is rendered when the card is shown.
+The card view location, with its handlers and keyboard, is shared by every card of every
+deck: the card a user looks at is kept in user_data as the deck name and the card index.
+So adding a deck, or a thousand cards to one, adds no states and no handlers.
+"""
+
+import logging
+import random
+from collections import deque
+from pathlib import Path
+from typing import Any, cast
+
+from telegram.ext import ContextTypes
+
+from bot.analytics import record_draw, record_spread
+from bot.collage import CollageCache, collages
+from bot.journal import SINGLE_CARD, THREE_CARDS, deck_key, record_reading
+from bot.location import MenuLocation, Message, Reply
+from bot.rendering import DEFAULT_LOCALE, SPREAD_LAYOUTS, card_texts, locale_of
+from cards.card import Card
+from cards.cards_reader import CardsReader, DeckIngestion
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+# How many draws before a card can repeat for the same user
+CARD_HISTORY_SIZE = 5
+# Draws before a card of the history is accepted anyway
+DRAW_TRIES = 100
+
+# Keys in user_data: names of the recently drawn cards, and the deck and index of the shown one
+HISTORY_KEY = 'card_history'
+CARD_VIEW_KEY = 'card_view'
+SPREAD_KEY = 'spread'
+
+# Source of card draws, seeded by the replay to make runs deterministic
+rng = random.Random()
+
+
+class Deck:
+    def __init__(self, name: str, cards: list[Card], button: str, spread_button: str | None = None) -> None:
+        self.name = name
+        self.cards = cards
+        # Texts of the main menu buttons drawing a card and a spread from this deck
+        self.button = button
+        self.spread_button = spread_button
+        # Reader of the CSV file and the images, if the deck was read from them
+        self.reader: CardsReader | None = None
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    @classmethod
+    def from_csv(
+        cls, name: str, csv_path: str | Path, images_dir: str | Path | None = None, button: str = 'Взять карту',
+        spread_button: str | None = None,
+    ) -> 'Deck':
+        # Absolute image paths can be passed to a local Bot API server as they are
+        reader = CardsReader(csv_path, images_dir, absolute_paths=True)
+        deck = cls(name, reader.read_cards(), button, spread_button)
+        deck.reader = reader
+        return deck
+
+    def check_images(self) -> DeckIngestion | None:
+        """Read and verify every image of the deck, logging the broken ones; slow for a large deck."""
+        if self.reader is None:
+            return None
+        ingestion = self.reader.ingest()
+        for image in ingestion.invalid:
+            logger.warning(f'image of card {image.card_name} in deck {self.name} is broken: {image.error}')
+        logger.info(
+            f'deck {self.name}: {len(ingestion.cards)} cards, {sum(image.size for image in ingestion.images)} bytes '
+            f'of images checked in {ingestion.seconds:.3f}s'
+        )
+        return ingestion
+
+    def render(self, index: int, locale: str = DEFAULT_LOCALE) -> Message:
+        return Message(text=card_texts.render(self, index, locale), image_path=self.cards[index].image_path)
+
+
+def get_card_with_history(context: ContextTypes.DEFAULT_TYPE, deck: Deck, spread: int = SINGLE_CARD) -> int:
+    """Select a card that hasn't been drawn in the last CARD_HISTORY_SIZE draws for this user."""
+    user_data = cast(dict[str, Any], context.user_data)
+    if HISTORY_KEY not in user_data:
+        user_data[HISTORY_KEY] = deque(maxlen=CARD_HISTORY_SIZE)
+    history: deque[str] = user_data[HISTORY_KEY]
+
+    # Drawing again is cheaper than listing the available cards of a large deck.
+    # If every card is in the history (shouldn't happen with enough cards), any card goes
+    index = rng.randrange(len(deck))
+    for _ in range(DRAW_TRIES):
+        if deck.cards[index].name not in history:
+            break
+        index = rng.randrange(len(deck))
+
+    history.append(deck.cards[index].name)
+    record_draw(context, deck.cards[index].name)
+    record_reading(context, deck.name, index, spread)
+    return index
+
+
+class CardLocation(MenuLocation):
+    """The state showing the card the user has drawn, from whichever deck."""
+
+    def __init__(self, name: str, decks: dict[str, Deck]) -> None:
+        # Text and photo are sent separately to avoid cropping
+        super().__init__(name, Message('Возьмите карту'), send_photo_separately=True)
+        self.decks = decks
+
+    def show_card(self, context: ContextTypes.DEFAULT_TYPE, deck: Deck) -> 'CardLocation':
+        """Draw a card of the deck for the user and return the location showing it."""
+        index = get_card_with_history(context, deck)
+        cast(dict[str, Any], context.user_data)[CARD_VIEW_KEY] = (deck.name, index)
+        return self
+
+    def show_next_card(self, context: ContextTypes.DEFAULT_TYPE) -> 'CardLocation':
+        """Draw another card of the deck the user is looking at."""
+        deck_name, _ = cast(dict[str, Any], context.user_data).get(CARD_VIEW_KEY, (None, 0))
+        deck = self.decks.get(deck_name) or next(iter(self.decks.values()))
+        return self.show_card(context, deck)
+
+    def welcome_message(self, context: ContextTypes.DEFAULT_TYPE) -> Message:
+        deck_name, index = cast(dict[str, Any], context.user_data).get(CARD_VIEW_KEY, (None, 0))
+        deck = self.decks.get(deck_name)
+        if deck is None or index >= len(deck):
+            # The deck was removed or shrunk since the card was drawn
+            logger.warning(f'card {index} of deck {deck_name} is not found')
+            return self._welcome_message
+        return deck.render(index, locale_of(context))
+
+
+class SpreadLocation(CardLocation):
+    """The state showing a spread of several cards, with their images in one collage."""
+
+    def show_spread(self, context: ContextTypes.DEFAULT_TYPE, deck: Deck) -> 'SpreadLocation':
+        # The history keeps the cards of one spread distinct while it is longer than the spread
+        indexes = tuple(get_card_with_history(context, deck, THREE_CARDS) for _ in SPREAD_LAYOUTS)
+        record_spread(context, [deck.cards[index].name for index in indexes])
+        cast(dict[str, Any], context.user_data)[SPREAD_KEY] = (deck.name, indexes)
+        return self
+
+    def show_next_spread(self, context: ContextTypes.DEFAULT_TYPE) -> 'SpreadLocation':
+        deck_name, _ = cast(dict[str, Any], context.user_data).get(SPREAD_KEY, (None, ()))
+        deck = self.decks.get(deck_name) or next(iter(self.decks.values()))
+        return self.show_spread(context, deck)
+
+    def _spread(self, context: ContextTypes.DEFAULT_TYPE) -> tuple[Deck, tuple[int, ...]] | None:
+        deck_name, indexes = cast(dict[str, Any], context.user_data).get(SPREAD_KEY, (None, ()))
+        deck = self.decks.get(deck_name)
+        if deck is None or not indexes or max(indexes) >= len(deck):
+            logger.warning(f'spread {indexes} of deck {deck_name} is not found')
+            return None
+        return deck, indexes
+
+    @staticmethod
+    def _collage_key(deck: Deck, indexes: tuple[int, ...]) -> str:
+        return CollageCache.key(f'{deck_key(deck.name):08x}', indexes)
+
+    def welcome_message(self, context: ContextTypes.DEFAULT_TYPE) -> Message:
+        spread = self._spread(context)
+        if spread is None:
+            return self._welcome_message
+        deck, indexes = spread
+        locale = locale_of(context)
+        text = '\n\n'.join(
+            card_texts.render(deck, index, locale, layout) for layout, index in zip(SPREAD_LAYOUTS, indexes)
+        )
+        return Message(text=text, image_path=collages.cached(self._collage_key(deck, indexes)))
+
+    async def prepare_welcome_message(self, context: ContextTypes.DEFAULT_TYPE) -> Message:
+        spread = self._spread(context)
+        if spread:
+            deck, indexes = spread
+            await collages.get(self._collage_key(deck, indexes), [deck.cards[index].image_path for index in indexes])
+        return self.welcome_message(context)
+
+    async def welcome_replies(self, context: ContextTypes.DEFAULT_TYPE) -> list[Reply]:
+        message = await self.prepare_welcome_message(context)
+        if not message.image_path:
+            return await super().welcome_replies(context)
+        image_path = message.image_path
+        return [Reply(
+            message.text, collages.photo(image_path, context.bot), reply_markup=self.keyboard(), parse_mode='HTML',
+            on_sent=lambda sent: collages.remember_file_id(image_path, context.bot, sent),
+        )]
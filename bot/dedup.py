@@ -0,0 +1,84 @@
+"""
+Idempotent handling of updates which Telegram delivers again after a restart.
+
+Every chat keeps the ids of its last handled updates in chat_data, or the user in
+user_data for updates without a chat. Telegram starts the update ids anew from a random
+value after a week without updates, so an id is looked up in the set, never compared
+with the last one. The set is stored by the persistence in the same transaction as the
+conversation state and the user data changed by the update, so after a crash either both
+are stored or neither is, and a replayed update is either skipped or handled as for the
+first time. Updates without a chat and a user are checked against a bounded set of
+recent ids of every bot, kept in memory.
+"""
+
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Hashable, cast
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+RECENT_UPDATES_KEY = 'recent_update_ids'
+# Updates of one chat Telegram can deliver again, the ones not confirmed before a crash
+CHAT_RECENT_UPDATES = 100
+
+
+class RecentUpdates:
+    """Set of the last capacity update ids."""
+
+    def __init__(self, capacity: int = 10000) -> None:
+        self._capacity = capacity
+        self._ids: OrderedDict[Hashable, None] = OrderedDict()
+
+    def __contains__(self, update_id: Hashable) -> bool:
+        return update_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, update_id: Hashable) -> None:
+        self._ids[update_id] = None
+        if len(self._ids) > self._capacity:
+            self._ids.popitem(last=False)
+
+
+recent_updates = RecentUpdates()
+
+
+def _recent_key(update: Update, context: ContextTypes.DEFAULT_TYPE) -> tuple[str, int]:
+    # Update ids are counted by every bot separately
+    return context.bot.token, update.update_id
+
+
+def _persisted_ids(context: ContextTypes.DEFAULT_TYPE) -> 'deque[int] | None':
+    data = context.chat_data if context.chat_data is not None else context.user_data
+    if data is None:
+        return None
+    data = cast(dict[str, Any], data)
+    # The mark of the last update kept before the ids were
+    data.pop('last_update_id', None)
+    return cast('deque[int]', data.setdefault(RECENT_UPDATES_KEY, deque(maxlen=CHAT_RECENT_UPDATES)))
+
+
+def is_duplicate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    if _recent_key(update, context) in recent_updates:
+        return True
+    persisted = _persisted_ids(context)
+    return persisted is not None and update.update_id in persisted
+
+
+async def skip_duplicate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stop handling of an update which was handled already, otherwise mark it as handled."""
+    if is_duplicate(update, context):
+        logger.warning(f'update {update.update_id} was already handled, skipping it')
+        raise ApplicationHandlerStop
+    recent_updates.add(_recent_key(update, context))
+    persisted = _persisted_ids(context)
+    if persisted is not None:
+        persisted.append(update.update_id)
@@ -0,0 +1,182 @@
+"""
+Static analysis of the location graph, run at startup and at build time.
+
+Walks the graph from the main menu and reports wiring mistakes which otherwise show up
+only at runtime, when a message is misrouted to a fallback:
+
+    python -m bot.graph [--format text|json|dot] [--check]
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from bot.location import FuncLocation, Location, MenuLocation
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+
+# Button texts are joined into handler regexes without escaping
+REGEX_METACHARACTERS = set('.^$*+?{}[]\\|()')
+
+
+@dataclass
+class Issue:
+    severity: str  # 'error' or 'warning'
+    location: str
+    message: str
+
+
+@dataclass
+class GraphReport:
+    states: int = 0
+    edges: list[tuple[str, str, str]] = field(default_factory=list)  # source, button, target
+    issues: list[Issue] = field(default_factory=list)
+
+    @property
+    def errors(self) -> list[Issue]:
+        return [issue for issue in self.issues if issue.severity == 'error']
+
+
+def _children(location: Location) -> list[Location]:
+    if isinstance(location, MenuLocation):
+        return location._children
+    return []
+
+
+def _edges(location: Location) -> list[tuple[str, Location]]:
+    edges = [(button, target) for button, targets in location._routes for target in targets]
+    if isinstance(location, MenuLocation) and location._fallback:
+        edges.append(('*', location._fallback))
+    if isinstance(location, FuncLocation) and location._redirect:
+        edges.append(('*', location._redirect))
+    return edges
+
+
+def _check_buttons(location: Location, report: GraphReport) -> None:
+    buttons = [button for button, _ in location._routes]
+    for index, button in enumerate(buttons):
+        if buttons.index(button) != index:
+            report.issues.append(Issue('error', location._name, f'duplicate button "{button}"'))
+            continue
+        if not _is_valid_regex(button) or re.fullmatch(button, button) is None:
+            report.issues.append(Issue(
+                'error', location._name, f'button "{button}" does not match its own regex, it can never be pressed',
+            ))
+        elif REGEX_METACHARACTERS.intersection(button):
+            report.issues.append(Issue('warning', location._name, f'button "{button}" has regex metacharacters'))
+        for other in buttons:
+            # Menu handlers check buttons by substring, so the first one contained in the text wins
+            if other != button and other in button:
+                report.issues.append(Issue(
+                    'warning', location._name, f'button "{button}" is ambiguous with button "{other}"',
+                ))
+
+
+def _is_valid_regex(pattern: str) -> bool:
+    try:
+        re.compile(pattern)
+    except re.error:
+        return False
+    return True
+
+
+def analyze(root: Location) -> GraphReport:
+    """Walk the locations reachable from root by buttons and by the children lists."""
+    report = GraphReport()
+
+    # States registered in the conversation handler, the same walk as Location.add_states
+    states: list[Location] = []
+    stack = [root]
+    while stack:
+        location = stack.pop()
+        if location in states:
+            continue
+        states.append(location)
+        stack.extend(reversed(_children(location)))
+    report.states = len(states)
+
+    reachable: set[Location] = set()
+    stack = [root]
+    while stack:
+        location = stack.pop()
+        if location in reachable:
+            continue
+        reachable.add(location)
+        for button, target in _edges(location):
+            report.edges.append((location._name, button, target._name))
+            stack.append(target)
+
+    for location in states:
+        if location not in reachable:
+            report.issues.append(Issue('error', location._name, 'state is unreachable, no button leads to it'))
+        if not location._handlers:
+            report.issues.append(Issue('error', location._name, 'state has no handlers, users get stuck in it'))
+        if isinstance(location, FuncLocation) and not location._redirect:
+            report.issues.append(Issue('error', location._name, 'redirect is not set'))
+        for error in location._wiring_errors:
+            report.issues.append(Issue('error', location._name, error))
+        _check_buttons(location, report)
+    for location in reachable:
+        if location not in states:
+            report.issues.append(Issue('error', location._name, 'button leads to a location which is not a state'))
+    return report
+
+
+def to_json(report: GraphReport) -> str:
+    data: dict[str, Any] = {
+        'states': report.states,
+        'edges': [{'source': source, 'button': button, 'target': target} for source, button, target in report.edges],
+        'issues': [asdict(issue) for issue in report.issues],
+    }
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def to_dot(report: GraphReport) -> str:
+    def quote(text: str) -> str:
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    lines = ['digraph locations {']
+    for source, button, target in report.edges:
+        lines.append(f'  {quote(source)} -> {quote(target)} [label={quote(button)}];')
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def log_report(report: GraphReport) -> None:
+    logger.info(f'location graph: {report.states} states, {len(report.edges)} edges')
+    for issue in report.issues:
+        log = logger.error if issue.severity == 'error' else logger.warning
+        log(f'location graph: {issue.location}: {issue.message}')
+
+
+def main() -> None:
+    from bot.menu import main_menu_location
+
+    parser = argparse.ArgumentParser(description='Analyze the location graph of the bot')
+    parser.add_argument('--format', choices=['text', 'json', 'dot'], default='text', help='output format')
+    parser.add_argument('--check', action='store_true', help='exit with an error code if errors are found')
+    args = parser.parse_args()
+
+    report = analyze(main_menu_location)
+    if args.format == 'json':
+        print(to_json(report))
+    elif args.format == 'dot':
+        print(to_dot(report))
+    else:
+        print(f'{report.states} states, {len(report.edges)} edges')
+        for issue in report.issues:
+            print(f'{issue.severity}: {issue.location}: {issue.message}')
+    if args.check and report.errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
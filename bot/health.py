@@ -0,0 +1,199 @@
+"""
+Event loop lag monitor and the /healthz and /readyz endpoints for the orchestrator.
+
+A task on the event loop sleeps for a short interval and measures how late it wakes up,
+which is the time every update waits behind the running callbacks. A watchdog thread
+notices when the loop has not woken up for longer than the threshold, while it is still
+stuck, and logs the stack of the loop thread with the button of the update being
+handled. The endpoints are served by a thread too, so a stuck bot still answers:
+
+    /healthz  200 while the loop keeps up, 503 when it is stalled (restart the bot)
+    /readyz   200 while the bot takes updates, Telegram answers and the decks are loaded
+
+The loop is shared by the bots of a hosting config, Telegram is pinged with the token of
+every one of them, and /readyz fails while any of the bots can not reach it.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+from bot.shutdown import TrackingUpdateProcessor, coordinator
+from bot.stats import LatencySketch
+from bot.throttle import update_text
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.1, threshold: float = 1.0, ping_interval: float = 30.0) -> None:
+        self.interval = interval
+        # Lag in seconds above which the loop counts as stalled
+        self.threshold = threshold
+        self.ping_interval = ping_interval
+        self.port: int | None = None
+        self.listen = '127.0.0.1'
+        self.lag = 0.0
+        self.lags = LatencySketch()
+        self.stalls = 0
+        # Whether Telegram answered the last ping, by bot id
+        self.telegram: dict[str, bool] = {}
+        # Button texts used as update labels, other texts are not logged
+        self.buttons: set[str] = set()
+        self._heartbeat = time.monotonic()
+        self._loop_thread = 0
+        self._processors: list[TrackingUpdateProcessor] = []
+        self._tasks: list[asyncio.Task[None]] = []
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+        self._server: ThreadingHTTPServer | None = None
+
+    def start(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        """Start measuring and serving the endpoints; must be called from the event loop thread."""
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._tasks = [asyncio.get_running_loop().create_task(self._beat())]
+        self._watchdog = threading.Thread(target=self._watch, name='oracle-loop-watchdog', daemon=True)
+        self._watchdog.start()
+        if self.port is not None:
+            self._server = ThreadingHTTPServer((self.listen, self.port), create_health_handler(self))
+            threading.Thread(target=self._server.serve_forever, name='oracle-health', daemon=True).start()
+            logger.info(f'health endpoints listen on {self.listen}:{self.port}')
+        self.watch(application)
+
+    def watch(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        """Ping Telegram with the bot of one more application of the loop, and label its updates in stalls."""
+        processor = application.update_processor
+        if isinstance(processor, TrackingUpdateProcessor):
+            self._processors.append(processor)
+        self._tasks.append(asyncio.get_running_loop().create_task(self._ping(application)))
+
+    def stop(self) -> None:
+        self._stopped.set()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._processors = []
+        self.telegram = {}
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def stalled(self) -> float:
+        """Seconds the loop is late to wake up by now, 0 while it keeps up."""
+        late = time.monotonic() - self._heartbeat - self.interval
+        return late if late > self.threshold else 0.0
+
+    @property
+    def telegram_ok(self) -> bool:
+        return bool(self.telegram) and all(self.telegram.values())
+
+    def is_healthy(self) -> bool:
+        return not self.stalled and self.lag <= self.threshold
+
+    def is_ready(self) -> bool:
+        return coordinator.ready and self.telegram_ok and all(len(deck) for deck in _decks().values())
+
+    def status(self) -> dict[str, Any]:
+        return {
+            'ready': coordinator.ready,
+            'loop_lag_ms': round(self.lag * 1000, 1),
+            'loop_lag_p99_ms': self.lags.quantile(0.99),
+            'stalled_seconds': round(self.stalled, 1),
+            'stalls': self.stalls,
+            'telegram': self.telegram_ok,
+            'bots': dict(self.telegram),
+            'decks': {name: len(deck) for name, deck in _decks().items()},
+        }
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lag = max(0.0, now - expected)
+            self.lags.add(self.lag * 1000)
+            self._heartbeat = now
+
+    async def _ping(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        # The id of a bot is the part of its token before the colon, the rest is the secret
+        bot_id = str(application.bot.token).partition(':')[0]
+        while True:
+            try:
+                await application.bot.get_me()
+                self.telegram[bot_id] = True
+            except TelegramError as e:
+                logger.warning(f'Telegram is not reachable by bot {bot_id}: {e}')
+                self.telegram[bot_id] = False
+            await asyncio.sleep(self.ping_interval)
+
+    def _watch(self) -> None:
+        reported = 0.0
+        while not self._stopped.wait(self.interval):
+            if not self.stalled:
+                reported = 0.0
+            elif reported != self._heartbeat:
+                # Once per stall, while the loop thread is still inside the slow callback
+                reported = self._heartbeat
+                self.stalls += 1
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = ''.join(traceback.format_stack(frame, limit=8)) if frame else ''
+                logger.error(f'event loop stalled for {self.stalled:.1f}s handling {self._labels()}:\n{stack}')
+
+    def _labels(self) -> list[str]:
+        labels: list[str] = []
+        # Copied, the loop thread changes them meanwhile
+        updates = [update for processor in list(self._processors) for update in list(processor.updates.values())]
+        for update in updates:
+            text = update_text(update) if isinstance(update, Update) else None
+            labels.append(text if text in self.buttons else '<text>')
+        return labels
+
+
+def _decks() -> dict[str, Any]:
+    from bot.menu import decks
+
+    return decks
+
+
+monitor = LoopMonitor()
+
+
+def create_health_handler(monitor: LoopMonitor) -> type[BaseHTTPRequestHandler]:
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == '/healthz':
+                self._reply(200 if monitor.is_healthy() else 503, monitor.status())
+            elif self.path == '/readyz':
+                self._reply(200 if monitor.is_ready() else 503, monitor.status())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def _reply(self, status: int, body: dict[str, Any]) -> None:
+            payload = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format, *args)
+
+    return HealthHandler
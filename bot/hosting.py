@@ -0,0 +1,146 @@
+"""
+Several bots in one process: one event loop, one copy of the decks and one set of connection pools.
+
+Every bot of a hosting config is an Application of its own, polling with its own token.
+They share everything which does not depend on the token: the card images and the menu,
+the connection pools of the API calls, the analytics and /stats counters, the journal,
+the collage cache and the health endpoints. Every bot keeps what must not be mixed: the
+conversation state in its own persistence file, the flood limit buckets, its admins, its
+Telegram ping in the health check, and the file_ids of its uploads, which Telegram accepts
+only from the bot which uploaded the file.
+
+All the bots serve the same decks, the menu is one graph: a config selects tokens and
+options, not content.
+"""
+
+import asyncio
+import json
+import logging
+import signal
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Sequence
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from bot.bot import build_application, post_init, post_shutdown
+from bot.health import monitor
+from bot.throttle import FloodLimit
+from bot.transport import ApiServer, RoutingRequest, TransportConfig
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+_BOT_FIELDS = {'token', 'persistence', 'admins', 'navigation', 'flood_rate', 'flood_burst'}
+
+
+@dataclass(frozen=True)
+class HostedBot:
+    token: str
+    persistence: str | None = None
+    admins: tuple[int, ...] = ()
+    navigation: str = 'reply'
+    flood_limit: FloodLimit = FloodLimit()
+
+
+def load_hosted_bots(path: str | Path) -> list[HostedBot]:
+    """
+    Read the bots of a JSON hosting config, raise ValueError if it is not valid.
+
+    {"bots": [{"token": "...", "persistence": "a.sqlite", "admins": [1], "navigation": "inline",
+               "flood_rate": 1.0, "flood_burst": 10}, ...]}
+    """
+    try:
+        entries = json.loads(Path(path).read_text(encoding='utf-8'))['bots']
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'hosting config {path} is not readable: {e!r}')
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f'hosting config {path} has no bots')
+    bots: list[HostedBot] = []
+    for number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict) or not isinstance(entry.get('token'), str):
+            raise ValueError(f'bot {number} has no token')
+        if entry.keys() - _BOT_FIELDS:
+            raise ValueError(f'bot {number} has unknown fields {sorted(entry.keys() - _BOT_FIELDS)}')
+        if entry.get('navigation', 'reply') not in ('reply', 'inline'):
+            raise ValueError(f'bot {number} has unknown navigation {entry["navigation"]!r}')
+        bots.append(HostedBot(
+            entry['token'], entry.get('persistence'), tuple(int(admin) for admin in entry.get('admins', ())),
+            entry.get('navigation', 'reply'),
+            FloodLimit(rate=float(entry.get('flood_rate', 1.0)), burst=int(entry.get('flood_burst', 10))),
+        ))
+    if len({bot.token for bot in bots}) < len(bots):
+        raise ValueError('a token is used by several bots')
+    persistence = [bot.persistence for bot in bots if bot.persistence]
+    if len(set(persistence)) < len(persistence):
+        # The conversations of all the bots have the same name and would overwrite each other
+        raise ValueError('a persistence file is used by several bots')
+    return bots
+
+
+def build_hosted_applications(
+    bots: Sequence[HostedBot], request: BaseRequest | None = None, transport: TransportConfig | None = None,
+    api_server: ApiServer | None = None, **shared: Any,
+) -> list[Application[Any, Any, Any, Any, Any, Any]]:
+    """
+    Build an application for every bot, all sending through one set of connection pools.
+
+    The shared options of build_application (analytics_path, journal_path, health_port and
+    the others) open the module-level services, so they are given to the first bot only.
+    """
+    shared_request = None if request else RoutingRequest(transport or TransportConfig())
+    applications = []
+    for number, bot in enumerate(bots):
+        applications.append(build_application(
+            bot.token, bot.persistence, request=request, admins=bot.admins, navigation=bot.navigation,
+            flood_limit=bot.flood_limit, api_server=api_server, shared_request=shared_request,
+            **(shared if number == 0 else {}),
+        ))
+    return applications
+
+
+async def host(
+    applications: Sequence[Application[Any, Any, Any, Any, Any, Any]], stop: asyncio.Event | None = None,
+) -> None:
+    """Poll for the updates of every application until the stop event or a stop signal."""
+    stop = stop or asyncio.Event()
+    try:
+        for stop_signal in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(stop_signal, stop.set)
+    except (NotImplementedError, AttributeError):
+        logger.info('signal handlers are not supported on this platform')
+
+    initialized: list[Application[Any, Any, Any, Any, Any, Any]] = []
+    try:
+        for application in applications:
+            await application.initialize()
+            initialized.append(application)
+        # The services shared by the bots are started and stopped once, the health check covers every bot
+        await post_init(applications[0])
+        for application in applications[1:]:
+            monitor.watch(application)
+        for application in applications:
+            assert application.updater
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES, bootstrap_retries=-1)
+            await application.start()
+        logger.info(f'{len(applications)} bots are running')
+        await stop.wait()
+    finally:
+        for application in initialized:
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                # Handles the updates already fetched before stopping
+                await application.stop()
+        for application in initialized:
+            await application.shutdown()
+        if initialized:
+            await post_shutdown(applications[0])
+
+
+def run_hosted(applications: Sequence[Application[Any, Any, Any, Any, Any, Any]]) -> None:
+    asyncio.run(host(applications))
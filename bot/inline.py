@@ -0,0 +1,187 @@
+"""
+Navigation by inline keyboards, which edits one message instead of sending new ones.
+
+The location graph is the same as with the reply keyboards: a button runs the transition
+recorded by the MenuLocation method which added it. Callback data holds a short key of
+the shown location and the index of the button, so old messages keep working after a
+restart. Going from card to card swaps the photo in place with edit_message_media, using
+the file_id Telegram returned for the first upload of the image.
+"""
+
+import json
+import logging
+import zlib
+from pathlib import Path
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Message as TgMessage, Update
+from telegram.error import BadRequest
+from telegram.ext import ContextTypes
+
+from bot.analytics import record_button
+from bot.location import Location, MenuLocation, Message, _locations_by_name
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+CALLBACK_PREFIX = 'nav'
+
+# Longer texts do not fit into a photo caption and are shown without the photo
+CAPTION_LIMIT = 1024
+
+# file_id of every uploaded image by the bot and its path, so each image is uploaded once per bot
+file_ids: dict[str, str] = {}
+# File the file_ids are kept in between runs
+_cache_path: Path | None = None
+
+_keyboards: dict[tuple[Location, frozenset[str]], InlineKeyboardMarkup | None] = {}
+_locations_by_key: dict[str, Location] = {}
+
+
+def location_key(location: Location) -> str:
+    # Callback data is limited to 64 bytes, location names may be longer
+    return f'{zlib.crc32(location._name.encode()):08x}'
+
+
+def find_by_key(key: str) -> Location | None:
+    """The location of a callback key, None for a stale or forged one."""
+    if not _locations_by_key:
+        # Built once: the keyboards sent before a restart point to locations of the whole graph
+        _locations_by_key.update((location_key(location), location) for location in _locations_by_name.values())
+    return _locations_by_key.get(key)
+
+
+def inline_keyboard(location: Location) -> InlineKeyboardMarkup | None:
+    """The shown buttons of the location's reply keyboard as callback buttons, built once per location."""
+    hidden = location.hidden_buttons()
+    if (location, hidden) not in _keyboards:
+        rows: list[list[InlineKeyboardButton]] = []
+        if isinstance(location, MenuLocation):
+            key = location_key(location)
+            # A location created after the map was built can be found by its buttons
+            _locations_by_key[key] = location
+            index = 0
+            for row in location._get_button_layout():
+                rows.append([])
+                for button in row:
+                    # Hidden buttons keep their index, navigate looks the buttons up in the whole layout
+                    if button.text not in hidden:
+                        callback_data = f'{CALLBACK_PREFIX}:{key}:{index}'
+                        rows[-1].append(InlineKeyboardButton(button.text, callback_data=callback_data))
+                    index += 1
+        rows = [row for row in rows if row]
+        _keyboards[location, hidden] = InlineKeyboardMarkup(rows) if rows else None
+    return _keyboards[location, hidden]
+
+
+def _has_photo(message: Message) -> bool:
+    return bool(message.image_path) and len(message.text) <= CAPTION_LIMIT
+
+
+def bot_key(bot: Bot) -> str:
+    # The id of the bot is the first part of its token, known before the bot is initialized
+    return bot.token.partition(':')[0]
+
+
+def media_key(bot: Bot, image_path: str) -> str:
+    """Key of the file_id of an image: a file_id is valid only for the bot which uploaded the file."""
+    return f'{bot_key(bot)}:{image_path}'
+
+
+def photo_of(bot: Bot, image_path: str) -> str | Path:
+    # A path is uploaded by the library, or passed as is to a Bot API server in local mode
+    return file_ids.get(media_key(bot, image_path)) or Path(image_path)
+
+
+def open_media_cache(path: str | Path) -> None:
+    """Restore the file_ids saved by the previous run, so its images are not uploaded again."""
+    global _cache_path
+    _cache_path = Path(path)
+    try:
+        file_ids.update(json.loads(_cache_path.read_text(encoding='utf-8')))
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        logger.warning(f'media cache {path} is not loaded: {e}')
+
+
+def close_media_cache() -> None:
+    if _cache_path:
+        _cache_path.write_text(json.dumps(file_ids, ensure_ascii=False), encoding='utf-8')
+        logger.info(f'{len(file_ids)} file_ids saved to {_cache_path}')
+
+
+def remember_file_id(bot: Bot, image_path: str, message: TgMessage | bool) -> None:
+    if isinstance(message, TgMessage) and message.photo:
+        file_ids[media_key(bot, image_path)] = message.photo[-1].file_id
+
+
+async def send_location(location: Location, chat_id: int, context: ContextTypes.DEFAULT_TYPE) -> TgMessage:
+    message = await location.prepare_welcome_message(context)
+    if message.image_path and _has_photo(message):
+        sent = await context.bot.send_photo(
+            chat_id, photo_of(context.bot, message.image_path), caption=message.text,
+            reply_markup=inline_keyboard(location), parse_mode='HTML',
+        )
+        remember_file_id(context.bot, message.image_path, sent)
+        return sent
+    return await context.bot.send_message(
+        chat_id, message.text, reply_markup=inline_keyboard(location), parse_mode='HTML',
+    )
+
+
+async def show_location(location: Location, shown: TgMessage, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Replace the shown message with the location, editing it in place when the kind of content allows."""
+    message = await location.prepare_welcome_message(context)
+    if message.image_path and _has_photo(message) and shown.photo:
+        edited = await shown.edit_media(
+            InputMediaPhoto(photo_of(context.bot, message.image_path), caption=message.text, parse_mode='HTML'),
+            reply_markup=inline_keyboard(location),
+        )
+        remember_file_id(context.bot, message.image_path, edited)
+    elif not _has_photo(message) and shown.text:
+        await shown.edit_text(message.text, reply_markup=inline_keyboard(location), parse_mode='HTML')
+    else:
+        # A text message can not become a photo and back, so it is replaced
+        await send_location(location, shown.chat_id, context)
+        try:
+            await shown.delete()
+        except BadRequest as e:
+            logger.info(f'failed to delete the replaced message: {e}')
+
+
+async def start_inline(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    from bot.menu import main_menu_location
+
+    if update.effective_chat:
+        await send_location(main_menu_location, update.effective_chat.id, context)
+
+
+async def navigate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if not query or not query.data:
+        return
+    _, key, index = (query.data.split(':') + ['', ''])[:3]
+    location = find_by_key(key)
+    buttons = location._get_button_names() if isinstance(location, MenuLocation) else []
+    if location is None or not index.isdigit() or int(index) >= len(buttons) \
+            or buttons[int(index)] not in location._transitions:
+        await query.answer('This menu is outdated, send /start')
+        return
+
+    button = buttons[int(index)]
+    logger.info(f'user {query.from_user} pressed {button} in {location}')
+    record_button(context, button)
+    # Stop the button spinner before the slower edit
+    await query.answer()
+    shown = location.welcome_message(context)
+    next_location = await location._transitions[button](update, context)
+    if next_location is location and next_location.welcome_message(context) == shown:
+        # Telegram refuses edits which change nothing
+        return
+    if isinstance(query.message, TgMessage):
+        await show_location(next_location, query.message, context)
+    elif update.effective_chat:
+        # The message is too old to be edited
+        await send_location(next_location, update.effective_chat.id, context)
@@ -0,0 +1,188 @@
+"""
+Journal of the readings of every user, shown page by page by the "My readings" button.
+
+Every draw is appended to a binary file as a fixed-size record: user id, timestamp, deck
+and card index. An in-memory index keeps the record numbers of every user, built by one
+pass over the file at startup, so a page is read with one positioned read per reading
+and a history of thousands of draws is never loaded at once.
+"""
+
+import logging
+import os
+import struct
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from html import escape
+from pathlib import Path
+from typing import TYPE_CHECKING, cast
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import ContextTypes
+
+from utils import prepare_logging
+
+if TYPE_CHECKING:
+    from bot.deck import Deck
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+# Prefix of the callback data of the page buttons, 'journal:<page>'
+CALLBACK_PREFIX = 'journal'
+PAGE_SIZE = 10
+
+# Kinds of readings
+SINGLE_CARD = 0
+THREE_CARDS = 1
+
+# user id, timestamp, deck key, card index, spread
+RECORD = struct.Struct('<qIIIB')
+
+
+@dataclass(frozen=True)
+class Reading:
+    user_id: int
+    timestamp: int
+    deck_key: int
+    card: int
+    spread: int = SINGLE_CARD
+
+
+def deck_key(name: str) -> int:
+    return zlib.crc32(name.encode())
+
+
+class Journal:
+    """Append-only file of readings with the record numbers of every user."""
+
+    def __init__(self) -> None:
+        self._fd: int | None = None
+        self._records = 0
+        self._index: dict[int, array[int]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._fd is not None
+
+    def open(self, path: str | Path, chunk_records: int = 4096) -> None:
+        self._fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._records = 0
+        self._index = {}
+        chunk_size = RECORD.size * chunk_records
+        while chunk := os.pread(self._fd, chunk_size, self._records * RECORD.size):
+            # A record cut by a crash during a write is dropped
+            whole = len(chunk) - len(chunk) % RECORD.size
+            for user_id, *_ in RECORD.iter_unpack(chunk[:whole]):
+                self._index.setdefault(user_id, array('I')).append(self._records)
+                self._records += 1
+            if whole < len(chunk):
+                os.ftruncate(self._fd, self._records * RECORD.size)
+                break
+        logger.info(f'journal {path} has {self._records} readings of {len(self._index)} users')
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def append(self, reading: Reading) -> None:
+        if self._fd is None:
+            return
+        os.write(self._fd, RECORD.pack(
+            reading.user_id, reading.timestamp, reading.deck_key, reading.card, reading.spread,
+        ))
+        self._index.setdefault(reading.user_id, array('I')).append(self._records)
+        self._records += 1
+
+    def count(self, user_id: int) -> int:
+        return len(self._index.get(user_id, ()))
+
+    def page(self, user_id: int, page: int, size: int = PAGE_SIZE) -> list[Reading]:
+        """Readings of the user, newest first, the page-th page of the given size."""
+        records = self._index.get(user_id)
+        if self._fd is None or not records or page < 0:
+            return []
+        end = len(records) - page * size
+        readings: list[Reading] = []
+        for number in reversed(records[max(0, end - size):max(0, end)]):
+            readings.append(Reading(*RECORD.unpack(os.pread(self._fd, RECORD.size, number * RECORD.size))))
+        return readings
+
+
+journal = Journal()
+
+
+def _pending(context: ContextTypes.DEFAULT_TYPE) -> list[tuple[str, int, int]]:
+    # The same context object is passed to every handler group of one update
+    return cast(list[tuple[str, int, int]], context.__dict__.setdefault('readings', []))
+
+
+def record_reading(context: ContextTypes.DEFAULT_TYPE, deck_name: str, card: int, spread: int = SINGLE_CARD) -> None:
+    """Remember a card drawn while handling the current update, the user is known to the update only."""
+    _pending(context).append((deck_name, card, spread))
+
+
+def flush_readings(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Write the cards drawn with the context for the user."""
+    now = int(time.time())
+    pending = _pending(context)
+    for deck_name, card, spread in pending:
+        journal.append(Reading(user_id, now, deck_key(deck_name), card, spread))
+    pending.clear()
+
+
+async def write_readings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user:
+        flush_readings(context, update.effective_user.id)
+
+
+class JournalView:
+    """Pages of the journal of a user, in one message edited by the page buttons."""
+
+    def __init__(self, decks: dict[str, 'Deck'], page_size: int = PAGE_SIZE) -> None:
+        self._decks = decks
+        self._page_size = page_size
+
+    def render(self, user_id: int, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+        if not journal.enabled:
+            return 'История раскладов не ведётся.', None
+        total = journal.count(user_id)
+        if not total:
+            return 'Вы ещё не тянули карт.', None
+        pages = (total + self._page_size - 1) // self._page_size
+        page = min(max(page, 0), pages - 1)
+        decks = {deck_key(name): deck for name, deck in self._decks.items()}
+        lines = [f'Ваши расклады, страница {page + 1} из {pages}:', '']
+        for reading in journal.page(user_id, page, self._page_size):
+            deck = decks.get(reading.deck_key)
+            name = deck.cards[reading.card].name if deck and reading.card < len(deck) else 'карта удалена'
+            when = time.strftime('%d.%m.%Y %H:%M', time.gmtime(reading.timestamp))
+            lines.append(f'{when} UTC — <b>{escape(name)}</b>')
+        buttons: list[InlineKeyboardButton] = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton('« Новее', callback_data=f'{CALLBACK_PREFIX}:{page - 1}'))
+        if page < pages - 1:
+            buttons.append(InlineKeyboardButton('Старше »', callback_data=f'{CALLBACK_PREFIX}:{page + 1}'))
+        return '\n'.join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Send the first page, the action of the menu button."""
+        if not update.effective_user or not update.effective_chat:
+            return
+        text, keyboard = self.render(update.effective_user.id, 0)
+        await context.bot.send_message(update.effective_chat.id, text, reply_markup=keyboard, parse_mode='HTML')
+
+    async def turn_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        if not query or not query.data:
+            return
+        await query.answer()
+        _, _, page = query.data.partition(':')
+        if not page.isdigit():
+            logger.warning(f'unknown journal page {query.data!r}')
+            return
+        text, keyboard = self.render(query.from_user.id, int(page))
+        await query.edit_message_text(text, reply_markup=keyboard, parse_mode='HTML')
@@ -5,10 +5,13 @@ so it might not perfectly match the current task, although it fulfills it.
 
 from typing import Sequence
 import logging
-from typing import Callable
+from html import escape
+from pathlib import Path
+from typing import Awaitable, Callable
 from dataclasses import dataclass
 
 from telegram import KeyboardButton, Message as TgMessage, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update
+from telegram._utils.types import ReplyMarkup
 from telegram.ext import MessageHandler, ContextTypes, BaseHandler, filters
 
 from utils import chunks, prepare_logging, unique
@@ -18,12 +21,106 @@ prepare_logging()
 logger = logging.getLogger()
 
 
+# Every location by name, so that persisted conversation states can be restored
+_locations_by_name: dict[str, 'Location'] = {}
+
+
+def find_location(name: str) -> 'Location':
+    return _locations_by_name[name]
+
+
+# Chooses the location a button leads to, used by the inline keyboard navigation
+Transition = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable['Location']]
+
+
+def _go_to(location: 'Location') -> Transition:
+    async def transition(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Location:
+        return location
+    return transition
+
+
 @dataclass
 class Message:
     text: str
     image_path: str | None = None
 
 
+# Telegram limits of a message text and of a photo caption
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+
+@dataclass
+class Reply:
+    """One message a handler sends in answer to an update."""
+    text: str | None = None
+    photo: Path | str | None = None  # a file or a file_id
+    reply_markup: ReplyMarkup | None = None
+    parse_mode: str | None = None
+    # Called with the sent message, e.g. to remember the file_id of the photo
+    on_sent: Callable[[TgMessage], None] | None = None
+    # Never merged with the next reply
+    separate: bool = False
+
+
+def _html(reply: Reply) -> str:
+    return reply.text or '' if reply.parse_mode == 'HTML' else escape(reply.text or '')
+
+
+def coalesce(replies: Sequence[Reply]) -> list[Reply]:
+    """
+    Merge the replies into as few messages as possible, keeping their order.
+
+    A text following a text is appended to it, a text following a photo without a caption
+    becomes its caption, as long as the limits of Telegram allow. The keyboard of the
+    merged message is the last one, as it would be after sending the replies one by one.
+    """
+    merged: list[Reply] = []
+    for reply in replies:
+        last = merged[-1] if merged else None
+        if last is None or last.separate or reply.photo is not None or reply.text is None:
+            merged.append(reply)
+            continue
+        if last.photo is None:
+            limit, separator = TEXT_LIMIT, '\n\n'
+        elif last.text is None:
+            limit, separator = CAPTION_LIMIT, ''
+        else:
+            merged.append(reply)
+            continue
+        if last.parse_mode == reply.parse_mode:
+            text, parse_mode = (last.text or '') + separator + reply.text, reply.parse_mode
+        else:
+            # A plain text is escaped to be joined with an HTML one
+            text, parse_mode = _html(last) + separator + _html(reply), 'HTML'
+        if len(text) > limit:
+            merged.append(reply)
+            continue
+        merged[-1] = Reply(
+            text, last.photo, reply.reply_markup or last.reply_markup, parse_mode, last.on_sent, reply.separate,
+        )
+    return merged
+
+
+async def send_replies(update: Update, replies: Sequence[Reply]) -> TgMessage | None:
+    """Send the replies coalesced, return the last sent message."""
+    sent: TgMessage | None = None
+    if not update.message:
+        return None
+    for reply in coalesce(replies):
+        if reply.photo is not None:
+            sent = await update.message.reply_photo(
+                photo=reply.photo, caption=reply.text, reply_markup=reply.reply_markup, parse_mode=reply.parse_mode,
+            )
+        else:
+            sent = await update.message.reply_text(
+                reply.text or '', reply_markup=reply.reply_markup, parse_mode=reply.parse_mode,
+            )
+        if reply.on_sent:
+            reply.on_sent(sent)
+    return sent
+
+
 class Location:
     def __init__(
             self, name: str, handlers: list[MessageHandler[ContextTypes.DEFAULT_TYPE, object]],
@@ -37,39 +134,70 @@ class Location:
         self._keyboard = keyboard
         self._is_implemented = is_implemented
         self._send_photo_separately = send_photo_separately
+        # Button texts and the locations they lead to, for the graph analysis
+        self._routes: list[tuple[str, list[Location]]] = []
+        # Mistakes made while wiring the location, for the graph analysis
+        self._wiring_errors: list[str] = []
+        # Button texts and the transitions they trigger, the same as the message handlers do
+        self._transitions: dict[str, Transition] = {}
+        # Buttons shown only while their condition holds, by text
+        self._button_conditions: dict[str, Callable[[], bool]] = {}
+        if name in _locations_by_name:
+            raise ValueError(f'location "{name}" already exists, persisted states could be restored into either')
+        _locations_by_name[name] = self
 
     def __str__(self) -> str:
         return f'Location "{self._name}"'
 
+    def __reduce__(self) -> tuple[Callable[[str], 'Location'], tuple[str]]:
+        # Locations hold handler closures, so they are pickled as a reference by name
+        return find_location, (self._name,)
+
+    def show_button_if(self, button_text: str, condition: Callable[[], bool]) -> None:
+        """Show the button only while the condition holds, e.g. while the feature behind it is enabled."""
+        self._button_conditions[button_text] = condition
+
+    def hidden_buttons(self) -> frozenset[str]:
+        return frozenset(text for text, condition in self._button_conditions.items() if not condition())
+
+    def keyboard(self) -> ReplyKeyboardMarkup | ReplyKeyboardRemove:
+        """The keyboard shown to the users, without the hidden buttons."""
+        hidden = self.hidden_buttons()
+        if not hidden or not isinstance(self._keyboard, ReplyKeyboardMarkup):
+            return self._keyboard
+        rows = [[button for button in row if button.text not in hidden] for row in self._keyboard.keyboard]
+        return ReplyKeyboardMarkup([row for row in rows if row])
+
+    def welcome_message(self, context: ContextTypes.DEFAULT_TYPE) -> Message:
+        """The message shown on entering the location, the same for every user by default."""
+        return self._welcome_message
+
+    async def prepare_welcome_message(self, context: ContextTypes.DEFAULT_TYPE) -> Message:
+        """The welcome message after the slow work it needs, such as rendering its image, is done."""
+        return self.welcome_message(context)
+
+    async def welcome_replies(self, context: ContextTypes.DEFAULT_TYPE) -> list['Reply']:
+        """The messages showing the location, for send_replies."""
+        welcome_message = await self.prepare_welcome_message(context)
+        # If image_path is provided
+        if welcome_message.image_path:
+            if self._send_photo_separately:
+                # Send text and photo as two separate messages
+                return [
+                    Reply(photo=Path(welcome_message.image_path), separate=True),
+                    Reply(welcome_message.text, reply_markup=self.keyboard(), parse_mode='HTML'),
+                ]
+            # Send photo with text as caption (default behavior)
+            return [Reply(
+                welcome_message.text, photo=Path(welcome_message.image_path),
+                reply_markup=self.keyboard(), parse_mode='HTML',
+            )]
+        # Otherwise send regular text message
+        return [Reply(welcome_message.text, reply_markup=self.keyboard(), parse_mode='HTML')]
+
     async def send_welcome_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> TgMessage | None:
         if update.message:
-            # If image_path is provided
-            if self._welcome_message.image_path:
-                if self._send_photo_separately:
-                    # Send text and photo as two separate messages
-                    await update.message.reply_photo(
-                        photo=open(self._welcome_message.image_path, 'rb')
-                    )
-                    return await update.message.reply_text(
-                        self._welcome_message.text,
-                        reply_markup=self._keyboard,
-                        parse_mode='HTML'
-                    )
-                else:
-                    # Send photo with text as caption (default behavior)
-                    return await update.message.reply_photo(
-                        photo=open(self._welcome_message.image_path, 'rb'),
-                        caption=self._welcome_message.text,
-                        reply_markup=self._keyboard,
-                        parse_mode='HTML'
-                    )
-            else:
-                # Otherwise send regular text message
-                return await update.message.reply_text(
-                    self._welcome_message.text,
-                    reply_markup=self._keyboard,
-                    parse_mode='HTML'
-                )
+            return await send_replies(update, await self.welcome_replies(context))
         return None
 
     def add_states(self, states: dict[object, list[BaseHandler[Update, ContextTypes.DEFAULT_TYPE, object]]]) -> None:
@@ -83,6 +211,8 @@ class MenuLocation(Location):
         send_photo_separately: bool = False,
     ) -> None:
         super().__init__(name, [], welcome_message, is_implemented=False, send_photo_separately=send_photo_separately)
+        self._children: list[Location] = []
+        self._fallback: Location | None = None
 
     def __str__(self) -> str:
         return super().__str__()
@@ -118,6 +248,8 @@ class MenuLocation(Location):
 
         buttons_regex = '|'.join([f'^{button}$' for button in children_buttons])
         self._handlers = [MessageHandler(filters.Regex(buttons_regex), menu_handler)]
+        self._routes = [(name, [child]) for child, name in zip(children, children_buttons)]
+        self._transitions = {name: _go_to(child) for child, name in zip(children, children_buttons)}
 
         logger.info(f"menu {self} has children buttons: {children_buttons}")
         buttons_layout = list(chunks(children_buttons, 3))
@@ -126,6 +258,7 @@ class MenuLocation(Location):
     def add_back_buttons(self, back_menus: list[Location], pre_text: str = 'Back to ') -> None:
         if not self._handlers:
             logger.error('back buttons added before children buttons')
+            self._wiring_errors.append('back buttons added before children buttons')
             return
 
         back_buttons = [f'{pre_text}{menu._name}' for menu in unique(back_menus)]
@@ -148,6 +281,8 @@ class MenuLocation(Location):
         current_buttons = self._get_button_names()
         buttons_regex = '|'.join([f'^{button}$' for button in (current_buttons + back_buttons)])
         self._handlers = [MessageHandler(filters.Regex(buttons_regex), new_handler)]
+        self._routes += [(name, [back_menu]) for back_menu, name in zip(back_menus, back_buttons)]
+        self._transitions.update({name: _go_to(back_menu) for back_menu, name in zip(back_menus, back_buttons)})
 
         layout = self._get_button_layout()
         layout.append([KeyboardButton(name) for name in back_buttons])
@@ -172,6 +307,12 @@ class MenuLocation(Location):
 
         buttons_regex = f'^{button_text}$'
         self._handlers = [MessageHandler(filters.Regex(buttons_regex), menu_handler)]
+        self._routes = [(button_text, list(children))]
+
+        async def transition(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Location:
+            return func()
+
+        self._transitions = {button_text: transition}
 
         logger.info(f"menu {self} has func buttons: {buttons_regex}")
         buttons_layout = list(chunks([button_text], 3))
@@ -184,15 +325,25 @@ class MenuLocation(Location):
         children: Sequence[Location]
     ) -> None:
         """Like add_func_button, but passes context to the function for per-user state access."""
+        self.add_func_buttons_with_context([(button_text, func)], children)
+
+    def add_func_buttons_with_context(
+        self,
+        buttons: Sequence[tuple[str, Callable[[ContextTypes.DEFAULT_TYPE], Location]]],
+        children: Sequence[Location]
+    ) -> None:
+        """Several buttons, each choosing the next location among children with its own function."""
         self._children = list(children)
         self._is_implemented = any([child._is_implemented for child in children])
         if not self._is_implemented:
             logger.info(f'{self} is not implemented')
+        funcs = dict(buttons)
 
         async def menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> object:
             if update.message and update.message.text:
-                if update.message.text == button_text:
-                    logger.info(f'user {update.message.from_user} entered the {button_text}')
+                func = funcs.get(update.message.text)
+                if func:
+                    logger.info(f'user {update.message.from_user} entered the {update.message.text}')
                     next_location = func(context)
                     await next_location.send_welcome_message(update, context)
                     return next_location
@@ -200,14 +351,34 @@ class MenuLocation(Location):
                 logger.error('failed to check button name for func button')
             return None
 
-        buttons_regex = f'^{button_text}$'
+        buttons_regex = '|'.join([f'^{button_text}$' for button_text in funcs])
         self._handlers = [MessageHandler(filters.Regex(buttons_regex), menu_handler)]
+        self._routes = [(button_text, self._children) for button_text in funcs]
+
+        def transition(func: Callable[[ContextTypes.DEFAULT_TYPE], Location]) -> Transition:
+            async def transition_with_context(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Location:
+                return func(context)
+            return transition_with_context
+
+        self._transitions = {button_text: transition(func) for button_text, func in funcs.items()}
 
         logger.info(f"menu {self} has func buttons: {buttons_regex}")
-        buttons_layout = list(chunks([button_text], 3))
+        buttons_layout = list(chunks(list(funcs), 3))
         self._keyboard = ReplyKeyboardMarkup(buttons_layout)
 
     def add_info_button(self, button_text: str, info_text: str) -> None:
+        async def send_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            if update.effective_chat:
+                await context.bot.send_message(chat_id=update.effective_chat.id, text=info_text)
+            else:
+                logger.error('failed to send info message')
+
+        self.add_action_button(button_text, send_info)
+
+    def add_action_button(
+        self, button_text: str, action: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]],
+    ) -> None:
+        """A button which runs the action, which sends its own messages, and stays in this location."""
         self._is_implemented = True
 
         current_handler = self._handlers[-1].callback
@@ -220,10 +391,7 @@ class MenuLocation(Location):
             if update.message and update.message.text:
                 if update.message.text == button_text:
                     logger.info(f'user {update.message.from_user} entered the {button_text}')
-                    if update.effective_chat:
-                        await context.bot.send_message(chat_id=update.effective_chat.id, text=info_text)
-                    else:
-                        logger.error('failed to send info message')
+                    await action(update, context)
                     return self
             else:
                 logger.error('failed to check button name for func button')
@@ -232,12 +400,19 @@ class MenuLocation(Location):
         current_buttons = self._get_button_names()
         buttons_regex = '|'.join([f'^{button}$' for button in (current_buttons + [button_text])])
         self._handlers = [MessageHandler(filters.Regex(buttons_regex), new_handler)]
+        self._routes.append((button_text, [self]))
+
+        async def run_action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Location:
+            await action(update, context)
+            return self
+
+        self._transitions[button_text] = run_action
 
         layout = self._get_button_layout()
         layout.append([KeyboardButton(button_text)])
         self._keyboard = ReplyKeyboardMarkup(layout)
 
-        logger.info(f"menu {self} has info buttons: {buttons_regex}")
+        logger.info(f"menu {self} has action buttons: {buttons_regex}")
 
     def _get_button_names(self) -> list[str]:
         names: list[str] = []
@@ -257,7 +432,9 @@ class MenuLocation(Location):
     def add_fallback(self, fallback_location: Location | None = None) -> None:
         if not self._handlers:
             logger.error('fallback added before another buttons')
+            self._wiring_errors.append('fallback added before another buttons')
             return
+        self._fallback = fallback_location or self
 
         current_handler = self._handlers[-1].callback
 
@@ -265,10 +442,11 @@ class MenuLocation(Location):
             new_location = await current_handler(update, context)
             if new_location:
                 return new_location
-            if update.message:
-                await update.message.reply_text('Something went wrong. Try again.')
             new_location = fallback_location or self
-            await new_location.send_welcome_message(update, context)
+            # The error and the welcome message usually go out as one message
+            await send_replies(
+                update, [Reply('Something went wrong. Try again.'), *await new_location.welcome_replies(context)],
+            )
             return new_location
 
         self._handlers = [MessageHandler(filters.ALL, new_handler)]
@@ -304,16 +482,18 @@ class FuncLocation(Location):
             logger.error(f'redirect is not set for {self}')
 
         async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> object:
+            replies: list[Reply] = []
             if update.message:
                 try:
-                    await update.message.reply_text(
+                    replies.append(Reply(
                         self._text_func(update.message.text or "") if self._text_func else "Undefined handler",
-                    )
+                    ))
                 except Exception as e:
                     logger.error(f'error in {self} handler: {e}')
-                    await update.message.reply_text(self._error_message.text)
+                    replies.append(Reply(self._error_message.text))
             if self._redirect:
-                await self._redirect.send_welcome_message(update, context)
+                replies += await self._redirect.welcome_replies(context)
+            await send_replies(update, replies)
             return self._redirect
 
         self._handlers = [MessageHandler(filters.ALL, handler)]
@@ -1,83 +1,66 @@
-from typing import Any
-from typing import cast
-from collections import deque
+from typing import Callable
 from typing import TYPE_CHECKING
 
-from cards.card import Card
-from cards.cards_reader import CardsReader
-import random
-from bot.location import MenuLocation, Message
+from bot.deck import CardLocation, Deck, SpreadLocation
+from bot.journal import JournalView, journal
+from bot.reminders import reminders
+from bot.location import Location, MenuLocation, Message
 
 if TYPE_CHECKING:
     from telegram.ext import ContextTypes
 
-# How many draws before a card can repeat for the same user
-CARD_HISTORY_SIZE = 5
-
 main_menu_location = MenuLocation(
     name='Главное меню',
     welcome_message=Message('Это оракул. Тяни карту и получи предсказание.')
 )
 
 
-def create_card_locations(cards: list[Card]) -> list[MenuLocation]:
-    locations: list[MenuLocation] = []
-    for card in cards:
-        # Create message with card text and image path
-        # Wrap meaning in spoiler tag so user can reveal it when ready
-        card_text = '<b>' + card.name + '</b>' + \
-            '\n\n' + card.description + \
-            '\n\n' + 'Толкование:\n<span class="tg-spoiler">' + \
-            card.meaning + '</span>'
-        welcome_message = Message(text=card_text, image_path=card.image_path)
-
-        location = MenuLocation(
-            name=card.name,
-            welcome_message=welcome_message,
-            send_photo_separately=True  # Send text and photo separately to avoid cropping
-        )
-        locations.append(location)
-    return locations
-
-
-def get_card_with_history(context: 'ContextTypes.DEFAULT_TYPE', all_cards: list[MenuLocation]) -> MenuLocation:
-    """Select a card that hasn't been drawn in the last CARD_HISTORY_SIZE draws for this user."""
-    # Get or create history deque for this user
-    user_data = cast(dict[str, Any], context.user_data)
-    if 'card_history' not in user_data:
-        user_data['card_history'] = deque(maxlen=CARD_HISTORY_SIZE)
-    history: deque[str] = user_data['card_history']
+decks = {
+    deck.name: deck for deck in [
+        Deck.from_csv(
+            'Славянский оракул', 'cards/card_descriptions.csv', 'cards/images',
+            button='Взять карту', spread_button='Расклад на три карты',
+        ),
+    ]
+}
+card_view_location = CardLocation('Карта', decks)
+card_view_location.add_func_button_with_context(
+    'Взять ещё одну карту',
+    card_view_location.show_next_card,
+    [card_view_location]
+)
+card_view_location.add_back_buttons([main_menu_location], pre_text='Вернуться в ')
 
-    # Get cards not in recent history
-    available = [c for c in all_cards if c._name not in history]
-    if not available:
-        # Fallback if all cards are in history (shouldn't happen with enough cards)
-        available = all_cards
+spread_location = SpreadLocation('Расклад', decks)
+spread_location.add_func_button_with_context(
+    'Сделать ещё один расклад',
+    spread_location.show_next_spread,
+    [spread_location]
+)
+spread_location.add_back_buttons([main_menu_location], pre_text='Вернуться в ')
 
-    card = random.choice(available)
-    history.append(card._name)
-    return card
 
+def _show_card_of(deck: Deck) -> Callable[['ContextTypes.DEFAULT_TYPE'], Location]:
+    return lambda context: card_view_location.show_card(context, deck)
 
-def add_buttons_to_card_locations(locations: list[MenuLocation]) -> None:
-    for location in locations:
-        location.add_func_button_with_context(
-            'Взять ещё одну карту',
-            lambda ctx: get_card_with_history(ctx, locations),
-            locations
-        )
-        location.add_back_buttons([main_menu_location], pre_text='Вернуться в ')
 
+def _show_spread_of(deck: Deck) -> Callable[['ContextTypes.DEFAULT_TYPE'], Location]:
+    return lambda context: spread_location.show_spread(context, deck)
 
-cards = CardsReader('cards/card_descriptions.csv', 'cards/images').read_cards()
-card_locations = create_card_locations(cards)
-add_buttons_to_card_locations(card_locations)
 
-main_menu_location.add_func_button_with_context(
-    'Взять карту',
-    lambda ctx: get_card_with_history(ctx, card_locations),
-    card_locations
+main_menu_location.add_func_buttons_with_context(
+    [(deck.button, _show_card_of(deck)) for deck in decks.values()]
+    + [(deck.spread_button, _show_spread_of(deck)) for deck in decks.values() if deck.spread_button],
+    [card_view_location, spread_location]
 )
+journal_view = JournalView(decks)
+main_menu_location.add_action_button('Мои расклады', journal_view.show)
+# The readings are written only with --journal
+main_menu_location.show_button_if('Мои расклады', lambda: journal.enabled)
+reminders.decks = decks
+main_menu_location.add_action_button('Напоминания', reminders.toggle)
+# The subscriptions are kept only with --reminders
+main_menu_location.show_button_if('Напоминания', lambda: reminders.enabled)
 main_menu_location.add_info_button('О нас', """Всем привет! Мы команда из четырех иллюстраторов🍄
 
 Kinoko House Illustrators — дом, где рождаются рисунки, идеи и новые проекты. \
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any
+
+from telegram._utils.defaultvalue import DEFAULT_NONE
+from telegram._utils.types import ODVInput
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+
+from bot.bot import build_application
+
+
+class OfflineRequest(BaseRequest):
+    """
+    Answers Bot API calls locally instead of sending them to Telegram.
+
+    Used to run the real conversation against a mocked bot in benchmarks and replays.
+    Counts the calls and the bytes the bot would have uploaded.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Counter[str] = Counter()
+        self.sent_bytes = 0
+        self._message_id = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+    ) -> tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        parameters: dict[str, Any] = {}
+        if request_data:
+            parameters = request_data.parameters
+            self.sent_bytes += len(request_data.json_payload)
+            for field in request_data.multipart_data.values():
+                content = field[1]
+                self.sent_bytes += len(content) if isinstance(content, bytes) else 0
+        if endpoint == 'getUpdates':
+            # A long poll which never gets an update
+            await asyncio.sleep(float(parameters.get('timeout', 0)))
+        payload = {'ok': True, 'result': self._result(endpoint, parameters)}
+        return 200, json.dumps(payload).encode()
+
+    def _result(self, endpoint: str, parameters: dict[str, Any]) -> object:
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Offline', 'username': 'offline_bot'}
+        if endpoint.startswith('send') or endpoint.startswith('edit'):
+            self._message_id += 1
+            message: dict[str, Any] = {
+                'message_id': parameters.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': int(parameters.get('chat_id', 0)), 'type': 'private'},
+            }
+            if 'text' in parameters:
+                message['text'] = parameters['text']
+            if 'caption' in parameters:
+                message['caption'] = parameters['caption']
+            if endpoint in ('sendPhoto', 'editMessageMedia'):
+                file_id = f'offline-photo-{self._message_id}'
+                message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1, 'height': 1}]
+            return message
+        if endpoint == 'getUpdates':
+            return []
+        return True
+
+
+def create_offline_application() -> Application[Any, Any, Any, Any, Any, Any]:
+    """Build the bot application talking to an OfflineRequest instead of Telegram."""
+    return build_application('0:offline', request=OfflineRequest())
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
+
+from telegram.ext import BasePersistence, PersistenceInput
+from telegram.ext._utils.types import CDCData, ConversationDict, ConversationKey
+
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+Data = dict[Any, Any]
+
+
+class SqlitePersistence(BasePersistence[Data, Data, Data]):
+    """
+    Persistence stored in one SQLite database, shared by every process of the bot.
+
+    Each process writes only the keys it has changed, so several workers serving
+    different chats can use the same file at the same time. All writes issued by one
+    persistence update (user data, chat data and conversation states of the handled
+    updates) are committed in a single transaction, so they are never stored partially.
+    """
+
+    def __init__(self, db_path: str | Path, update_interval: float = 60) -> None:
+        # bot_data is not stored: every worker would overwrite it with its own copy
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False), update_interval=update_interval,
+        )
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._pending: list[tuple[str, tuple[Any, ...]]] = []
+        self._committing: asyncio.Task[None] | None = None
+        self._commit_lock: asyncio.Lock | None = None
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS bot_data (id INTEGER PRIMARY KEY CHECK (id = 0), data BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS conversations (
+                name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL, PRIMARY KEY (name, key)
+            );
+        ''')
+        self._connection.commit()
+
+    def _execute(self, statements: list[tuple[str, tuple[Any, ...]]]) -> None:
+        with self._lock, self._connection:
+            for sql, parameters in statements:
+                self._connection.execute(sql, parameters)
+
+    async def _write(self, *statements: tuple[str, tuple[Any, ...]]) -> None:
+        self._pending.extend(statements)
+        if not self._committing:
+            self._committing = asyncio.create_task(self._commit_pending())
+        await self._committing
+
+    async def _commit_pending(self) -> None:
+        # Let the other writes started together with this one join the transaction
+        await asyncio.sleep(0)
+        statements, self._pending = self._pending, []
+        self._committing = None
+        if not self._commit_lock:
+            self._commit_lock = asyncio.Lock()
+        async with self._commit_lock:
+            await asyncio.to_thread(self._execute, statements)
+
+    def _select(self, sql: str, parameters: tuple[Any, ...] = ()) -> list[Any]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    async def get_user_data(self) -> dict[int, Data]:
+        return {row[0]: pickle.loads(row[1]) for row in self._select('SELECT id, data FROM user_data')}
+
+    async def get_chat_data(self) -> dict[int, Data]:
+        return {row[0]: pickle.loads(row[1]) for row in self._select('SELECT id, data FROM chat_data')}
+
+    async def get_bot_data(self) -> Data:
+        rows = self._select('SELECT data FROM bot_data WHERE id = 0')
+        return pickle.loads(rows[0][0]) if rows else {}
+
+    async def get_callback_data(self) -> CDCData | None:
+        return None
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        rows = self._select('SELECT key, state FROM conversations WHERE name = ?', (name,))
+        conversations: ConversationDict = {}
+        for key, state in rows:
+            try:
+                conversations[tuple(json.loads(key))] = pickle.loads(state)
+            except KeyError as e:
+                # The location was renamed or removed since the state was stored
+                logger.warning(f'dropping stored state {key} of conversation {name}: unknown location {e}')
+        return conversations
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: object | None) -> None:
+        if new_state is None:
+            await self._write(('DELETE FROM conversations WHERE name = ? AND key = ?', (name, json.dumps(key))))
+        else:
+            await self._write((
+                'INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                (name, json.dumps(key), pickle.dumps(new_state)),
+            ))
+
+    async def update_user_data(self, user_id: int, data: Data) -> None:
+        await self._write(('INSERT OR REPLACE INTO user_data (id, data) VALUES (?, ?)', (user_id, pickle.dumps(data))))
+
+    async def update_chat_data(self, chat_id: int, data: Data) -> None:
+        await self._write(('INSERT OR REPLACE INTO chat_data (id, data) VALUES (?, ?)', (chat_id, pickle.dumps(data))))
+
+    async def update_bot_data(self, data: Data) -> None:
+        await self._write(('INSERT OR REPLACE INTO bot_data (id, data) VALUES (0, ?)', (pickle.dumps(data),)))
+
+    async def update_callback_data(self, data: CDCData) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        await self._write(('DELETE FROM chat_data WHERE id = ?', (chat_id,)))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._write(('DELETE FROM user_data WHERE id = ?', (user_id,)))
+
+    async def refresh_user_data(self, user_id: int, user_data: Data) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        with self._lock:
+            self._connection.close()
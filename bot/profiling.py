@@ -0,0 +1,176 @@
+"""
+Live profiling of the handlers, cheap enough to stay available in production.
+
+An admin command (/profile) or SIGUSR1 starts a session for some seconds. In the CPU mode
+a background thread samples the stack of the event loop thread while a sampled update
+is handled and aggregates the samples per location as folded stacks, which flamegraph.pl
+and speedscope read directly. In the memory mode tracemalloc snapshots taken at the start
+and the end of the session are compared, to find what grows, for example user_data.
+When no session runs, the handlers only check a flag.
+"""
+
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+
+class Profiler:
+    def __init__(self, output_dir: str | Path = 'profiles', interval: float = 0.005) -> None:
+        self.output_dir = Path(output_dir)
+        self._interval = interval
+        self._fraction = 1.0
+        self._mode: str | None = None
+        self._label: str | None = None
+        self._loop_thread = 0
+        self._stacks: dict[str, Counter[str]] = {}
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._stopped = threading.Event()
+        self._sampler: threading.Thread | None = None
+        # Button texts used as location labels, other texts are not stored
+        self.buttons: set[str] = set()
+
+    @property
+    def active(self) -> bool:
+        return self._mode is not None
+
+    def start(self, mode: str, seconds: float, fraction: float = 1.0) -> None:
+        """Start a 'cpu' or 'memory' session; must be called from the event loop thread."""
+        if self.active:
+            raise RuntimeError(f'a {self._mode} profiling session is already running')
+        self._mode = mode
+        self._fraction = fraction
+        self._stopped.clear()
+        if mode == 'cpu':
+            self._stacks = {}
+            self._loop_thread = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, name='oracle-profiler', daemon=True)
+            self._sampler.start()
+        elif mode == 'memory':
+            tracemalloc.start(10)
+            self._snapshot = tracemalloc.take_snapshot()
+        else:
+            self._mode = None
+            raise ValueError(f'unknown profiling mode: {mode}')
+        logger.info(f'{mode} profiling started for {seconds} seconds')
+
+    def stop(self) -> list[Path]:
+        """Finish the session and write its results, return the written files."""
+        mode, self._mode = self._mode, None
+        self._label = None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        files: list[Path] = []
+        if mode == 'cpu':
+            self._stopped.set()
+            if self._sampler:
+                self._sampler.join()
+            for label, stacks in self._stacks.items():
+                path = self.output_dir / f'cpu-{stamp}-{_safe_name(label)}.folded'
+                path.write_text(''.join(f'{stack} {count}\n' for stack, count in stacks.items()), encoding='utf-8')
+                files.append(path)
+        elif mode == 'memory' and self._snapshot:
+            differences = tracemalloc.take_snapshot().compare_to(self._snapshot, 'traceback')
+            tracemalloc.stop()
+            self._snapshot = None
+            path = self.output_dir / f'memory-{stamp}.txt'
+            with open(path, 'w', encoding='utf-8') as output:
+                for difference in differences[:50]:
+                    output.write(f'{difference}\n')
+                    output.writelines(f'    {line}\n' for line in difference.traceback.format())
+            files.append(path)
+        logger.info(f'{mode} profiling finished, results: {[str(file) for file in files]}')
+        return files
+
+    def begin_update(self, text: str) -> None:
+        if self._mode == 'cpu' and random.random() < self._fraction:
+            self._label = text if text in self.buttons else '<text>'
+
+    def finish_update(self) -> None:
+        self._label = None
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self._interval):
+            label = self._label
+            if label is None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._stacks.setdefault(label, Counter())[_fold(frame)] += 1
+
+
+def _fold(frame: FrameType | None) -> str:
+    names: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _safe_name(label: str) -> str:
+    return ''.join(char if char.isalnum() else '_' for char in label)
+
+
+profiler = Profiler()
+
+
+async def begin_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if profiler.active:
+        text = update.message.text if update.message and update.message.text else ''
+        profiler.begin_update(text)
+
+
+async def finish_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if profiler.active:
+        profiler.finish_update()
+
+
+async def _finish_session(update: Update, seconds: float) -> None:
+    await asyncio.sleep(seconds)
+    # Comparing memory snapshots takes a while, keep it off the event loop
+    files = await asyncio.to_thread(profiler.stop)
+    if update.message:
+        await update.message.reply_text('Profiling finished:\n' + '\n'.join(str(file) for file in files))
+
+
+async def start_profiling(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/profile [cpu|memory] [seconds] [fraction of updates]"""
+    if not update.message:
+        return
+    args = list(context.args or [])
+    mode = args.pop(0) if args and args[0] in ('cpu', 'memory') else 'cpu'
+    try:
+        seconds = float(args[0]) if args else 30.0
+        fraction = float(args[1]) if len(args) > 1 else 1.0
+        profiler.start(mode, seconds, fraction)
+    except (ValueError, RuntimeError) as e:
+        await update.message.reply_text(f'Profiling not started: {e}')
+        return
+    await update.message.reply_text(f'{mode} profiling started for {seconds:g} seconds')
+    context.application.create_task(_finish_session(update, seconds), update=update)
+
+
+def profile_on_signal(seconds: float = 30.0) -> None:
+    """SIGUSR1 handler, called by the event loop: runs a CPU session for all updates."""
+    try:
+        profiler.start('cpu', seconds)
+    except RuntimeError as e:
+        logger.error(f'profiling not started: {e}')
+        return
+    asyncio.get_running_loop().call_later(seconds, profiler.stop)
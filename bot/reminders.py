@@ -0,0 +1,260 @@
+"""
+Daily reminders to draw a card, for any number of subscribed users.
+
+Reminders are not jobs: every subscription is a row in SQLite with the time of its next
+reminder, rounded to a minute bucket, and an index on that time. Subscribers are spread
+over the minutes of the evening hour by user id, so every bucket sends a part of them. The
+scheduler wakes once per bucket, takes the due rows in batches and sends each user a card drawn with
+get_card_with_history, no faster than the rate limit, then moves the rows to the next
+day. Nothing is loaded or re-created at startup, reminders missed while the bot was down
+are sent if they are late by less than the grace period and skipped otherwise.
+
+The scheduler runs in the single process mode only, workers of the sharded mode would
+send every reminder several times.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from telegram import Message as TgMessage, Update
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from telegram.ext import Application, ContextTypes
+
+from bot.deck import Deck, get_card_with_history
+from bot.inline import photo_of, remember_file_id
+from bot.journal import flush_readings
+from bot.rendering import locale_of
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+DAY = 24 * 60 * 60
+
+# 20:00 in Moscow, the first minute of the hour the reminders are spread over so every bucket sends a part of them
+EVENING_MINUTE = 17 * 60
+SPREAD_MINUTES = 60
+MOSCOW_OFFSET_MINUTES = 3 * 60
+
+REMINDER_TEXT = 'Ваша вечерняя карта'
+
+
+@dataclass
+class Reminder:
+    user_id: int
+    chat_id: int
+    minute: int  # minute of the day, UTC
+    next_at: int  # timestamp of the next reminder
+    deck: str
+
+
+def reminder_minute(user_id: int) -> int:
+    """The minute of the day, UTC, the user is reminded at: the same every day, spread over the evening hour."""
+    return EVENING_MINUTE + user_id % SPREAD_MINUTES
+
+
+def moscow_time(minute: int) -> str:
+    minute = (minute + MOSCOW_OFFSET_MINUTES) % (DAY // 60)
+    return f'{minute // 60}:{minute % 60:02d}'
+
+
+def next_time(minute: int, after: float) -> int:
+    """The first timestamp after the given one at the minute of a day."""
+    at = int(after) - int(after) % DAY + minute * 60
+    return at if at > after else at + DAY
+
+
+class ReminderStore:
+    """Subscriptions in SQLite, indexed by the time of the next reminder."""
+
+    def __init__(self, db_path: str | Path) -> None:
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS reminders (
+                user_id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, minute INTEGER NOT NULL,
+                next_at INTEGER NOT NULL, deck TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS reminders_next_at ON reminders (next_at);
+        ''')
+        self._connection.commit()
+
+    def subscribe(self, reminder: Reminder) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?)',
+                (reminder.user_id, reminder.chat_id, reminder.minute, reminder.next_at, reminder.deck),
+            )
+
+    def unsubscribe(self, user_id: int) -> bool:
+        with self._lock, self._connection:
+            return self._connection.execute('DELETE FROM reminders WHERE user_id = ?', (user_id,)).rowcount > 0
+
+    def due(self, now: float, limit: int) -> list[Reminder]:
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT user_id, chat_id, minute, next_at, deck FROM reminders WHERE next_at <= ? '
+                'ORDER BY next_at LIMIT ?', (now, limit),
+            ).fetchall()
+        return [Reminder(*row) for row in rows]
+
+    def reschedule(self, reminders: list[Reminder]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'UPDATE reminders SET next_at = ? WHERE user_id = ?',
+                [(reminder.next_at, reminder.user_id) for reminder in reminders],
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._connection.execute('SELECT COUNT(*) FROM reminders').fetchone()[0])
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class ReminderScheduler:
+    def __init__(
+        self, rate: float = 10.0, batch_size: int = 100, bucket_seconds: int = 60, grace_seconds: int = 3600,
+    ) -> None:
+        # Reminders sent per second; each is two messages, Telegram allows about 30 per second to different chats
+        self.rate = rate
+        self.batch_size = batch_size
+        self.bucket_seconds = bucket_seconds
+        self.grace_seconds = grace_seconds
+        self.decks: dict[str, Deck] = {}
+        self.sent = 0
+        self._store: ReminderStore | None = None
+        self._runner: asyncio.Task[None] | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None
+
+    def open(self, db_path: str | Path) -> None:
+        self._store = ReminderStore(db_path)
+        logger.info(f'{self._store.count()} users are subscribed to reminders in {db_path}')
+
+    def close(self) -> None:
+        if self._store:
+            self._store.close()
+            self._store = None
+
+    def start(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        if self._store and not self._runner:
+            self._runner = asyncio.create_task(self._run(application))
+
+    async def stop(self) -> None:
+        if self._runner:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def toggle(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Subscribe the user to the daily reminder, or unsubscribe; the action of the menu button."""
+        if not update.effective_user or not update.effective_chat:
+            return
+        if not self._store or not self.decks:
+            text = 'Напоминания сейчас не работают.'
+        elif await asyncio.to_thread(self._store.unsubscribe, update.effective_user.id):
+            text = 'Напоминания выключены.'
+        else:
+            minute = reminder_minute(update.effective_user.id)
+            reminder = Reminder(
+                update.effective_user.id, update.effective_chat.id, minute, next_time(minute, time.time()),
+                next(iter(self.decks)),
+            )
+            await asyncio.to_thread(self._store.subscribe, reminder)
+            text = (
+                f'Каждый вечер в {moscow_time(minute)} по Москве я пришлю вам карту. '
+                'Нажмите ещё раз, чтобы выключить.'
+            )
+        await context.bot.send_message(update.effective_chat.id, text)
+
+    async def dispatch_due(self, application: Application[Any, Any, Any, Any, Any, Any], now: float) -> int:
+        """Send every reminder due by now in rate-limited batches, return how many were sent."""
+        assert self._store
+        sent = 0
+        while batch := await asyncio.to_thread(self._store.due, now, self.batch_size):
+            started = time.monotonic()
+            due = [reminder for reminder in batch if now - reminder.next_at <= self.grace_seconds]
+            if len(due) < len(batch):
+                logger.info(f'{len(batch) - len(due)} reminders are skipped, they are late')
+            # Moved to the next day before sending: a reminder is lost rather than sent twice after a crash
+            for reminder in batch:
+                reminder.next_at = next_time(reminder.minute, now)
+            await asyncio.to_thread(self._store.reschedule, batch)
+            for reminder in due:
+                try:
+                    if await self._remind(application, reminder):
+                        sent += 1
+                except Exception:
+                    # One broken reminder must not cost the rest of the batch
+                    logger.exception(f'failed to remind user {reminder.user_id}')
+            await asyncio.sleep(max(0.0, len(batch) / self.rate - (time.monotonic() - started)))
+        self.sent += sent
+        return sent
+
+    async def _run(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        while True:
+            now = time.time()
+            try:
+                sent = await self.dispatch_due(application, now)
+                if sent:
+                    logger.info(f'{sent} reminders sent')
+            except Exception:
+                # The scheduler keeps running, the next bucket retries what is still due
+                logger.exception('failed to dispatch reminders')
+            # Wake up at the start of the next bucket
+            await asyncio.sleep(self.bucket_seconds - time.time() % self.bucket_seconds)
+
+    async def _remind(self, application: Application[Any, Any, Any, Any, Any, Any], reminder: Reminder) -> bool:
+        assert self._store
+        deck = self.decks.get(reminder.deck) or next(iter(self.decks.values()))
+        context = application.context_types.context(application, chat_id=reminder.chat_id, user_id=reminder.user_id)
+        message = deck.render(get_card_with_history(context, deck), locale_of(context))
+        # The context is not one of an update, so the drawn card is marked for the persistence by hand, as JobQueue does
+        application.mark_data_for_update_persistence(user_ids=[reminder.user_id])
+        bot = application.bot
+        try:
+            if message.image_path:
+                image_path = message.image_path
+                sent = await self._send(lambda: bot.send_photo(
+                    reminder.chat_id, photo_of(bot, image_path), caption=REMINDER_TEXT,
+                ))
+                remember_file_id(bot, image_path, sent)
+            await self._send(lambda: bot.send_message(reminder.chat_id, message.text, parse_mode='HTML'))
+        except Forbidden:
+            logger.info(f'user {reminder.user_id} blocked the bot, the reminder is removed')
+            await asyncio.to_thread(self._store.unsubscribe, reminder.user_id)
+            return False
+        except TelegramError as e:
+            logger.error(f'failed to send the reminder to user {reminder.user_id}: {e}')
+            return False
+        flush_readings(context, reminder.user_id)
+        return True
+
+    @staticmethod
+    async def _send(request: Callable[[], Awaitable[TgMessage]]) -> TgMessage:
+        while True:
+            try:
+                return await request()
+            except RetryAfter as e:
+                # Every other reminder would be refused as well, so the whole dispatch waits
+                retry_after = e.retry_after if isinstance(e.retry_after, int) else e.retry_after.total_seconds()
+                logger.warning(f'reminders are flood limited for {retry_after}s')
+                await asyncio.sleep(retry_after)
+
+
+reminders = ReminderScheduler()
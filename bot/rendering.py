@@ -0,0 +1,117 @@
+"""
+Texts of the cards in Telegram HTML, rendered once per card, locale and layout.
+
+The templates of every locale are parsed when the renderer is built, so a template with
+an unknown field fails at startup instead of at a draw. The fields are the CSV columns
+of a card, escaped: a '<' or '&' in a description can not break the markup of a message
+and make Telegram refuse it. Rendered texts are kept in a bounded LRU cache by the deck,
+the card, the locale and the layout, so showing a card again is a dictionary lookup.
+"""
+
+import logging
+from collections import OrderedDict
+from html import escape
+from string import Formatter
+from typing import TYPE_CHECKING, Any, Mapping, cast
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from utils import prepare_logging
+
+if TYPE_CHECKING:
+    from bot.deck import Deck
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+DEFAULT_LOCALE = 'ru'
+# Key in user_data: the locale of the card texts, by the language of the user's Telegram app
+LOCALE_KEY = 'locale'
+
+# Layouts: the whole card, and the card at a position of a spread
+CARD = 'card'
+SPREAD_LAYOUTS = ('past', 'present', 'future')
+
+FIELDS = {'name', 'description', 'meaning', 'keywords'}
+
+# Only the labels of a template can be translated, the names and descriptions of the cards come from
+# the CSV of a deck in Russian; a locale is added together with translated decks
+TEMPLATES: dict[str, dict[str, str]] = {
+    'ru': {
+        CARD: '<b>{name}</b>\n\n{description}\n\nТолкование:\n<span class="tg-spoiler">{meaning}</span>',
+        # Short enough for a photo caption: the names, and the key words in spoilers
+        'past': '<b>Прошлое: {name}</b>\n<span class="tg-spoiler">{keywords}</span>',
+        'present': '<b>Настоящее: {name}</b>\n<span class="tg-spoiler">{keywords}</span>',
+        'future': '<b>Будущее: {name}</b>\n<span class="tg-spoiler">{keywords}</span>',
+    },
+}
+
+
+def compile_template(template: str) -> tuple[tuple[str, str | None], ...]:
+    """The literal markup and the field name of every part of a template, ValueError for unknown fields."""
+    parts: list[tuple[str, str | None]] = []
+    for literal, field, format_spec, conversion in Formatter().parse(template):
+        if field is not None and (field not in FIELDS or format_spec or conversion):
+            raise ValueError(f'unknown template field {field!r} in {template!r}')
+        parts.append((literal, field))
+    return tuple(parts)
+
+
+class CardRenderer:
+    """Compiled templates of every locale, and the texts rendered with them in the order of use."""
+
+    def __init__(self, templates: Mapping[str, Mapping[str, str]] = TEMPLATES, max_texts: int = 10000) -> None:
+        if DEFAULT_LOCALE not in templates:
+            raise ValueError(f'templates of the default locale {DEFAULT_LOCALE!r} are missing')
+        self._templates = {
+            locale: {layout: compile_template(template) for layout, template in layouts.items()}
+            for locale, layouts in templates.items()
+        }
+        self._max_texts = max_texts
+        # The deck itself is in the key, a deck of the same name built anew gets its own texts
+        self._texts: OrderedDict[tuple['Deck', int, str, str], str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def locale_for(self, language_code: str | None) -> str:
+        """The locale of the templates for a Telegram language code like 'en' or 'pt-br'."""
+        language = (language_code or '').split('-')[0].lower()
+        return language if language in self._templates else DEFAULT_LOCALE
+
+    def render(self, deck: 'Deck', index: int, locale: str = DEFAULT_LOCALE, layout: str = CARD) -> str:
+        key = (deck, index, locale, layout)
+        text = self._texts.get(key)
+        if text is not None:
+            self.hits += 1
+            self._texts.move_to_end(key)
+            return text
+        self.misses += 1
+        layouts = self._templates.get(locale) or self._templates[DEFAULT_LOCALE]
+        parts = layouts.get(layout) or self._templates[DEFAULT_LOCALE][layout]
+        card = deck.cards[index]
+        text = ''.join(
+            literal + (escape(getattr(card, field), quote=False) if field else '') for literal, field in parts
+        )
+        self._texts[key] = text
+        if len(self._texts) > self._max_texts:
+            self._texts.popitem(last=False)
+        return text
+
+
+card_texts = CardRenderer()
+
+
+def locale_of(context: ContextTypes.DEFAULT_TYPE) -> str:
+    return cast(str, cast(dict[str, Any], context.user_data or {}).get(LOCALE_KEY, DEFAULT_LOCALE))
+
+
+async def remember_locale(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Keep the locale of the user's Telegram app in user_data, where the card views and reminders read it."""
+    if not update.effective_user or context.user_data is None:
+        return
+    locale = card_texts.locale_for(update.effective_user.language_code)
+    user_data = cast(dict[str, Any], context.user_data)
+    if user_data.get(LOCALE_KEY, DEFAULT_LOCALE) != locale:
+        user_data[LOCALE_KEY] = locale
@@ -0,0 +1,262 @@
+"""
+Multi-worker mode: a front webhook receiver shards updates by chat id into worker processes.
+
+Every worker runs its own event loop with a full copy of the conversation, so the bot
+can use several cores and survive the crash of a single worker. Updates of one chat
+always go to the same worker, which keeps their order, and conversation state lives in
+the persistence shared by all workers.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import secrets
+import signal
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.context import SpawnContext, SpawnProcess
+from multiprocessing.queues import Queue
+from multiprocessing.sharedctypes import Synchronized
+from pathlib import Path
+from typing import Any, Callable, Sequence
+from urllib.parse import urlsplit
+
+from telegram import Bot, Update
+from telegram.ext import Application
+
+from bot.bot import build_application
+from bot.throttle import FloodLimit
+from bot.transport import ApiServer, TransportConfig
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+ApplicationFactory = Callable[[], Application[Any, Any, Any, Any, Any, Any]]
+
+# Update fields which hold a message with the chat the update belongs to
+_MESSAGE_FIELDS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'business_message', 'edited_business_message',
+)
+# Update fields which hold the chat directly
+_CHAT_FIELDS = ('my_chat_member', 'chat_member', 'chat_join_request', 'message_reaction', 'chat_boost')
+
+
+def get_shard_key(update: dict[str, Any]) -> int:
+    """Return the id of the chat (or the user, if there is no chat) an update in JSON form belongs to."""
+    for field in _MESSAGE_FIELDS + _CHAT_FIELDS:
+        if field in update and 'chat' in update[field]:
+            return int(update[field]['chat']['id'])
+    callback_query = update.get('callback_query')
+    if callback_query and 'message' in callback_query:
+        return int(callback_query['message']['chat']['id'])
+    for value in update.values():
+        if isinstance(value, dict) and 'from' in value:
+            return int(value['from']['id'])
+    return int(update.get('update_id', 0))
+
+
+def get_shard(update: dict[str, Any], workers: int) -> int:
+    return get_shard_key(update) % workers
+
+
+def run_worker(
+    index: int, factory: ApplicationFactory,
+    updates: 'Queue[dict[str, Any] | None]', processed: 'Synchronized[int]',
+) -> None:
+    """Entry point of a worker process: feeds the updates from its queue to the application."""
+    prepare_logging()
+    # The front stops the workers when it is stopped itself, after they finished their queues
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_IGN)
+    logger.info(f'worker {index} starting...')
+    asyncio.run(_serve_worker(factory, updates, processed))
+    logger.info(f'worker {index} finished')
+
+
+async def _serve_worker(
+    factory: ApplicationFactory, updates: 'Queue[dict[str, Any] | None]', processed: 'Synchronized[int]',
+) -> None:
+    loop = asyncio.get_running_loop()
+    application = factory()
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.process_update(Update.de_json(data, application.bot))
+            if application.persistence:
+                # Store the new state right away, so a crashed worker loses at most the current update
+                await application.update_persistence()
+            with processed.get_lock():
+                processed.value += 1
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+class Worker:
+    def __init__(self, index: int, factory: ApplicationFactory, context: SpawnContext) -> None:
+        self.index = index
+        self.restarts = 0
+        self._factory = factory
+        self._context = context
+        self.updates: 'Queue[dict[str, Any] | None]' = context.Queue()
+        self.processed: 'Synchronized[int]' = context.Value('q', 0)
+        self.process: SpawnProcess | None = None
+
+    def start(self) -> None:
+        self.process = self._context.Process(
+            target=run_worker, args=(self.index, self._factory, self.updates, self.processed),
+            name=f'oracle-worker-{self.index}', daemon=True,
+        )
+        self.process.start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def status(self) -> dict[str, Any]:
+        return {
+            'index': self.index,
+            'alive': self.is_alive(),
+            'processed': self.processed.value,
+            'queued': self.updates.qsize(),
+            'restarts': self.restarts,
+        }
+
+
+class ShardedRunner:
+    """Starts the worker processes, routes updates to them and restarts the ones which died."""
+
+    def __init__(self, workers: int, factory: ApplicationFactory, check_interval: float = 1.0) -> None:
+        context = multiprocessing.get_context('spawn')
+        self.workers = [Worker(index, factory, context) for index in range(workers)]
+        self._check_interval = check_interval
+        self._stopped = threading.Event()
+        self._supervisor = threading.Thread(target=self._supervise, name='oracle-supervisor', daemon=True)
+
+    def start(self) -> None:
+        logger.info(f'starting {len(self.workers)} workers...')
+        for worker in self.workers:
+            worker.start()
+        self._supervisor.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Let the workers finish their queues, terminate the ones still running after timeout seconds."""
+        self._stopped.set()
+        for worker in self.workers:
+            worker.updates.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.process:
+                worker.process.join(max(deadline - time.monotonic(), 0))
+                if worker.process.is_alive():
+                    logger.error(f'worker {worker.index} did not stop in {timeout} seconds, killing it')
+                    # The workers ignore SIGTERM
+                    worker.process.kill()
+
+    def dispatch(self, update: dict[str, Any]) -> None:
+        self.workers[get_shard(update, len(self.workers))].updates.put(update)
+
+    def processed(self) -> int:
+        return sum(worker.processed.value for worker in self.workers)
+
+    def is_healthy(self) -> bool:
+        return all(worker.is_alive() for worker in self.workers)
+
+    def status(self) -> list[dict[str, Any]]:
+        return [worker.status() for worker in self.workers]
+
+    def _supervise(self) -> None:
+        while not self._stopped.wait(self._check_interval):
+            for worker in self.workers:
+                if not worker.is_alive() and not self._stopped.is_set():
+                    exitcode = worker.process.exitcode if worker.process else None
+                    logger.error(f'worker {worker.index} died with exit code {exitcode}, restarting')
+                    worker.restarts += 1
+                    worker.start()
+
+
+def create_webhook_handler(
+    runner: ShardedRunner, webhook_path: str, secret_token: str,
+) -> type[BaseHTTPRequestHandler]:
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            if self.path != webhook_path:
+                self._reply(404, {'error': 'not found'})
+                return
+            if self.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret_token:
+                self._reply(403, {'error': 'wrong secret token'})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                update = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._reply(400, {'error': 'invalid json'})
+                return
+            runner.dispatch(update)
+            self._reply(200, {})
+
+        def do_GET(self) -> None:
+            if self.path == '/healthz':
+                self._reply(200 if runner.is_healthy() else 503, {'workers': runner.status()})
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def _reply(self, status: int, body: dict[str, Any]) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug(format, *args)
+
+    return WebhookHandler
+
+
+def serve(server: ThreadingHTTPServer, runner: ShardedRunner, shutdown_deadline: float) -> None:
+    """Serve the webhook until SIGTERM or SIGINT, then drain the workers up to the deadline."""
+    def stop(signum: int, frame: object) -> None:
+        logger.info(f'got signal {signum}, stopping the webhook receiver')
+        # shutdown waits for serve_forever, which runs in this very thread
+        threading.Thread(target=server.shutdown, name='oracle-receiver-stop').start()
+
+    handlers = {sig: signal.signal(sig, stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        server.serve_forever()
+    finally:
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+        server.server_close()
+        runner.stop(shutdown_deadline)
+
+
+def run_sharded(
+    token: str, workers: int, webhook_url: str, listen: str, port: int, persistence_path: Path,
+    analytics_path: Path | None = None, admins: Sequence[int] = (), transport: TransportConfig | None = None,
+    navigation: str = 'reply', flood_limit: FloodLimit | None = None, api_server: ApiServer = ApiServer(),
+    shutdown_deadline: float = 8.0,
+) -> None:
+    """Register the webhook and serve it, sharding updates into the worker processes."""
+    secret_token = secrets.token_hex(16)
+    webhook_path = urlsplit(webhook_url).path or '/'
+    runner = ShardedRunner(workers, partial(
+        build_application, token, persistence_path, analytics_path=analytics_path, admins=admins, transport=transport,
+        navigation=navigation, flood_limit=flood_limit, api_server=api_server,
+    ))
+    runner.start()
+
+    server = ThreadingHTTPServer((listen, port), create_webhook_handler(runner, webhook_path, secret_token))
+    logger.info(f'webhook receiver listens on {listen}:{port}{webhook_path}')
+    bot = Bot(token, base_url=api_server.base_url, base_file_url=api_server.base_file_url)
+    asyncio.run(bot.set_webhook(webhook_url, allowed_updates=Update.ALL_TYPES, secret_token=secret_token))
+    serve(server, runner, shutdown_deadline)
@@ -0,0 +1,117 @@
+"""
+Graceful shutdown: drain the updates in flight before the process exits.
+
+On SIGTERM (docker stop) or SIGINT the bot stops being ready, stops fetching updates and
+waits for the updates already fetched to be handled, up to a deadline. Updates still
+queued or running at the deadline are abandoned and logged. Then the application stops
+as usual: the persistence stores the state, post_shutdown flushes the analytics buffer,
+the traffic log and the media cache. A second signal skips the rest of the drain.
+"""
+
+import asyncio
+import logging
+import signal
+import time
+from typing import Any, Awaitable
+
+from telegram.ext import Application, BaseUpdateProcessor
+
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+
+class TrackingUpdateProcessor(BaseUpdateProcessor):
+    """Handles updates one by one, like the default processor, and knows which one is running."""
+
+    def __init__(self) -> None:
+        super().__init__(max_concurrent_updates=1)
+        self.in_flight: dict[int, asyncio.Task[object]] = {}
+        # The updates being handled by id, read by the loop monitor from its thread
+        self.updates: dict[int, object] = {}
+        self._abandoned: set[int] = set()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        update_id = getattr(update, 'update_id', 0)
+        task: asyncio.Task[object] = asyncio.ensure_future(coroutine)
+        self.in_flight[update_id] = task
+        self.updates[update_id] = update
+        try:
+            await task
+        except asyncio.CancelledError:
+            if update_id not in self._abandoned:
+                raise
+        finally:
+            del self.in_flight[update_id]
+            del self.updates[update_id]
+            self._abandoned.discard(update_id)
+
+    def abandon(self) -> list[int]:
+        """Cancel the running updates, return their ids."""
+        for update_id, task in self.in_flight.items():
+            self._abandoned.add(update_id)
+            task.cancel()
+        return list(self.in_flight)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class ShutdownCoordinator:
+    def __init__(self) -> None:
+        # Whether the bot takes new updates, for the readiness check
+        self.ready = False
+        # Seconds to wait for the updates in flight, None if signals are left to the defaults
+        self.deadline: float | None = None
+        self._draining: asyncio.Task[None] | None = None
+
+    def install(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        """Take over the stop signals of run_polling; called from post_init."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.request_shutdown, application)
+
+    def request_shutdown(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        if self._draining is None:
+            logger.info('shutdown requested, draining the updates in flight')
+            self._draining = asyncio.get_running_loop().create_task(self.drain(application))
+        else:
+            logger.warning('shutdown requested again, stopping without waiting')
+            self._draining.cancel()
+            application.stop_running()
+
+    async def drain(self, application: Application[Any, Any, Any, Any, Any, Any]) -> None:
+        self.ready = False
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        processor = application.update_processor
+        tracking = processor if isinstance(processor, TrackingUpdateProcessor) else None
+        deadline = time.monotonic() + (self.deadline or 0)
+        while application.update_queue.qsize() or (tracking and tracking.in_flight):
+            if time.monotonic() >= deadline:
+                self._abandon(application, tracking)
+                break
+            await asyncio.sleep(0.05)
+        else:
+            logger.info('all updates in flight are handled')
+        application.stop_running()
+
+    @staticmethod
+    def _abandon(
+        application: Application[Any, Any, Any, Any, Any, Any], tracking: TrackingUpdateProcessor | None,
+    ) -> None:
+        queued: list[int] = []
+        while not application.update_queue.empty():
+            update = application.update_queue.get_nowait()
+            application.update_queue.task_done()
+            queued.append(getattr(update, 'update_id', 0))
+        running = tracking.abandon() if tracking else []
+        logger.error(f'shutdown deadline passed, abandoned updates: running {running}, queued {queued}')
+
+
+coordinator = ShutdownCoordinator()
@@ -0,0 +1,228 @@
+"""
+Offline simulator of the card draw policy, to choose CARD_HISTORY_SIZE with data.
+
+get_card_with_history draws a card again while it is in the user's history, at most
+DRAW_TRIES times. The simulator runs the same loop for all the users at once with NumPy:
+every step draws a card for every user, then draws again only for the users whose card
+is in their history, a few percent of them. replay() runs the production function itself
+on a sample of users to check the simulator against it:
+
+    python -m bot.simulation [--deck-size 41] [--users 1000000] [--draws 100] [--history-size 3 5 8] [--verify]
+
+It reports the skew of the card frequencies, the intervals between repeats of a card and
+the number of draws until a user has seen every card. It keeps the last draw of every card
+of every user, 2 bytes per user and card. NumPy is optional, only the simulator needs it.
+"""
+
+import argparse
+import logging
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any
+
+from bot import deck as deck_module
+from bot.deck import CARD_HISTORY_SIZE, DRAW_TRIES, HISTORY_KEY, Deck, get_card_with_history
+from cards.card import Card
+from utils import prepare_logging
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+
+@dataclass
+class DrawReport:
+    deck_size: int
+    history_size: int
+    users: int
+    draws: int
+    card_counts: Any  # draws of every card by all the users
+    repeat_intervals: Any  # number of repeats by the draws since the previous draw of the card
+    coverage_draws: Any  # number of users by the draws until they saw every card, 0 for never
+
+    @property
+    def frequency_skew(self) -> float:
+        """The most drawn card over the least drawn one."""
+        return float(self.card_counts.max() / max(self.card_counts.min(), 1))
+
+    @property
+    def frequency_cv(self) -> float:
+        """The standard deviation of the card frequencies over their mean."""
+        return float(self.card_counts.std() / self.card_counts.mean())
+
+    @property
+    def early_repeats(self) -> float:
+        """The share of repeats within the history, which the policy should not allow."""
+        total = self.repeat_intervals.sum()
+        return float(self.repeat_intervals[:self.history_size + 1].sum() / total) if total else 0.0
+
+    @property
+    def covered(self) -> float:
+        """The share of users who saw every card."""
+        return float(self.coverage_draws[1:].sum() / self.users)
+
+    def repeat_quantile(self, q: float) -> int | None:
+        return _quantile(self.repeat_intervals, q)
+
+    def coverage_quantile(self, q: float) -> int | None:
+        """The draws until the share q of the users who saw every card saw them."""
+        return _quantile(self.coverage_draws[1:], q, offset=1)
+
+    def summary(self) -> str:
+        return (
+            f'deck {self.deck_size}, history {self.history_size}, {self.users} users x {self.draws} draws: '
+            f'frequency skew {self.frequency_skew:.3f}, cv {self.frequency_cv:.4f}; '
+            f'repeat interval min {self.repeat_quantile(0.0)}, median {self.repeat_quantile(0.5)}, '
+            f'p90 {self.repeat_quantile(0.9)}, within history {self.early_repeats:.2%}; '
+            f'full coverage by {self.covered:.1%} of users, median {self.coverage_quantile(0.5)}, '
+            f'p90 {self.coverage_quantile(0.9)} draws'
+        )
+
+
+def _quantile(histogram: Any, q: float, offset: int = 0) -> int | None:
+    total = histogram.sum()
+    if not total:
+        return None
+    return int(np.searchsorted(np.cumsum(histogram), max(q * total, 1))) + offset
+
+
+class _Accumulator:
+    """Statistics of the draws of all the users, one step at a time."""
+
+    def __init__(self, deck_size: int, history_size: int, users: int, draws: int) -> None:
+        self.report = DrawReport(
+            deck_size, history_size, users, draws, card_counts=np.zeros(deck_size, np.int64),
+            repeat_intervals=np.zeros(draws + 1, np.int64), coverage_draws=np.zeros(draws + 1, np.int64),
+        )
+        # The step of the last draw of every card of every user, by card * users + user
+        self._last_seen = np.full(users * deck_size, -1, np.int16 if draws < 2 ** 15 else np.int32)
+        self._seen = np.zeros(users, np.int32)
+        self._users = np.arange(users, dtype=np.int64)
+
+    def add(self, step: int, cards: Any) -> None:
+        report = self.report
+        report.card_counts += np.bincount(cards, minlength=report.deck_size)
+        cells = cards.astype(np.int64) * len(self._users) + self._users
+        last = self._last_seen[cells]
+        repeated = last >= 0
+        report.repeat_intervals += np.bincount(step - last[repeated], minlength=report.draws + 1)
+        self._seen += ~repeated
+        covered = (self._seen == report.deck_size) & ~repeated
+        report.coverage_draws[step + 1] += int(covered.sum())
+        self._last_seen[cells] = step
+
+
+def _in_history(history: Any, cards: Any) -> Any:
+    hit = np.zeros(len(cards), bool)
+    # A row of the history at a time: contiguous, unlike a column of every user's history
+    for draws in history:
+        hit |= draws == cards
+    return hit
+
+
+def _draw(history: Any, deck_size: int, tries: int, generator: Any) -> Any:
+    """A card for every user by the loop of get_card_with_history; history holds a user's last draws per column."""
+    cards = generator.integers(deck_size, size=history.shape[1], dtype=np.int32)
+    redraw = np.flatnonzero(_in_history(history, cards))
+    for _ in range(tries):
+        if not len(redraw):
+            break
+        cards[redraw] = generator.integers(deck_size, size=len(redraw), dtype=np.int32)
+        redraw = redraw[_in_history(history[:, redraw], cards[redraw])]
+    return cards
+
+
+def simulate(
+    deck_size: int, history_size: int = CARD_HISTORY_SIZE, users: int = 100_000, draws: int = 100,
+    tries: int = DRAW_TRIES, seed: int | None = None,
+) -> DrawReport:
+    """Draw cards for all the users at once, one vectorized step per draw."""
+    if not HAS_NUMPY:
+        raise RuntimeError('NumPy is not installed')
+    generator = np.random.default_rng(seed)
+    accumulator = _Accumulator(deck_size, history_size, users, draws)
+    # The last draws of every user, -1 before the first ones
+    history = np.full((history_size, users), -1, np.int32)
+    for step in range(draws):
+        cards = _draw(history, deck_size, tries, generator)
+        if history_size:
+            history[step % history_size] = cards
+        accumulator.add(step, cards)
+    return accumulator.report
+
+
+def replay(
+    deck_size: int, history_size: int = CARD_HISTORY_SIZE, users: int = 2_000, draws: int = 100,
+    seed: int | None = None,
+) -> DrawReport:
+    """The same report for the draws of get_card_with_history itself, one user and one draw at a time."""
+    if not HAS_NUMPY:
+        raise RuntimeError('NumPy is not installed')
+    deck = Deck('Симуляция', [Card(f'Карта {index}', '', '', '', '') for index in range(deck_size)], '')
+    saved_state = deck_module.rng.getstate()
+    deck_module.rng.seed(seed)
+    try:
+        contexts: list[Any] = [
+            SimpleNamespace(user_data={HISTORY_KEY: deque(maxlen=history_size)}) for _ in range(users)
+        ]
+        accumulator = _Accumulator(deck_size, history_size, users, draws)
+        for step in range(draws):
+            cards = np.fromiter((get_card_with_history(context, deck) for context in contexts), np.int32, users)
+            accumulator.add(step, cards)
+            for context in contexts:
+                # The draws are not written to the journal
+                context.__dict__.pop('readings', None)
+    finally:
+        deck_module.rng.setstate(saved_state)
+    return accumulator.report
+
+
+def distance(first: DrawReport, second: DrawReport) -> float:
+    """Total variation distance between the repeat interval distributions of two reports."""
+    a = first.repeat_intervals / max(first.repeat_intervals.sum(), 1)
+    b = second.repeat_intervals / max(second.repeat_intervals.sum(), 1)
+    return float(np.abs(a - b).sum() / 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Simulate the card draw policy for many users')
+    parser.add_argument('--deck-size', type=int, nargs='+', help='cards in the deck, the decks of the bot by default')
+    parser.add_argument('--users', type=int, default=1_000_000, help='simulated users')
+    parser.add_argument('--draws', type=int, default=100, help='draws of every user')
+    parser.add_argument('--history-size', type=int, nargs='+', default=[CARD_HISTORY_SIZE],
+                        help='history sizes to compare')
+    parser.add_argument('--seed', type=int, help='seed of the random draws')
+    parser.add_argument('--verify', action='store_true',
+                        help='also draw for a sample of users with get_card_with_history and compare')
+    args = parser.parse_args()
+    if not HAS_NUMPY:
+        sys.exit('the simulator needs NumPy: pip install numpy')
+    if args.deck_size:
+        sizes = args.deck_size
+    else:
+        from bot.menu import decks
+
+        sizes = sorted({len(deck) for deck in decks.values()})
+
+    for deck_size in sizes:
+        for history_size in args.history_size:
+            started = time.perf_counter()
+            report = simulate(deck_size, history_size, args.users, args.draws, seed=args.seed)
+            print(f'{report.summary()} ({time.perf_counter() - started:.1f}s)')
+            if args.verify:
+                production = replay(deck_size, history_size, draws=args.draws, seed=args.seed)
+                print(f'  get_card_with_history: {production.summary()}')
+                print(f'  repeat interval distance {distance(report, production):.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Live health statistics of the bot for the admin /stats command.
+
+Every update is added to constant-memory streaming sketches: a log-bucket latency
+histogram (DDSketch style, 1% relative error) and a HyperLogLog of active users.
+Sketches are kept per time slot in a ring, and sliding windows are answered by merging
+the slots, so no samples are stored and nothing is scanned.
+"""
+
+import math
+import time
+from collections import Counter
+from weakref import WeakKeyDictionary
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from bot.analytics import update_latency_ms
+
+
+class LatencySketch:
+    """Quantile sketch with logarithmic buckets, each value is estimated with a bounded relative error."""
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Counter[int] = Counter()
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def merge(self, other: 'LatencySketch') -> None:
+        self.buckets.update(other.buckets)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                # Middle of the bucket (gamma^(key-1), gamma^key]
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+
+class UniqueCounter:
+    """HyperLogLog estimate of the number of distinct ids."""
+
+    def __init__(self, precision: int = 10) -> None:
+        self._precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @staticmethod
+    def _hash(value: int) -> int:
+        # splitmix64, spreads sequential ids over all bits
+        value = (value + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        return value ^ (value >> 31)
+
+    def add(self, value: int) -> None:
+        hashed = self._hash(value)
+        index = hashed >> (64 - self._precision)
+        rest = hashed & ((1 << (64 - self._precision)) - 1)
+        rank = 64 - self._precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'UniqueCounter') -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        size = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / size) * size * size / sum(2.0 ** -register for register in self.registers)
+        empty = self.registers.count(0)
+        if raw <= 2.5 * size and empty:
+            # Linear counting is more precise for small cardinalities
+            return round(size * math.log(size / empty))
+        return round(raw)
+
+
+class Slot:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.updates = 0
+        self.errors = 0
+        self.latency = LatencySketch()
+        self.users = UniqueCounter()
+
+
+class WindowedStats:
+    """Ring of per-slot sketches covering the last slot_seconds * slots seconds."""
+
+    def __init__(self, slot_seconds: int = 10, slots: int = 360) -> None:
+        self._slot_seconds = slot_seconds
+        self._slots: list[Slot | None] = [None] * slots
+        self._started = time.time()
+
+    def _current(self, now: float) -> Slot:
+        index = int(now // self._slot_seconds)
+        slot = self._slots[index % len(self._slots)]
+        if slot is None or slot.index != index:
+            slot = Slot(index)
+            self._slots[index % len(self._slots)] = slot
+        return slot
+
+    def record_update(self, latency_ms: float | None, user_id: int | None, now: float | None = None) -> None:
+        slot = self._current(now or time.time())
+        slot.updates += 1
+        if latency_ms is not None:
+            slot.latency.add(latency_ms)
+        if user_id is not None:
+            slot.users.add(user_id)
+
+    def record_error(self, now: float | None = None) -> None:
+        self._current(now or time.time()).errors += 1
+
+    def window(self, seconds: int, now: float | None = None) -> dict[str, float | int | None]:
+        now = now or time.time()
+        newest = int(now // self._slot_seconds)
+        oldest = newest - min(seconds // self._slot_seconds, len(self._slots)) + 1
+        total = Slot(newest)
+        for slot in self._slots:
+            if slot is not None and oldest <= slot.index <= newest:
+                total.updates += slot.updates
+                total.errors += slot.errors
+                total.latency.merge(slot.latency)
+                total.users.merge(slot.users)
+        duration = max(1.0, min(float(seconds), now - self._started))
+        return {
+            'throughput': total.updates / duration,
+            'error_rate': total.errors / total.updates if total.updates else 0.0,
+            'p50': total.latency.quantile(0.5),
+            'p95': total.latency.quantile(0.95),
+            'p99': total.latency.quantile(0.99),
+            'users': total.users.estimate(),
+        }
+
+
+stats = WindowedStats()
+
+# Pool name and waits for a free connection of every live pool, registered by bot.transport
+pool_waits: 'WeakKeyDictionary[object, tuple[str, LatencySketch]]' = WeakKeyDictionary()
+
+# Updates dropped by bot.throttle by the reason, since the start
+dropped_updates: Counter[str] = Counter()
+
+WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}
+
+
+def format_stats(windowed: WindowedStats) -> str:
+    def ms(value: float | int | None) -> str:
+        return '-' if value is None else f'{value:.0f}'
+
+    lines = ['window  upd/s  errors  p50ms  p95ms  p99ms  users']
+    for name, seconds in WINDOWS.items():
+        window = windowed.window(seconds)
+        lines.append(
+            f"{name:<6} {window['throughput']:6.2f} {window['error_rate']:6.1%} "
+            f"{ms(window['p50']):>6} {ms(window['p95']):>6} {ms(window['p99']):>6} {window['users']:>6}"
+        )
+    # Several bots or requests have pools of the same name, their waits are shown together
+    merged: dict[str, LatencySketch] = {}
+    for name, waits in list(pool_waits.values()):
+        merged.setdefault(name, LatencySketch()).merge(waits)
+    for name, waits in merged.items():
+        lines.append(
+            f'pool {name}: {waits.count} requests, wait p50 {ms(waits.quantile(0.5))}ms, '
+            f'p99 {ms(waits.quantile(0.99))}ms'
+        )
+    if dropped_updates:
+        lines.append('dropped: ' + ', '.join(f'{reason} {count}' for reason, count in sorted(dropped_updates.items())))
+    return '<pre>' + '\n'.join(lines) + '</pre>'
+
+
+async def track_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    stats.record_update(update_latency_ms(context), update.effective_user.id if update.effective_user else None)
+
+
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.message:
+        await update.message.reply_text(format_stats(stats), parse_mode='HTML')
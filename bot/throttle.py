@@ -0,0 +1,119 @@
+"""
+Per-user flood protection, checked before any handler replies.
+
+Every user has a token bucket: a burst of updates passes at once, then updates pass at
+the refill rate. The same text or button repeated within a short time (double taps,
+a stuck key) is handled once, without taking a token. The first update over the limit
+gets one short notice, the following ones are dropped silently until the bucket refills,
+so a spammer can not multiply the outgoing traffic. A stopped button press is still answered,
+with the notice or silently. Admins are never throttled.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Collection
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from bot.stats import dropped_updates
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+NOTICE = 'Слишком много сообщений. Подождите немного.'
+
+# Verdicts of Throttle.check
+PASS = 'pass'
+COALESCED = 'coalesced'
+NOTIFIED = 'notified'
+DROPPED = 'dropped'
+
+
+@dataclass(frozen=True)
+class FloodLimit:
+    rate: float = 1.0  # updates per second a user can keep sending
+    burst: int = 10  # updates a user can send at once
+    coalesce_seconds: float = 0.5  # repeats of the same text within this time are handled once
+
+
+class Bucket:
+    __slots__ = ('tokens', 'updated', 'last_text', 'last_time', 'notified')
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.updated = now
+        self.last_text: str | None = None
+        self.last_time = 0.0
+        self.notified = False
+
+
+class Throttle:
+    """Token buckets of the last max_users active users."""
+
+    def __init__(self, limit: FloodLimit = FloodLimit(), max_users: int = 100000) -> None:
+        self.limit = limit
+        self._max_users = max_users
+        self._buckets: OrderedDict[int, Bucket] = OrderedDict()
+
+    def check(self, user_id: int, text: str | None, now: float) -> str:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = Bucket(self.limit.burst, now)
+            self._buckets[user_id] = bucket
+            if len(self._buckets) > self._max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+
+        if text is not None and text == bucket.last_text and now - bucket.last_time < self.limit.coalesce_seconds:
+            return COALESCED
+        bucket.tokens = min(self.limit.burst, bucket.tokens + (now - bucket.updated) * self.limit.rate)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            if bucket.notified:
+                return DROPPED
+            bucket.notified = True
+            return NOTIFIED
+        bucket.tokens -= 1
+        bucket.notified = False
+        bucket.last_text = text
+        bucket.last_time = now
+        return PASS
+
+
+throttle = Throttle()
+
+
+def update_text(update: Update) -> str | None:
+    if update.message:
+        return update.message.text
+    if update.callback_query:
+        return update.callback_query.data
+    return None
+
+
+async def throttle_update(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, limiter: Throttle | None = None,
+    admins: Collection[int] = (),
+) -> None:
+    """Stop handling of an update of a user who sends too much, by the buckets of the bot or the shared ones."""
+    user = update.effective_user
+    if user is None or user.id in admins:
+        return
+    verdict = (limiter or throttle).check(user.id, update_text(update), time.monotonic())
+    if verdict == PASS:
+        return
+    dropped_updates[verdict] += 1
+    if verdict == NOTIFIED:
+        logger.warning(f'user {user.id} is throttled')
+        if update.message:
+            await update.message.reply_text(NOTICE)
+    if update.callback_query:
+        # Otherwise the client shows the button as loading until the query expires
+        await update.callback_query.answer(NOTICE if verdict == NOTIFIED else None)
+    raise ApplicationHandlerStop
@@ -0,0 +1,235 @@
+"""
+Capture of the incoming traffic and its deterministic replay for regression benchmarks.
+
+The recorder writes every incoming update, anonymized, with its arrival time to a gzip
+compressed JSON lines log. The replay feeds a log into the real conversation against an
+offline bot, at the original or an accelerated pace and with seeded card draws, and
+reports latency percentiles and allocations, optionally compared with a baseline run:
+
+    python -m bot.traffic traffic.jsonl.gz --speed 10 --seed 1 --output new.json --baseline old.json
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, TextIO
+
+from telegram import Update
+from telegram.ext import ContextTypes, TypeHandler
+
+from utils import prepare_logging
+
+
+prepare_logging()
+logger = logging.getLogger()
+
+# Optional personal fields of users and chats, removed
+_PERSONAL_FIELDS = ('last_name', 'username', 'bio', 'title', 'description')
+# Fields kept as they are: the ids of updates and messages, times, kinds of objects and entities,
+# the language of the user's app and the callback data of the bot's own buttons
+_KEPT_FIELDS = ('update_id', 'message_id', 'date', 'edit_date', 'type', 'offset', 'length', 'language_code', 'data')
+# Free text, kept only when it is a button or a command of the bot
+_TEXT_FIELDS = ('text', 'caption', 'query')
+TEXT_PLACEHOLDER = '<text>'
+
+
+class Anonymizer:
+    """
+    Replaces ids with stable pseudonyms and everything else not allow-listed with placeholders.
+
+    Every integer id, of a user or a chat wherever it appears, is pseudonymized. The other
+    strings and numbers, such as captions, queries, phone numbers and coordinates, keep only
+    their type, so the updates are parsed and reach the same handlers in the replay.
+    """
+
+    def __init__(self, buttons: set[str], salt: bytes | None = None) -> None:
+        self._buttons = buttons
+        self._salt = salt or secrets.token_bytes(16)
+
+    def pseudonym(self, value: int) -> int:
+        digest = hmac.new(self._salt, str(abs(value)).encode(), hashlib.sha256).digest()
+        pseudonym = int.from_bytes(digest[:6], 'big') or 1
+        return -pseudonym if value < 0 else pseudonym
+
+    def anonymize(self, data: Any, key: str = '') -> Any:
+        if isinstance(data, dict):
+            result = {name: self.anonymize(value, name) for name, value in data.items() if name not in _PERSONAL_FIELDS}
+            if any(result.get(name) == TEXT_PLACEHOLDER for name in _TEXT_FIELDS):
+                # The entities would point into the removed text
+                result.pop('entities', None)
+                result.pop('caption_entities', None)
+            return result
+        if isinstance(data, list):
+            return [self.anonymize(value, key) for value in data]
+        if data is None or isinstance(data, bool) or key in _KEPT_FIELDS:
+            return data
+        if key in _TEXT_FIELDS and isinstance(data, str):
+            # Free text still has to reach the same handlers, so it is replaced, not removed
+            return data if self._is_public(data) else TEXT_PLACEHOLDER
+        if isinstance(data, int) and (key == 'id' or key.endswith('_id')):
+            return self.pseudonym(data)
+        if key == 'first_name':
+            return 'user'
+        if isinstance(data, str):
+            return TEXT_PLACEHOLDER
+        # Coordinates, sizes and amounts
+        return type(data)(0)
+
+    def _is_public(self, text: str) -> bool:
+        return text in self._buttons or (text.startswith('/') and ' ' not in text)
+
+
+class TrafficRecorder:
+    def __init__(self) -> None:
+        self._output: TextIO | None = None
+        self._anonymizer: Anonymizer | None = None
+        self._lock = threading.Lock()
+        self._started = 0.0
+
+    def open(self, path: str | Path, buttons: set[str]) -> None:
+        self._output = gzip.open(path, 'at', encoding='utf-8')
+        self._anonymizer = Anonymizer(buttons)
+        self._started = time.monotonic()
+        logger.info(f'incoming traffic is recorded to {path}')
+
+    def _write(self, line: str) -> None:
+        with self._lock:
+            if self._output:
+                self._output.write(line)
+
+    async def record(self, update: Update) -> None:
+        if not self._output or not self._anonymizer:
+            return
+        entry = {'time': time.monotonic() - self._started, 'update': self._anonymizer.anonymize(update.to_dict())}
+        # gzip compression is CPU work, keep it off the event loop
+        await asyncio.to_thread(self._write, json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._output:
+                self._output.close()
+                self._output = None
+
+
+recorder = TrafficRecorder()
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await recorder.record(update)
+
+
+def read_log(path: str | Path) -> list[tuple[float, dict[str, Any]]]:
+    with gzip.open(path, 'rt', encoding='utf-8') as log:
+        entries = [json.loads(line) for line in log if line.strip()]
+    # Updates are written from worker threads, so neighbours may be swapped in the log
+    return sorted(((entry['time'], entry['update']) for entry in entries), key=lambda entry: entry[0])
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def replay(
+    entries: list[tuple[float, dict[str, Any]]], speed: float = 0, seed: int = 0, trace_memory: bool = False,
+) -> dict[str, Any]:
+    """
+    Feed the logged updates into the conversation of an offline bot.
+
+    speed is the acceleration of the original pace, 0 replays without pauses. Every replay
+    starts with no updates seen, and only the updates which pass the whole conversation,
+    not the ones skipped as duplicates, are counted.
+    """
+    from bot import dedup, deck
+    from bot.offline import OfflineRequest, create_offline_application
+
+    deck.rng.seed(seed)
+    application = create_offline_application()
+    request = application.bot.request
+    assert isinstance(request, OfflineRequest)
+    handled: list[int] = []
+
+    async def count_handled(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        handled.append(update.update_id)
+
+    application.add_handler(TypeHandler(Update, count_handled), group=max(application.handlers) + 1)
+    latencies: list[float] = []
+    if trace_memory:
+        tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    # The offline bot has the same token in every replay, the ids seen by an earlier one would be skipped
+    seen_updates, dedup.recent_updates = dedup.recent_updates, dedup.RecentUpdates()
+    try:
+        async with application:
+            started = time.monotonic()
+            first = entries[0][0] if entries else 0.0
+            for offset, data in entries:
+                if speed > 0:
+                    delay = (offset - first) / speed - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                update = Update.de_json(data, application.bot)
+                handling_started = time.perf_counter()
+                await application.process_update(update)
+                latencies.append((time.perf_counter() - handling_started) * 1000)
+    finally:
+        dedup.recent_updates = seen_updates
+    result: dict[str, Any] = {
+        'updates': len(handled),
+        'p50_ms': _percentile(latencies, 0.5),
+        'p95_ms': _percentile(latencies, 0.95),
+        'p99_ms': _percentile(latencies, 0.99),
+        'allocated_blocks': sys.getallocatedblocks() - blocks,
+        'api_calls': sum(request.calls.values()),
+        'sent_bytes': request.sent_bytes,
+    }
+    if trace_memory:
+        result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def compare(result: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Return the metrics which are worse than in the baseline by more than tolerance."""
+    regressions = []
+    for metric in ('p95_ms', 'allocated_blocks', 'api_calls', 'sent_bytes'):
+        if metric in baseline and result[metric] > baseline[metric] * (1 + tolerance) + 1e-9:
+            regressions.append(f'{metric}: {baseline[metric]} -> {result[metric]}')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Replay recorded traffic against an offline bot')
+    parser.add_argument('log', type=Path, help='recorded traffic, gzip compressed JSON lines')
+    parser.add_argument('--speed', type=float, default=0, help='acceleration of the original pace, 0 for no pauses')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the card draws')
+    parser.add_argument('--memory', action='store_true', help='trace the peak memory, slows the handlers down')
+    parser.add_argument('--output', type=Path, help='file to write the results to')
+    parser.add_argument('--baseline', type=Path, help='results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative regression')
+    args = parser.parse_args()
+
+    result = asyncio.run(replay(read_log(args.log), args.speed, args.seed, args.memory))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2))
+    if args.baseline:
+        regressions = compare(result, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f'regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
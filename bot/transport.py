@@ -0,0 +1,177 @@
+"""
+Separate HTTP connection pools for media uploads and for the other Bot API calls.
+
+Large photo uploads hold a connection for a long time. With a single shared pool quick
+text replies wait behind them, so media and text requests get their own pools, timeouts
+and keep-alive settings. The time every request waits for a free connection is recorded.
+"""
+
+import asyncio
+import time
+import warnings
+from dataclasses import dataclass, field
+
+import httpx
+from telegram._utils.defaultvalue import DEFAULT_NONE, DefaultValue
+from telegram._utils.types import ODVInput
+from telegram.error import TimedOut
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+from telegram.warnings import PTBDeprecationWarning
+
+from bot.stats import LatencySketch, pool_waits
+
+# RoutingRequest takes the write timeout of uploads from the media pool itself
+warnings.filterwarnings(
+    'ignore', message='.*The `write_timeout` parameter passed to RoutingRequest', category=PTBDeprecationWarning,
+)
+
+# Bot API methods which upload files
+MEDIA_METHODS = {
+    'sendPhoto', 'sendDocument', 'sendMediaGroup', 'sendVideo', 'sendAudio', 'sendAnimation',
+    'sendVoice', 'sendVideoNote', 'sendSticker', 'editMessageMedia', 'setChatPhoto', 'uploadStickerFile',
+}
+
+
+@dataclass
+class PoolConfig:
+    size: int
+    read_timeout: float = 5.0
+    write_timeout: float = 5.0
+    connect_timeout: float = 5.0
+    pool_timeout: float = 1.0
+    keepalive_connections: int | None = None  # same as size by default
+    keepalive_expiry: float = 5.0
+
+
+@dataclass
+class TransportConfig:
+    media: PoolConfig = field(default_factory=lambda: PoolConfig(size=8, write_timeout=60.0, pool_timeout=10.0))
+    text: PoolConfig = field(default_factory=lambda: PoolConfig(size=32))
+    http2: bool = False
+
+
+@dataclass(frozen=True)
+class ApiServer:
+    """
+    The Bot API server the bot talks to, the public one by default.
+
+    A self-hosted server in local mode reads the files to send from our disk by their paths,
+    so the images are not uploaded by the bot at all; it must see the same file system.
+    """
+
+    url: str = 'https://api.telegram.org'
+    local_mode: bool = False
+
+    @property
+    def base_url(self) -> str:
+        return f'{self.url.rstrip("/")}/bot'
+
+    @property
+    def base_file_url(self) -> str:
+        return f'{self.url.rstrip("/")}/file/bot'
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest which records how long requests wait for a free connection of its pool."""
+
+    def __init__(self, name: str, config: PoolConfig, http2: bool = False) -> None:
+        limits = httpx.Limits(
+            max_connections=config.size,
+            max_keepalive_connections=config.keepalive_connections or config.size,
+            keepalive_expiry=config.keepalive_expiry,
+        )
+        super().__init__(
+            connection_pool_size=config.size,
+            read_timeout=config.read_timeout,
+            write_timeout=config.write_timeout,
+            connect_timeout=config.connect_timeout,
+            pool_timeout=config.pool_timeout,
+            media_write_timeout=config.write_timeout,
+            http_version='2' if http2 else '1.1',
+            httpx_kwargs={'limits': limits},
+        )
+        self.name = name
+        self.size = config.size
+        self.media_write_timeout = config.write_timeout
+        self.waits = LatencySketch()
+        pool_waits[self] = (name, self.waits)
+        self.in_use = 0
+        self._pool_timeout = config.pool_timeout
+        self._slots = asyncio.Semaphore(config.size)
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+    ) -> tuple[int, bytes]:
+        # The semaphore has as many slots as the pool has connections, so the time spent
+        # here is the time the request would wait for a connection inside httpx, and it is
+        # limited by the pool timeout in the same way
+        timeout = self._pool_timeout if isinstance(pool_timeout, DefaultValue) else pool_timeout
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise TimedOut(
+                f'Pool timeout: all connections of the {self.name} pool are occupied. '
+                'Request was *not* sent to Telegram. Consider adjusting the pool size or the pool timeout.'
+            ) from None
+        finally:
+            self.waits.add((time.perf_counter() - started) * 1000)
+        self.in_use += 1
+        try:
+            return await super().do_request(
+                url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout,
+            )
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+
+
+class RoutingRequest(BaseRequest):
+    """Sends uploads through the media pool and every other call through the text pool."""
+
+    def __init__(self, config: TransportConfig) -> None:
+        self.media = PooledRequest('media', config.media, config.http2)
+        self.text = PooledRequest('text', config.text, config.http2)
+
+    @property
+    def pools(self) -> list[PooledRequest]:
+        return [self.media, self.text]
+
+    def _pool(self, url: str) -> PooledRequest:
+        return self.media if url.rsplit('/', 1)[-1] in MEDIA_METHODS else self.text
+
+    async def initialize(self) -> None:
+        await asyncio.gather(self.media.initialize(), self.text.initialize())
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(self.media.shutdown(), self.text.shutdown())
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self.text.read_timeout
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: RequestData | None = None,
+        read_timeout: ODVInput[float] = DEFAULT_NONE,
+        write_timeout: ODVInput[float] = DEFAULT_NONE,
+        connect_timeout: ODVInput[float] = DEFAULT_NONE,
+        pool_timeout: ODVInput[float] = DEFAULT_NONE,
+    ) -> tuple[int, bytes]:
+        pool = self._pool(url)
+        if request_data and request_data.multipart_data:
+            # BaseRequest.post has replaced the unset write timeout of the upload with 20 seconds,
+            # the pool's own one applies instead
+            write_timeout = pool.media_write_timeout
+        return await pool.do_request(
+            url, method, request_data, read_timeout, write_timeout, connect_timeout, pool_timeout,
+        )
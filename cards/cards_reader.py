@@ -1,27 +1,162 @@
 import csv
+import hashlib
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
 from pathlib import Path
 from typing import List
 
 from cards.card import Card
 
+try:
+    from PIL import Image
+    HAS_PILLOW = True
+except ImportError:
+    HAS_PILLOW = False
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG markers of the frame headers, which hold the dimensions
+JPEG_FRAMES = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+@dataclass
+class ImageInfo:
+    """Metadata of the image of a card, with the error if the image can not be decoded."""
+    card_name: str
+    image_path: str
+    size: int = 0
+    sha256: str = ''
+    format: str = ''
+    width: int = 0
+    height: int = 0
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class DeckIngestion:
+    """Cards of a deck with the metadata of their images and the time every stage took."""
+    cards: List[Card]
+    images: List[ImageInfo] = field(default_factory=list)
+    listing_seconds: float = 0.0
+    parsing_seconds: float = 0.0
+    images_seconds: float = 0.0
+
+    @property
+    def invalid(self) -> List[ImageInfo]:
+        return [image for image in self.images if not image.valid]
+
+    @property
+    def seconds(self) -> float:
+        return self.listing_seconds + self.parsing_seconds + self.images_seconds
+
+
+def image_dimensions(data: bytes) -> tuple[str, int, int]:
+    """
+    Read the format and the dimensions of a PNG or JPEG image from its headers.
+
+    Args:
+        data: Content of the image file
+
+    Returns:
+        Format name, width and height
+
+    Raises:
+        ValueError: If the data is not a complete PNG or JPEG image
+    """
+    if data.startswith(PNG_SIGNATURE):
+        if len(data) < 24 or data[12:16] != b'IHDR':
+            raise ValueError('PNG header is missing')
+        if not data.rstrip(b'\x00').endswith(b'IEND\xaeB`\x82'):
+            raise ValueError('PNG is truncated')
+        width, height = struct.unpack('>II', data[16:24])
+        return 'PNG', width, height
+    if data.startswith(b'\xff\xd8'):
+        if not data.rstrip(b'\x00').endswith(b'\xff\xd9'):
+            raise ValueError('JPEG is truncated')
+        position = 2
+        while position + 4 <= len(data):
+            if data[position] != 0xFF:
+                raise ValueError(f'JPEG marker expected at {position}')
+            marker = data[position + 1]
+            if marker == 0xFF:
+                # Fill byte before a marker
+                position += 1
+                continue
+            if marker in JPEG_FRAMES:
+                if position + 9 > len(data):
+                    break
+                height, width = struct.unpack('>HH', data[position + 5:position + 9])
+                return 'JPEG', width, height
+            (length,) = struct.unpack('>H', data[position + 2:position + 4])
+            position += 2 + length
+        raise ValueError('JPEG frame header is missing')
+    raise ValueError('not a PNG or JPEG image')
+
 
 class CardsReader:
     """Reads card descriptions from CSV file and converts them to Card objects."""
 
-    def __init__(self, csv_path: str | Path, images_dir: str | Path | None = None):
+    def __init__(self, csv_path: str | Path, images_dir: str | Path | None = None, absolute_paths: bool = False):
         """
         Initialize the CardsReader with path to CSV file.
 
         Args:
             csv_path: Path to the CSV file containing card descriptions
             images_dir: Path to directory with card images (default: cards/images relative to CSV)
+            absolute_paths: Return absolute image paths, which do not depend on the working directory
         """
         self.csv_path = Path(csv_path)
+        self.absolute_paths = absolute_paths
         if images_dir is None:
             # Default: images directory next to CSV file
             self.images_dir = self.csv_path.parent / "images"
         else:
             self.images_dir = Path(images_dir)
+        # Names of the files in the images directory and the start of their paths, found once per read
+        self._image_names: set[str] | None = None
+        self._image_prefix: str | None = None
+
+    def _list_images(self) -> set[str]:
+        """
+        List the images directory once, instead of probing every name and extension of every card.
+
+        Returns:
+            Names of the files in the images directory
+
+        Raises:
+            FileNotFoundError: If the images directory doesn't exist
+        """
+        if self._image_names is None:
+            try:
+                with os.scandir(self.images_dir) as entries:
+                    self._image_names = {entry.name for entry in entries if entry.is_file()}
+            except (FileNotFoundError, NotADirectoryError):
+                raise FileNotFoundError(f"Images directory not found: {self.images_dir}")
+        return self._image_names
+
+    def _images_prefix(self) -> str:
+        """
+        The images directory as the image paths of the cards start with.
+
+        Returns:
+            Absolute path of the images directory if absolute_paths is set, else relative to the parent of the
+            CSV directory
+        """
+        if self._image_prefix is None:
+            if self.absolute_paths:
+                self._image_prefix = str(self.images_dir.resolve())
+            else:
+                # Path relative to CSV file location
+                self._image_prefix = str(self.images_dir.relative_to(self.csv_path.parent.parent))
+        return self._image_prefix
 
     def _find_image_for_card(self, card_name: str) -> str:
         """
@@ -31,23 +166,21 @@ class CardsReader:
             card_name: Name of the card
 
         Returns:
-            Relative path to the image file
+            Path to the image file, relative to the parent of the CSV directory unless absolute_paths is set
 
         Raises:
             FileNotFoundError: If no matching image file is found
         """
-        if not self.images_dir.exists():
-            raise FileNotFoundError(f"Images directory not found: {self.images_dir}")
+        image_names = self._list_images()
 
         # Common image extensions to search for
         supported_extensions = ['.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG']
 
         # Try to find file with exact card name and any supported extension
         for ext in supported_extensions:
-            image_path = self.images_dir / f"{card_name}{ext}"
-            if image_path.exists():
-                # Return path relative to CSV file location
-                return str(image_path.relative_to(self.csv_path.parent.parent))
+            file_name = f"{card_name}{ext}"
+            if file_name in image_names:
+                return os.path.join(self._images_prefix(), file_name)
 
         # If not found, raise an exception
         raise FileNotFoundError(
@@ -66,6 +199,60 @@ class CardsReader:
             FileNotFoundError: If the CSV file doesn't exist or image not found
             ValueError: If CSV file has invalid format
         """
+        # Images added since the previous read are found
+        self._image_names = self._image_prefix = None
+        return self._parse_csv()
+
+    def ingest(self, workers: int = 8) -> DeckIngestion:
+        """
+        Read cards from CSV file and check their images concurrently.
+
+        The images directory is listed once, then every image is read, hashed and its
+        headers parsed in a thread pool, which overlaps the reads of a slow volume.
+        With Pillow installed the images are also fully verified.
+
+        Args:
+            workers: Number of threads reading the images
+
+        Returns:
+            Cards, metadata of the image of every card in the same order, and timings
+
+        Raises:
+            FileNotFoundError: If the CSV file or the images directory doesn't exist
+            ValueError: If CSV file has invalid format or an image is not found
+        """
+        started = time.perf_counter()
+        self._image_names = self._image_prefix = None
+        self._list_images()
+        listed = time.perf_counter()
+        cards = self._parse_csv()
+        parsed = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest') as pool:
+            images = list(pool.map(self._inspect_image, cards))
+        return DeckIngestion(
+            cards, images, listing_seconds=listed - started, parsing_seconds=parsed - listed,
+            images_seconds=time.perf_counter() - parsed,
+        )
+
+    def _inspect_image(self, card: Card) -> ImageInfo:
+        # Relative image paths are relative to the parent of the CSV directory
+        path = self.csv_path.parent.parent / card.image_path
+        info = ImageInfo(card.name, card.image_path)
+        started = time.perf_counter()
+        try:
+            data = path.read_bytes()
+            info.size = len(data)
+            info.sha256 = hashlib.sha256(data).hexdigest()
+            info.format, info.width, info.height = image_dimensions(data)
+            if HAS_PILLOW:
+                with Image.open(BytesIO(data)) as image:
+                    image.verify()
+        except Exception as e:
+            info.error = str(e) or type(e).__name__
+        info.seconds = time.perf_counter() - started
+        return info
+
+    def _parse_csv(self) -> List[Card]:
         if not self.csv_path.exists():
             raise FileNotFoundError(f"CSV file not found: {self.csv_path}")
 
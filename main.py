@@ -1,15 +1,15 @@
-from bot.bot import error_handler
-from bot.bot import create_fallbacks
-from bot.bot import create_entry_points
-from bot.bot import create_states
+from bot.bot import build_application
+from bot.graph import analyze, log_report
+from bot.hosting import build_hosted_applications, load_hosted_bots, run_hosted
+from bot.menu import decks, main_menu_location
+from bot.sharding import run_sharded
+from bot.throttle import FloodLimit
+from bot.transport import ApiServer, PoolConfig, TransportConfig
 import logging
 import argparse
+from pathlib import Path
 
 from telegram import Update
-from telegram.ext import (
-    Application,
-    ConversationHandler,
-)
 
 from utils import prepare_logging
 prepare_logging()
@@ -19,18 +19,111 @@ logger = logging.getLogger()
 def main() -> None:
     logger.info("slavic oracle bot starting ...")
     parser = argparse.ArgumentParser(description='SlavicOracle telegram bot, metaphorical cards')
-    parser.add_argument('token', type=str, help='Telegram bot token')
+    parser.add_argument('token', type=str, nargs='?', help='Telegram bot token')
+    parser.add_argument('--config', type=Path,
+                        help='JSON file of several bots to run in one process, with their tokens, persistence files, '
+                             'admins, navigation and flood limits')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes, more than one requires --webhook-url')
+    parser.add_argument('--webhook-url', type=str, help='public URL of the webhook receiver')
+    parser.add_argument('--listen', type=str, default='0.0.0.0', help='address of the webhook receiver')
+    parser.add_argument('--port', type=int, default=8443, help='port of the webhook receiver')
+    parser.add_argument('--persistence', type=Path, help='SQLite file for conversation state and user data')
+    parser.add_argument('--analytics', type=Path, help='SQLite file for the analytics event log')
+    parser.add_argument('--admin', type=int, nargs='*', default=[], help='Telegram user ids allowed to see /stats')
+    parser.add_argument('--record', type=Path, help='file to record the anonymized incoming traffic to (.jsonl.gz)')
+    parser.add_argument('--navigation', choices=['reply', 'inline'], default='reply',
+                        help='menu keyboards: reply keyboards sending new messages or inline ones editing them')
+    parser.add_argument('--flood-rate', type=float, default=1.0, help='updates per second a user can keep sending')
+    parser.add_argument('--flood-burst', type=int, default=10, help='updates a user can send at once')
+    parser.add_argument('--shutdown-deadline', type=float, default=8.0,
+                        help='seconds to finish the updates in flight on SIGTERM, docker stop waits 10')
+    parser.add_argument('--media-cache', type=Path, help='JSON file to keep the file_ids of uploaded images in')
+    parser.add_argument('--journal', help='file of the readings of every user, shown by the "Мои расклады" button')
+    parser.add_argument('--reminders', help='SQLite file of the daily reminder subscriptions, single worker only')
+    parser.add_argument('--check-images', action='store_true',
+                        help='read and verify every card image at startup, the broken ones are logged')
+    parser.add_argument('--collage-cache', help='directory of the rendered spread collages, needs Pillow')
+    parser.add_argument('--collage-cache-mb', type=int, default=100, help='size limit of the collage directory')
+    parser.add_argument('--base-url', default='https://api.telegram.org', help='URL of a self-hosted Bot API server')
+    parser.add_argument('--local-mode', action='store_true',
+                        help='the Bot API server runs with --local and reads the images from this disk')
+    parser.add_argument('--health-port', type=int,
+                        help='port of the /healthz and /readyz endpoints')
+    parser.add_argument('--health-listen', default='127.0.0.1',
+                        help='address of the health endpoints, 0.0.0.0 for an orchestrator in another container')
+    parser.add_argument('--media-pool-size', type=int, default=8, help='connections for photo uploads')
+    parser.add_argument('--media-write-timeout', type=float, default=60.0, help='write timeout of uploads, seconds')
+    parser.add_argument('--text-pool-size', type=int, default=32, help='connections for the other API calls')
+    parser.add_argument('--read-timeout', type=float, default=5.0, help='read timeout of API calls, seconds')
+    parser.add_argument('--keepalive-expiry', type=float, default=5.0, help='idle time before closing connections')
+    parser.add_argument('--http2', action='store_true', help='use HTTP/2, requires httpx[http2]')
     args = parser.parse_args()
+    transport = TransportConfig(
+        media=PoolConfig(
+            size=args.media_pool_size, read_timeout=args.read_timeout, write_timeout=args.media_write_timeout,
+            pool_timeout=10.0, keepalive_expiry=args.keepalive_expiry,
+        ),
+        text=PoolConfig(
+            size=args.text_pool_size, read_timeout=args.read_timeout, keepalive_expiry=args.keepalive_expiry,
+        ),
+        http2=args.http2,
+    )
+    flood_limit = FloodLimit(rate=args.flood_rate, burst=args.flood_burst)
+    if args.local_mode and args.base_url == parser.get_default('base_url'):
+        parser.error('--local-mode needs the --base-url of a self-hosted Bot API server')
+    api_server = ApiServer(args.base_url, args.local_mode)
+    log_report(analyze(main_menu_location))
+    if args.check_images:
+        for deck in decks.values():
+            deck.check_images()
+
+    if args.config:
+        if args.token:
+            parser.error('the tokens of the bots are in --config')
+        if args.workers > 1 or args.record or args.reminders:
+            parser.error('--workers, --record and --reminders are not supported with --config')
+        try:
+            bots = load_hosted_bots(args.config)
+        except ValueError as e:
+            parser.error(str(e))
+        applications = build_hosted_applications(
+            bots, transport=transport, api_server=api_server, analytics_path=args.analytics,
+            media_cache_path=args.media_cache, health_port=args.health_port, health_listen=args.health_listen,
+            journal_path=args.journal, collage_cache_path=args.collage_cache,
+            collage_cache_bytes=args.collage_cache_mb * 1024 * 1024,
+        )
+        logger.info(f"hosting {len(applications)} bots...")
+        run_hosted(applications)
+        logger.info("slavic oracle bot finished")
+        return
+    if not args.token:
+        parser.error('the token or --config is required')
+
+    if args.workers > 1:
+        if not args.webhook_url:
+            parser.error('--webhook-url is required for more than one worker')
+        # The workers would write these files over each other
+        for option in ('record', 'reminders', 'journal', 'media_cache', 'collage_cache'):
+            if getattr(args, option):
+                parser.error(f'--{option.replace("_", "-")} is supported with a single worker only')
+        persistence = args.persistence or Path('oracle.sqlite')
+        run_sharded(
+            args.token, args.workers, args.webhook_url, args.listen, args.port, persistence, args.analytics, args.admin,
+            transport, args.navigation, flood_limit, api_server, args.shutdown_deadline,
+        )
+        logger.info("slavic oracle bot finished")
+        return
 
     logger.info("conversation preparing...")
-    application = Application.builder().token(args.token).build()
-    conv_handler = ConversationHandler(
-        entry_points=create_entry_points(),
-        states=create_states(),
-        fallbacks=create_fallbacks(),
+    application = build_application(
+        args.token, args.persistence, analytics_path=args.analytics, admins=args.admin, transport=transport,
+        record_path=args.record, navigation=args.navigation, flood_limit=flood_limit,
+        shutdown_deadline=args.shutdown_deadline, media_cache_path=args.media_cache, health_port=args.health_port,
+        health_listen=args.health_listen, journal_path=args.journal, collage_cache_path=args.collage_cache,
+        collage_cache_bytes=args.collage_cache_mb * 1024 * 1024, api_server=api_server,
+        reminders_path=args.reminders,
     )
-    application.add_handler(conv_handler)
-    application.add_error_handler(error_handler)
 
     logger.info("run polling...")
     application.run_polling(allowed_updates=Update.ALL_TYPES, bootstrap_retries=-1)
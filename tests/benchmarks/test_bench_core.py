@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from benchmarks.bench_core import CASES, SIZES, compare, run
+
+BASELINE = Path(__file__).parents[2] / 'benchmarks' / 'baseline.json'
+
+
+class TestCompare:
+    """Test suite for compare function."""
+
+    def test_only_slowdowns_over_tolerance_are_regressions(self) -> None:
+        """Test that a path slower than the baseline by more than the tolerance is reported, others are not."""
+        baseline = {'Deck.render': {'41': 0.001, '1000': 0.001}, 'utils.unique': {'41': 0.001}}
+        results = {'Deck.render': {'41': 0.00124, '1000': 0.0013}, 'utils.unique': {'41': 0.0001}}
+
+        regressions = compare(results, baseline, tolerance=0.25)
+
+        assert regressions == ['Deck.render at 1000 cards: 1.3000 ms, baseline 1.0000 ms']
+
+    def test_paths_missing_in_baseline_are_skipped(self) -> None:
+        """Test that new paths and sizes are not compared with anything."""
+        assert compare({'new path': {'41': 1.0}, 'Deck.render': {'7': 1.0}}, {'Deck.render': {'41': 0.1}}, 0.25) == []
+
+
+class TestBaseline:
+    """Test suite for the committed baseline."""
+
+    def test_baseline_covers_every_case(self) -> None:
+        """Test that the baseline has every path at every size, so no path goes unchecked."""
+        baseline = json.loads(BASELINE.read_text(encoding='utf-8'))
+
+        assert sorted(baseline) == sorted(case.name for case in CASES)
+        for sizes in baseline.values():
+            assert sorted(sizes, key=int) == [str(size) for size in SIZES]
+
+    def test_run_can_be_compared_with_baseline(self) -> None:
+        """Test that a quick run produces results of the baseline's shape."""
+        results = run([41], repeats=1, min_time=0)
+        baseline = json.loads(BASELINE.read_text(encoding='utf-8'))
+
+        assert results.keys() == baseline.keys()
+        assert compare(results, baseline, tolerance=float('inf')) == []
@@ -0,0 +1,101 @@
+from pathlib import Path
+from unittest.mock import Mock
+
+import pytest
+
+from bot.analytics import SPREAD_SEPARATOR, Analytics, Event, begin_update, finish_update, record_draw, report
+from bot.deck import SPREAD_KEY, Deck, SpreadLocation
+from cards.card import Card
+
+
+class TestAnalytics:
+    """Test suite for Analytics class."""
+
+    @pytest.fixture
+    def db_path(self, tmp_path: Path) -> Path:
+        return tmp_path / 'analytics.sqlite'
+
+    def test_record_is_noop_when_disabled(self) -> None:
+        """Test that nothing is buffered until a store is opened."""
+        analytics = Analytics()
+        analytics.record(Event(0.0, 'draw', 1, card='Лес'))
+
+        assert not analytics.enabled
+        assert len(analytics._buffer) == 0
+
+    def test_full_buffer_drops_oldest_events(self, db_path: Path) -> None:
+        """Test that the ring buffer overwrites the oldest events and counts them."""
+        analytics = Analytics(capacity=2)
+        analytics.open(db_path, set())
+        for card in ('Лес', 'Волк', 'Мара'):
+            analytics.record(Event(0.0, 'draw', 1, card=card))
+
+        assert [event.card for event in analytics._buffer] == ['Волк', 'Мара']
+        assert analytics.dropped == 1
+
+    def test_location_of_hides_free_text(self, db_path: Path) -> None:
+        """Test that only known button texts are stored as locations."""
+        analytics = Analytics()
+        analytics.open(db_path, {'Взять карту'})
+
+        assert analytics.location_of('Взять карту') == 'Взять карту'
+        assert analytics.location_of('my secret') == '<text>'
+
+    @pytest.mark.asyncio
+    async def test_flush_writes_batch_and_reports(self, db_path: Path) -> None:
+        """Test that flushed events are aggregated by the offline reports."""
+        analytics = Analytics()
+        analytics.open(db_path, set())
+        analytics.record(Event(0.0, 'draw', 1, card='Лес', latency_ms=10))
+        analytics.record(Event(0.0, 'draw', 2, card='Лес', latency_ms=20))
+        analytics.record(Event(0.0, 'draw', 2, card='Волк', latency_ms=30))
+        analytics.record(Event(0.0, 'navigation', 2, location='Взять карту', latency_ms=30))
+        await analytics.flush()
+
+        assert len(analytics._buffer) == 0
+        assert report(db_path, 'cards') == [('Лес', 2), ('Волк', 1)]
+        assert report(db_path, 'daily') == [('1970-01-01', 2)]
+        assert report(db_path, 'latency') == [(0, 1, 30.0, 30.0)]
+
+    @pytest.mark.asyncio
+    async def test_draws_are_recorded_with_update(self, db_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that draws noted by handlers are recorded when the update is finished."""
+        analytics = Analytics()
+        analytics.open(db_path, {'Взять карту'})
+        monkeypatch.setattr('bot.analytics.analytics', analytics)
+        update = Mock()
+        update.effective_user.id = 7
+        update.message.text = 'Взять карту'
+        context = Mock()
+
+        await begin_update(update, context)
+        record_draw(context, 'Лес')
+        await finish_update(update, context)
+
+        kinds = [(event.kind, event.user_id, event.card, event.location) for event in analytics._buffer]
+        assert kinds == [('navigation', 7, None, 'Взять карту'), ('draw', 7, 'Лес', None)]
+        assert all(event.latency_ms is not None for event in analytics._buffer)
+
+    @pytest.mark.asyncio
+    async def test_spread_is_recorded_once(self, db_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a spread is one spread event with its cards in order, besides the draws of the cards."""
+        analytics = Analytics()
+        analytics.open(db_path, {'Расклад на три карты'})
+        monkeypatch.setattr('bot.analytics.analytics', analytics)
+        deck = Deck('Тест', [Card(f'Карта {index}', '', '', '', '') for index in range(10)], 'Взять карту')
+        location = SpreadLocation('Тестовый расклад', {deck.name: deck})
+        update = Mock()
+        update.effective_user.id = 7
+        update.message.text = 'Расклад на три карты'
+        context = Mock(user_data={})
+
+        await begin_update(update, context)
+        location.show_spread(context, deck)
+        await finish_update(update, context)
+
+        _, indexes = context.user_data[SPREAD_KEY]
+        names = [deck.cards[index].name for index in indexes]
+        events = [(event.kind, event.card) for event in analytics._buffer]
+        assert events == [('navigation', None)] + [('draw', name) for name in names] + [
+            ('spread', SPREAD_SEPARATOR.join(names)),
+        ]
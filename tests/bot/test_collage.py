@@ -0,0 +1,133 @@
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Sequence
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from bot import deck as deck_module
+from bot.collage import CollageCache, render_collage
+from bot.deck import SPREAD_KEY, Deck, SpreadLocation
+from cards.card import Card
+
+BOT = Mock(token='1:first')
+
+
+class FakeRender:
+    """Renders a collage as the joined image paths, padded to the size."""
+
+    def __init__(self, size: int = 100) -> None:
+        self.size = size
+        self.calls: list[list[str]] = []
+
+    def __call__(self, image_paths: Sequence[str]) -> bytes:
+        self.calls.append(list(image_paths))
+        return '|'.join(image_paths).encode().ljust(self.size, b' ')
+
+
+class TestCollageCache:
+    """Test suite for CollageCache class."""
+
+    @pytest.mark.asyncio
+    async def test_repeated_spread_is_rendered_once(self, tmp_path: Path) -> None:
+        """Test that a cached collage is not rendered again, and its file_id is sent after the upload."""
+        render = FakeRender()
+        cache = CollageCache(render)
+        cache.open(tmp_path)
+        key = CollageCache.key('deck', (1, 2, 3))
+
+        path = await cache.get(key, ['a.png', 'b.png', 'c.png'])
+        assert path and await cache.get(key, ['a.png', 'b.png', 'c.png']) == path
+        assert len(render.calls) == 1
+        assert cache.photo(path, BOT) == Path(path)
+
+        cache.remember_file_id(path, BOT, Mock(photo=[Mock(file_id='small'), Mock(file_id='large')]))
+        assert cache.photo(path, BOT) == 'large'
+        # A file_id of another bot is not valid for this one
+        assert cache.photo(path, Mock(token='2:second')) == Path(path)
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_are_evicted(self, tmp_path: Path) -> None:
+        """Test that the least recently used collages are removed over the byte budget."""
+        cache = CollageCache(FakeRender(size=100))
+        cache.open(tmp_path, max_bytes=250)
+        first = await cache.get('d-1', ['1'])
+        await cache.get('d-2', ['2'])
+        await cache.get('d-1', ['1'])
+        await cache.get('d-3', ['3'])
+
+        assert cache.total_bytes == 200
+        assert cache.cached('d-2') is None and not (tmp_path / 'd-2.jpg').exists()
+        assert cache.cached('d-1') == first and cache.cached('d-3')
+
+    @pytest.mark.asyncio
+    async def test_index_survives_restart(self, tmp_path: Path) -> None:
+        """Test that the collages and their file_ids are restored from the directory."""
+        cache = CollageCache(FakeRender())
+        cache.open(tmp_path)
+        path = await cache.get('d-1-2', ['1', '2'])
+        assert path
+        cache.remember_file_id(path, BOT, Mock(photo=[Mock(file_id='id')]))
+        cache.close()
+
+        render = FakeRender()
+        restored = CollageCache(render)
+        restored.open(tmp_path)
+        assert await restored.get('d-1-2', ['1', '2']) == path
+        assert restored.photo(path, BOT) == 'id'
+        assert render.calls == []
+
+    @pytest.mark.asyncio
+    async def test_failed_render_is_not_cached(self, tmp_path: Path) -> None:
+        """Test that a collage of missing images is skipped, so the spread is sent as text."""
+        cache = CollageCache(Mock(side_effect=FileNotFoundError('a.png')))
+        cache.open(tmp_path)
+        assert await cache.get('d-1', ['a.png']) is None
+        assert cache.cached('d-1') is None
+
+
+def test_render_collage(tmp_path: Path) -> None:
+    """Test that the images are scaled to the collage height and placed side by side."""
+    image_module = pytest.importorskip('PIL.Image')
+    paths = []
+    for index, size in enumerate([(100, 200), (300, 600)]):
+        paths.append(str(tmp_path / f'{index}.png'))
+        image_module.new('RGBA', size, (255, 0, 0, 255)).save(paths[-1])
+
+    data = render_collage(paths, height=100)
+    (tmp_path / 'collage.jpg').write_bytes(data)
+    with image_module.open(tmp_path / 'collage.jpg') as collage:
+        assert collage.format == 'JPEG'
+        assert collage.size == (50 + 50 + 16 * 3, 100 + 16 * 2)
+
+
+class TestSpreadLocation:
+    """Test suite for SpreadLocation class."""
+
+    @pytest.mark.asyncio
+    async def test_spread_is_sent_as_one_collage(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a spread is one photo of the collage, uploaded once, and text without collages."""
+        render = FakeRender()
+        cache = CollageCache(render)
+        monkeypatch.setattr(deck_module, 'collages', cache)
+        cards = [Card(f'Карта {index}', '', '', f'слово {index}', f'{index}.png') for index in range(10)]
+        deck = Deck('Тест', cards, 'Взять карту', 'Расклад')
+        spread = SpreadLocation('Тестовый расклад', {deck.name: deck})
+        context: Any = SimpleNamespace(user_data={}, bot=BOT)
+        update = Mock()
+        update.message.reply_photo = AsyncMock(return_value=Mock(photo=[Mock(file_id='collage')]))
+        update.message.reply_text = AsyncMock()
+
+        spread.show_spread(context, deck)
+        await spread.send_welcome_message(update, context)
+        update.message.reply_text.assert_called_once()
+        assert '<b>Будущее:' in update.message.reply_text.call_args.args[0]
+
+        cache.open(tmp_path)
+        await spread.send_welcome_message(update, context)
+        await spread.send_welcome_message(update, context)
+        photos = [call.kwargs['photo'] for call in update.message.reply_photo.call_args_list]
+        _, indexes = context.user_data[SPREAD_KEY]
+        assert isinstance(photos[0], Path) and photos[1] == 'collage'
+        assert len(set(indexes)) == 3
+        assert render.calls == [[f'{index}.png' for index in indexes]]
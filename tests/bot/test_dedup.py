@@ -0,0 +1,96 @@
+from unittest.mock import Mock
+
+import pytest
+from telegram.ext import ApplicationHandlerStop
+
+from bot.dedup import CHAT_RECENT_UPDATES, RECENT_UPDATES_KEY, RecentUpdates, skip_duplicate
+
+
+class TestRecentUpdates:
+    """Test suite for RecentUpdates class."""
+
+    def test_keeps_only_last_ids(self) -> None:
+        """Test that the oldest ids are forgotten past the capacity."""
+        recent = RecentUpdates(capacity=2)
+        for update_id in (1, 2, 3):
+            recent.add(update_id)
+
+        assert 1 not in recent
+        assert 2 in recent and 3 in recent
+        assert len(recent) == 2
+
+
+class TestSkipDuplicate:
+    """Test suite for skip_duplicate handler."""
+
+    @pytest.fixture(autouse=True)
+    def recent(self, monkeypatch: pytest.MonkeyPatch) -> RecentUpdates:
+        recent = RecentUpdates()
+        monkeypatch.setattr('bot.dedup.recent_updates', recent)
+        return recent
+
+    @staticmethod
+    def make_update(update_id: int) -> Mock:
+        update = Mock()
+        update.update_id = update_id
+        return update
+
+    @pytest.mark.asyncio
+    async def test_new_update_is_marked_in_chat_data(self) -> None:
+        """Test that a new update passes and is added to the recent ids of the chat."""
+        context = Mock()
+        context.chat_data = {}
+
+        await skip_duplicate(self.make_update(10), context)
+
+        assert list(context.chat_data[RECENT_UPDATES_KEY]) == [10]
+
+    @pytest.mark.asyncio
+    async def test_replayed_update_is_skipped_after_restart(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that an update in the persisted ids is stopped even with empty memory."""
+        context = Mock()
+        context.chat_data = {}
+        for update_id in (9, 10):
+            await skip_duplicate(self.make_update(update_id), context)
+        monkeypatch.setattr('bot.dedup.recent_updates', RecentUpdates())
+
+        with pytest.raises(ApplicationHandlerStop):
+            await skip_duplicate(self.make_update(10), context)
+        with pytest.raises(ApplicationHandlerStop):
+            await skip_duplicate(self.make_update(9), context)
+        await skip_duplicate(self.make_update(11), context)
+
+    @pytest.mark.asyncio
+    async def test_update_ids_starting_anew_are_handled(self) -> None:
+        """Test that updates with smaller ids than the handled ones pass, as after a week without updates."""
+        context = Mock()
+        context.chat_data = {}
+        await skip_duplicate(self.make_update(500000), context)
+
+        await skip_duplicate(self.make_update(17), context)
+        await skip_duplicate(self.make_update(18), context)
+        with pytest.raises(ApplicationHandlerStop):
+            await skip_duplicate(self.make_update(17), context)
+
+    @pytest.mark.asyncio
+    async def test_recent_ids_of_a_chat_are_bounded(self) -> None:
+        """Test that a chat keeps only its last ids, the older ones are forgotten."""
+        context = Mock()
+        context.chat_data = {'last_update_id': 5}
+        for update_id in range(CHAT_RECENT_UPDATES + 1):
+            await skip_duplicate(self.make_update(update_id), context)
+
+        assert len(context.chat_data[RECENT_UPDATES_KEY]) == CHAT_RECENT_UPDATES
+        assert 0 not in context.chat_data[RECENT_UPDATES_KEY]
+        assert 'last_update_id' not in context.chat_data
+
+    @pytest.mark.asyncio
+    async def test_update_without_chat_uses_recent_ids(self) -> None:
+        """Test that updates without a chat are deduplicated by the recent ids."""
+        context = Mock()
+        context.chat_data = None
+        context.user_data = None
+
+        await skip_duplicate(self.make_update(5), context)
+        with pytest.raises(ApplicationHandlerStop):
+            await skip_duplicate(self.make_update(5), context)
@@ -0,0 +1,79 @@
+import json
+
+from bot.graph import analyze, to_dot, to_json
+from bot.location import FuncLocation, MenuLocation, Message
+
+
+def make_menu(name: str, is_implemented: bool = True) -> MenuLocation:
+    menu = MenuLocation(name=name, welcome_message=Message(name))
+    menu._is_implemented = is_implemented
+    return menu
+
+
+class TestAnalyze:
+    """Test suite for the location graph analysis."""
+
+    def test_wired_menu_has_no_issues(self) -> None:
+        """Test that a properly wired menu is reported clean."""
+        root, child = make_menu('Root'), make_menu('Child')
+        child.add_func_button('Again', lambda: child, [child])
+        child.add_back_buttons([root])
+        root.add_children_buttons([child])
+
+        report = analyze(root)
+
+        assert report.states == 2
+        assert report.issues == []
+        assert ('Child', 'Back to Root', 'Root') in report.edges
+
+    def test_back_buttons_before_children(self) -> None:
+        """Test that wiring mistakes logged at runtime are reported."""
+        root, child = make_menu('Root'), make_menu('Child')
+        root.add_children_buttons([child])
+        child.add_back_buttons([root])
+
+        messages = [issue.message for issue in analyze(root).errors]
+
+        assert 'back buttons added before children buttons' in messages
+        assert 'state has no handlers, users get stuck in it' in messages
+
+    def test_unreachable_state(self) -> None:
+        """Test that a child without a button leading to it is reported."""
+        root, child, orphan = make_menu('Root'), make_menu('Child'), make_menu('Orphan')
+        root.add_children_buttons([child])
+        root._children.append(orphan)
+        orphan.add_back_buttons([root])
+
+        issues = [(issue.location, issue.message) for issue in analyze(root).errors]
+
+        assert ('Orphan', 'state is unreachable, no button leads to it') in issues
+
+    def test_regex_unsafe_and_ambiguous_buttons(self) -> None:
+        """Test that buttons which can't be pressed or are shadowed are reported."""
+        root = make_menu('Root')
+        soon = make_menu('Later', is_implemented=False)  # gets the " (soon)" suffix
+        card, cards = make_menu('Card'), make_menu('Card deck')
+        root.add_children_buttons([soon, card, cards])
+
+        messages = [issue.message for issue in analyze(root).issues]
+
+        assert 'button "Later (soon)" does not match its own regex, it can never be pressed' in messages
+        assert 'button "Card deck" is ambiguous with button "Card"' in messages
+
+    def test_missing_redirect(self) -> None:
+        """Test that a function location without redirect is reported."""
+        root, func = make_menu('Root'), FuncLocation('Func', text_func=str.upper)
+        func.prepare_handler()
+        root.add_children_buttons([func])
+
+        assert ('Func', 'redirect is not set') in [(issue.location, issue.message) for issue in analyze(root).errors]
+
+    def test_json_and_dot_output(self) -> None:
+        """Test that the report is exported as JSON and DOT."""
+        root, child = make_menu('Root'), make_menu('Child')
+        child.add_func_button('Again', lambda: child, [child])
+        root.add_children_buttons([child])
+        report = analyze(root)
+
+        assert json.loads(to_json(report))['states'] == 2
+        assert '"Root" -> "Child" [label="Child"];' in to_dot(report)
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+from typing import Any
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram import Update
+from telegram.error import NetworkError
+
+from bot.bot import build_application
+from bot.health import LoopMonitor, monitor
+from bot.offline import OfflineRequest
+from bot.shutdown import TrackingUpdateProcessor, coordinator
+
+
+def make_application(processor: TrackingUpdateProcessor) -> Mock:
+    application = Mock()
+    application.update_processor = processor
+    application.bot.get_me = AsyncMock()
+    return application
+
+
+def get(port: int, path: str) -> tuple[int, dict[str, Any]]:
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+class TestLoopMonitor:
+    """Test suite for LoopMonitor class."""
+
+    @pytest.mark.asyncio
+    async def test_blocking_callback_is_reported_with_its_button(self, caplog: pytest.LogCaptureFixture) -> None:
+        """Test that a callback blocking the loop counts as a stall and is logged with the button pressed."""
+        monitor = LoopMonitor(interval=0.01, threshold=0.1)
+        monitor.buttons = {'Взять карту'}
+        processor = TrackingUpdateProcessor()
+        monitor.start(make_application(processor))
+        try:
+            await asyncio.sleep(0.05)
+            assert monitor.is_healthy()
+
+            async def handler() -> None:
+                time.sleep(0.4)
+
+            update = Mock(spec=Update, update_id=1)
+            update.message.text = 'Взять карту'
+            await processor.process_update(update, handler())
+            await asyncio.sleep(0.05)
+        finally:
+            monitor.stop()
+
+        assert monitor.stalls == 1
+        assert (monitor.lags.quantile(1.0) or 0) > 100
+        assert "handling ['Взять карту']" in caplog.text
+        assert 'handler' in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_endpoints(self, unused_tcp_port: int) -> None:
+        """Test that /readyz follows the shutdown coordinator and Telegram, /healthz the loop."""
+        monitor = LoopMonitor(interval=0.01, threshold=1.0)
+        monitor.port = unused_tcp_port
+        monitor.start(make_application(TrackingUpdateProcessor()))
+        try:
+            await asyncio.sleep(0.05)
+            coordinator.ready = True
+            status, body = await asyncio.to_thread(get, unused_tcp_port, '/readyz')
+            assert status == 200
+            assert body['telegram'] and body['decks']['Славянский оракул'] > 0
+
+            coordinator.ready = False
+            status, _ = await asyncio.to_thread(get, unused_tcp_port, '/readyz')
+            assert status == 503
+            status, body = await asyncio.to_thread(get, unused_tcp_port, '/healthz')
+            assert status == 200
+            assert body['stalls'] == 0
+        finally:
+            coordinator.ready = False
+            monitor.stop()
+
+    @pytest.mark.asyncio
+    async def test_every_bot_is_pinged(self) -> None:
+        """Test that the bots of a hosting config are pinged each with its own token, and one failing is not ready."""
+        monitor = LoopMonitor(interval=0.01)
+        first, second = make_application(TrackingUpdateProcessor()), make_application(TrackingUpdateProcessor())
+        first.bot.token, second.bot.token = '1:a', '2:b'
+        second.bot.get_me = AsyncMock(side_effect=NetworkError('unreachable'))
+        coordinator.ready = True
+        monitor.start(first)
+        monitor.watch(second)
+        try:
+            await asyncio.sleep(0.05)
+            assert monitor.status()['bots'] == {'1': True, '2': False}
+            assert not monitor.is_ready()
+        finally:
+            coordinator.ready = False
+            monitor.stop()
+
+    @pytest.mark.asyncio
+    async def test_endpoints_listen_on_the_given_address(self, unused_tcp_port: int) -> None:
+        """Test that the listen address of build_application is used, so the endpoints are reachable from outside."""
+        build_application('0:offline', request=OfflineRequest(), health_port=unused_tcp_port, health_listen='0.0.0.0')
+        assert (monitor.port, monitor.listen) == (unused_tcp_port, '0.0.0.0')
+
+        monitor.start(make_application(TrackingUpdateProcessor()))
+        try:
+            assert monitor._server and monitor._server.server_address[0] == '0.0.0.0'
+            status, _ = await asyncio.to_thread(get, unused_tcp_port, '/healthz')
+            assert status == 200
+        finally:
+            monitor.stop()
+            monitor.port, monitor.listen = None, '127.0.0.1'
@@ -0,0 +1,136 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any
+from unittest.mock import AsyncMock
+
+import pytest
+from telegram import Update
+
+from bot.dedup import RecentUpdates
+from bot.health import monitor
+from bot.hosting import HostedBot, build_hosted_applications, host, load_hosted_bots
+from bot.offline import OfflineRequest
+from bot.shutdown import coordinator
+from bot.throttle import COALESCED, DROPPED, NOTIFIED, FloodLimit
+from bot.transport import RoutingRequest
+
+
+def write_config(path: Path, bots: list[dict[str, Any]]) -> Path:
+    path.write_text(json.dumps({'bots': bots}), encoding='utf-8')
+    return path
+
+
+def make_message(update_id: int, text: str) -> dict[str, Any]:
+    user = {'id': 42, 'is_bot': False, 'first_name': 'Анна'}
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 1700000000, 'text': text, 'chat': {'id': 42, 'type': 'private'},
+        'from': user,
+    }}
+
+
+def make_command(update_id: int, text: str) -> dict[str, Any]:
+    update = make_message(update_id, text)
+    update['message']['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return update
+
+
+class TestLoadHostedBots:
+    """Test suite for load_hosted_bots function."""
+
+    def test_bots_with_defaults(self, tmp_path: Path) -> None:
+        """Test that every bot gets its own options, missing ones take the defaults."""
+        config = write_config(tmp_path / 'bots.json', [
+            {'token': '1:a', 'persistence': 'a.sqlite', 'admins': [7], 'navigation': 'inline', 'flood_rate': 2},
+            {'token': '2:b'},
+        ])
+        assert load_hosted_bots(config) == [
+            HostedBot('1:a', 'a.sqlite', (7,), 'inline', FloodLimit(rate=2.0, burst=10)),
+            HostedBot('2:b'),
+        ]
+
+    @pytest.mark.parametrize('bots, error', [
+        ([], 'no bots'),
+        ([{'persistence': 'a.sqlite'}], 'no token'),
+        ([{'token': '1:a', 'theme': 'forest'}], 'unknown fields'),
+        ([{'token': '1:a'}, {'token': '1:a'}], 'token'),
+        ([{'token': '1:a', 'persistence': 'a.sqlite'}, {'token': '2:b', 'persistence': 'a.sqlite'}], 'persistence'),
+    ])
+    def test_invalid_config(self, tmp_path: Path, bots: list[dict[str, Any]], error: str) -> None:
+        """Test that a config the bots can not run with is refused before starting."""
+        with pytest.raises(ValueError, match=error):
+            load_hosted_bots(write_config(tmp_path / 'bots.json', bots))
+
+
+class TestHost:
+    """Test suite for the hosting of several bots."""
+
+    def test_bots_share_connection_pools(self) -> None:
+        """Test that the API calls of all the bots go through one request, the polls through their own."""
+        first, second = build_hosted_applications([HostedBot('1:a'), HostedBot('2:b')])
+        assert isinstance(first.bot.request, RoutingRequest) and first.bot.request is second.bot.request
+        assert first.bot._request[0] is not second.bot._request[0]
+
+    def test_shared_options_survive_the_later_bots(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that building the second bot keeps the health endpoint and the deadline given to the first one."""
+        monkeypatch.setattr(monitor, 'port', None)
+        monkeypatch.setattr(monitor, 'listen', '127.0.0.1')
+        monkeypatch.setattr(coordinator, 'deadline', None)
+        build_hosted_applications(
+            [HostedBot('1:a'), HostedBot('2:b')], request=OfflineRequest(),
+            health_port=9000, health_listen='0.0.0.0', shutdown_deadline=8.0,
+        )
+
+        assert (monitor.port, monitor.listen, coordinator.deadline) == (9000, '0.0.0.0', 8.0)
+
+    @pytest.mark.asyncio
+    async def test_admins_are_per_bot(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the admin of one bot gets /stats from it only, and is throttled by the other one."""
+        monkeypatch.setattr('bot.dedup.recent_updates', RecentUpdates())
+        dropped = {COALESCED: 0, NOTIFIED: 0, DROPPED: 0}
+        monkeypatch.setattr('bot.throttle.dropped_updates', dropped)
+        show_stats = AsyncMock(return_value=None)
+        monkeypatch.setattr('bot.bot.show_stats', show_stats)
+        limit = FloodLimit(rate=0.0, burst=1)
+        first, second = build_hosted_applications(
+            [HostedBot('1:a', admins=(42,), flood_limit=limit), HostedBot('2:b', flood_limit=limit)],
+            request=OfflineRequest(),
+        )
+        async with first, second:
+            for update_id, command in enumerate(['/stats', '/start', '/stats']):
+                await first.process_update(Update.de_json(make_command(update_id, command), first.bot))
+                await second.process_update(Update.de_json(make_command(update_id, command), second.bot))
+
+        assert [call.args[0].get_bot() for call in show_stats.call_args_list] == [first.bot, first.bot]
+        assert dropped[NOTIFIED] == 1
+
+    @pytest.mark.asyncio
+    async def test_bots_are_throttled_separately(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the bots run in one loop and a user over the limit of one bot still uses the other."""
+        monkeypatch.setattr('bot.dedup.recent_updates', RecentUpdates())
+        dropped = {COALESCED: 0, NOTIFIED: 0, DROPPED: 0}
+        monkeypatch.setattr('bot.throttle.dropped_updates', dropped)
+        request = OfflineRequest()
+        limit = FloodLimit(rate=0.0, burst=1)
+        applications = build_hosted_applications(
+            [HostedBot('1:a', flood_limit=limit), HostedBot('2:b', flood_limit=limit)], request=request,
+        )
+        stop = asyncio.Event()
+        hosting = asyncio.create_task(host(applications, stop))
+        while not all(application.running for application in applications):
+            await asyncio.sleep(0.01)
+
+        first, second = applications
+        await first.process_update(Update.de_json(make_message(1, '/start'), first.bot))
+        await first.process_update(Update.de_json(make_message(2, 'О нас'), first.bot))
+        assert dropped[NOTIFIED] == 1
+        sent = request.calls['sendMessage']
+        # The same update id from another bot is a different update
+        await second.process_update(Update.de_json(make_message(1, '/start'), second.bot))
+        assert dropped[NOTIFIED] == 1
+        assert request.calls['sendMessage'] > sent
+
+        stop.set()
+        await asyncio.wait_for(hosting, 5)
+        assert request.calls['getUpdates'] >= 2
+        assert not any(application.running for application in applications)
@@ -0,0 +1,137 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+from telegram import Update
+
+from bot.dedup import RecentUpdates
+from bot import inline
+from bot.bot import build_application
+from bot.inline import inline_keyboard, location_key
+from bot.deck import CARD_VIEW_KEY
+from bot.location import Location, MenuLocation
+from bot.menu import card_view_location, decks, main_menu_location
+from bot.offline import OfflineRequest
+
+USER = {'id': 42, 'is_bot': False, 'first_name': 'Анна'}
+CHAT = {'id': 42, 'type': 'private'}
+
+
+def make_command(update_id: int, text: str) -> dict[str, Any]:
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 1700000000, 'text': text, 'chat': CHAT, 'from': USER,
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+    }}
+
+
+def make_press(update_id: int, location: MenuLocation, button: str, photo: bool) -> dict[str, Any]:
+    keyboard = inline_keyboard(location)
+    assert keyboard
+    data = next(key.callback_data for row in keyboard.inline_keyboard for key in row if key.text == button)
+    message: dict[str, Any] = {'message_id': 1, 'date': 1700000000, 'chat': CHAT}
+    if photo:
+        message['photo'] = [{'file_id': 'photo', 'file_unique_id': 'photo', 'width': 1, 'height': 1}]
+    else:
+        message['text'] = 'menu'
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': USER, 'chat_instance': '1', 'data': data, 'message': message,
+    }}
+
+
+class TestInlineNavigation:
+    """Test suite for the inline keyboard navigation."""
+
+    @pytest.fixture(autouse=True)
+    def fresh_caches(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr('bot.dedup.recent_updates', RecentUpdates())
+        monkeypatch.setattr('bot.inline.file_ids', {})
+
+    def test_callback_data_fits_telegram_limit(self) -> None:
+        """Test that every button of the menu gets short callback data with the location key."""
+        keyboard = inline_keyboard(main_menu_location)
+        assert keyboard
+        buttons = [button for row in keyboard.inline_keyboard for button in row]
+
+        hidden = main_menu_location.hidden_buttons()
+        assert [button.text for button in buttons] == [
+            name for name in main_menu_location._get_button_names() if name not in hidden
+        ]
+        for button in buttons:
+            assert isinstance(button.callback_data, str)
+            assert location_key(main_menu_location) in button.callback_data
+            assert len(button.callback_data.encode()) <= 64
+
+    @pytest.mark.asyncio
+    async def test_next_card_edits_message_with_cached_photo(self) -> None:
+        """Test that drawing another card edits the photo in place, uploaded images are sent by file_id."""
+        request = OfflineRequest()
+        application = build_application('0:offline', request=request, navigation='inline')
+        async with application:
+            await application.process_update(Update.de_json(make_command(1, '/start'), application.bot))
+            assert request.calls['sendMessage'] == 1
+
+            press = make_press(2, main_menu_location, 'Взять карту', photo=False)
+            await application.process_update(Update.de_json(press, application.bot))
+            assert request.calls['sendPhoto'] == 1
+            assert request.calls['deleteMessage'] == 1
+
+            deck_name, index = application.user_data[42][CARD_VIEW_KEY]
+            assert inline.media_key(application.bot, decks[deck_name].cards[index].image_path) in inline.file_ids
+            for card in decks[deck_name].cards:
+                inline.file_ids.setdefault(inline.media_key(application.bot, card.image_path), 'uploaded')
+            uploaded = request.sent_bytes
+            press = make_press(3, card_view_location, 'Взять ещё одну карту', photo=True)
+            await application.process_update(Update.de_json(press, application.bot))
+
+        assert request.calls['editMessageMedia'] == 1
+        assert request.calls['sendPhoto'] == 1
+        assert request.calls['answerCallbackQuery'] == 2
+        # Only the file_id of the next card is sent, not the image
+        assert request.sent_bytes - uploaded < 10_000
+
+    @pytest.mark.asyncio
+    async def test_outdated_button_is_answered(self) -> None:
+        """Test that a button of an unknown location only answers the callback query."""
+        request = OfflineRequest()
+        application = build_application('0:offline', request=request, navigation='inline')
+        press = make_press(1, main_menu_location, 'О нас', photo=False)
+        press['callback_query']['data'] = 'nav:00000000:0'
+        async with application:
+            await application.process_update(Update.de_json(press, application.bot))
+
+        assert request.calls['answerCallbackQuery'] == 1
+        assert not request.calls['editMessageText'] and not request.calls['sendMessage']
+
+    def test_unknown_keys_do_not_rebuild_the_map(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the key map is built once and stale or forged keys are a lookup miss."""
+        monkeypatch.setattr('bot.inline._locations_by_key', {})
+        calls = []
+
+        def counted_key(location: Location) -> str:
+            calls.append(location)
+            return location_key(location)
+
+        monkeypatch.setattr('bot.inline.location_key', counted_key)
+        assert inline.find_by_key(location_key(main_menu_location)) is main_menu_location
+        built = len(calls)
+        for key in ('00000000', 'ffffffff', 'forged'):
+            assert inline.find_by_key(key) is None
+        assert len(calls) == built
+
+
+class TestMediaCache:
+    """Test suite for the file_id cache kept between runs."""
+
+    def test_file_ids_survive_restart(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that saved file_ids are loaded by the next run."""
+        path = tmp_path / 'media.json'
+        monkeypatch.setattr('bot.inline._cache_path', None)
+        monkeypatch.setattr('bot.inline.file_ids', {})
+        inline.open_media_cache(path)
+        inline.file_ids['cards/images/Лес.png'] = 'file-1'
+        inline.close_media_cache()
+
+        monkeypatch.setattr('bot.inline.file_ids', {})
+        inline.open_media_cache(path)
+
+        assert inline.file_ids == {'cards/images/Лес.png': 'file-1'}
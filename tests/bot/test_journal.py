@@ -0,0 +1,125 @@
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram import ReplyKeyboardMarkup
+
+from bot.deck import Deck, get_card_with_history
+from bot.inline import inline_keyboard
+from bot.journal import RECORD, Journal, JournalView, Reading, deck_key, journal, write_readings
+from bot.menu import main_menu_location
+from cards.card import Card
+
+
+@pytest.fixture
+def journal_path(tmp_path: Path) -> Path:
+    return tmp_path / 'readings.bin'
+
+
+def make_deck(size: int) -> Deck:
+    return Deck('Тест', [Card(f'Карта {index}', '', '', '', '') for index in range(size)], 'Взять карту')
+
+
+class TestJournal:
+    """Test suite for Journal class."""
+
+    def test_pages_are_newest_first(self, journal_path: Path) -> None:
+        """Test that the pages of a user hold only their readings, from the newest one."""
+        store = Journal()
+        store.open(journal_path)
+        for card in range(25):
+            store.append(Reading(1, 1000 + card, deck_key('Тест'), card))
+            store.append(Reading(2, 1000 + card, deck_key('Тест'), 100 + card))
+
+        assert store.count(1) == 25
+        assert [reading.card for reading in store.page(1, 0)] == list(range(24, 14, -1))
+        assert [reading.card for reading in store.page(1, 2)] == [4, 3, 2, 1, 0]
+        assert store.page(1, 3) == []
+        assert store.page(3, 0) == []
+        store.close()
+
+    def test_index_is_rebuilt_and_cut_record_dropped(self, journal_path: Path) -> None:
+        """Test that reopening restores the readings and drops a record cut by a crash."""
+        store = Journal()
+        store.open(journal_path)
+        for card in range(3):
+            store.append(Reading(7, 1000, deck_key('Тест'), card))
+        store.close()
+        with open(journal_path, 'ab') as file:
+            file.write(b'\x01\x02')
+
+        store.open(journal_path, chunk_records=2)
+        assert store.count(7) == 3
+        assert journal_path.stat().st_size == 3 * RECORD.size
+        store.append(Reading(7, 1001, deck_key('Тест'), 9))
+        assert store.page(7, 0)[0] == Reading(7, 1001, deck_key('Тест'), 9)
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_draws_are_written_after_the_update(self, journal_path: Path) -> None:
+        """Test that the cards drawn while handling an update are written for its user."""
+        deck = make_deck(10)
+        context: Any = SimpleNamespace(user_data={})
+        journal.open(journal_path)
+        try:
+            index = get_card_with_history(context, deck)
+            await write_readings(Mock(effective_user=Mock(id=3)), context)
+            assert [(reading.deck_key, reading.card) for reading in journal.page(3, 0)] == [(deck_key('Тест'), index)]
+        finally:
+            journal.close()
+
+
+class TestJournalView:
+    """Test suite for JournalView class."""
+
+    @pytest.mark.asyncio
+    async def test_turn_page(self, journal_path: Path) -> None:
+        """Test that the page buttons edit the message with the requested page."""
+        deck = make_deck(30)
+        view = JournalView({deck.name: deck}, page_size=10)
+        journal.open(journal_path)
+        try:
+            for card in range(15):
+                journal.append(Reading(5, 0, deck_key(deck.name), card))
+            text, keyboard = view.render(5, 0)
+            assert 'страница 1 из 2' in text and '<b>Карта 14</b>' in text
+            assert keyboard and [button.callback_data for button in keyboard.inline_keyboard[0]] == ['journal:1']
+
+            query = Mock(data='journal:1', answer=AsyncMock(), edit_message_text=AsyncMock())
+            query.from_user.id = 5
+            await view.turn_page(Mock(callback_query=query), Mock())
+            text = query.edit_message_text.call_args.args[0]
+            assert 'страница 2 из 2' in text and 'Карта 4' in text and 'Карта 5' not in text
+        finally:
+            journal.close()
+
+    def test_disabled_and_empty(self, journal_path: Path) -> None:
+        """Test the messages without a journal file and without readings."""
+        view = JournalView({})
+        assert view.render(5, 0) == ('История раскладов не ведётся.', None)
+        journal.open(journal_path)
+        try:
+            assert view.render(5, 0) == ('Вы ещё не тянули карт.', None)
+        finally:
+            journal.close()
+
+    def test_button_is_shown_with_journal_only(self, journal_path: Path) -> None:
+        """Test that the menu offers "Мои расклады" only while a journal file is open."""
+        def texts() -> tuple[list[str], list[str]]:
+            reply = main_menu_location.keyboard()
+            assert isinstance(reply, ReplyKeyboardMarkup)
+            markup = inline_keyboard(main_menu_location)
+            assert markup
+            return (
+                [button.text for row in reply.keyboard for button in row],
+                [button.text for row in markup.inline_keyboard for button in row],
+            )
+
+        assert all('Мои расклады' not in shown for shown in texts())
+        journal.open(journal_path)
+        try:
+            assert all('Мои расклады' in shown for shown in texts())
+        finally:
+            journal.close()
@@ -1,11 +1,13 @@
 from telegram.ext._handlers.basehandler import BaseHandler
 import pytest
+import pickle
+from pathlib import Path
 from unittest.mock import AsyncMock, Mock
 
 from telegram import ReplyKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
-from bot.location import Location, MenuLocation, FuncLocation, Message
+from bot.location import CAPTION_LIMIT, Location, MenuLocation, FuncLocation, Message, Reply, coalesce
 
 
 class TestLocation:
@@ -33,6 +35,14 @@ class TestLocation:
         assert location._handlers == []
         assert location._is_implemented is True
 
+    def test_duplicate_name_is_refused(self) -> None:
+        """Test that a second location with the same name can not replace the first one in the registry."""
+        first = Location(name="Twin", handlers=[], welcome_message=Message("Hello"))
+
+        with pytest.raises(ValueError, match="Twin"):
+            Location(name="Twin", handlers=[], welcome_message=Message("Hi"))
+        assert pickle.loads(pickle.dumps(first)) is first
+
     @pytest.mark.asyncio
     async def test_send_welcome_message(self, basic_location: Location) -> None:
         """Test that send_welcome_message sends correct message."""
@@ -245,11 +255,54 @@ class TestFuncLocation:
         handler = func_location._handlers[0].callback
         result = await handler(mock_update, mock_context)
 
-        # Verify the text was processed (check first call, not last)
-        # Handler calls reply_text twice: once for processed text, once for redirect welcome message
-        assert mock_message.reply_text.call_count == 2
-        first_call_args = str(mock_message.reply_text.call_args_list[0])
-        assert "Processed:" in first_call_args
+        # The processed text and the redirect welcome message are merged into one reply
+        mock_message.reply_text.assert_called_once()
+        text = mock_message.reply_text.call_args.args[0]
+        assert text == "Processed: test input\n\nRedirected"
+        assert mock_message.reply_text.call_args.kwargs['reply_markup'] is redirect_loc._keyboard
 
         # Verify redirect
         assert result == redirect_loc
+
+
+class TestCoalesce:
+    """Test suite for coalesce function."""
+
+    def test_texts_are_merged_with_last_keyboard(self) -> None:
+        """Test that consecutive texts become one message with the keyboard of the last one."""
+        keyboard = ReplyKeyboardMarkup([['A']])
+        replies = coalesce([Reply('Oops <1>'), Reply('<b>Menu</b>', reply_markup=keyboard, parse_mode='HTML')])
+
+        assert replies == [Reply('Oops &lt;1&gt;\n\n<b>Menu</b>', reply_markup=keyboard, parse_mode='HTML')]
+
+    def test_text_becomes_caption_of_photo(self) -> None:
+        """Test that a text after a photo without a caption becomes its caption, unless it is too long."""
+        photo = Path('card.png')
+
+        assert coalesce([Reply(photo=photo), Reply('Card')]) == [Reply('Card', photo=photo)]
+        assert len(coalesce([Reply(photo=photo), Reply('x' * (CAPTION_LIMIT + 1))])) == 2
+
+    def test_order_and_separate_replies_are_kept(self) -> None:
+        """Test that a text before a photo and a photo sent separately are not merged."""
+        photo = Path('card.png')
+        replies = [Reply('Oops'), Reply(photo=photo, separate=True), Reply('Card'), Reply('Menu')]
+
+        assert coalesce(replies) == [Reply('Oops'), Reply(photo=photo, separate=True), Reply('Card\n\nMenu')]
+
+    @pytest.mark.asyncio
+    async def test_fallback_is_one_message(self) -> None:
+        """Test that the fallback answers unknown text with one message instead of two."""
+        menu = MenuLocation(name="Fallback Menu", welcome_message=Message("Choose"))
+        child = MenuLocation(name="Fallback Child", welcome_message=Message("Child"))
+        child._is_implemented = True
+        menu.add_children_buttons([child])
+        menu.add_fallback()
+        update = Mock(spec=Update)
+        update.message = AsyncMock()
+        update.message.text = 'spam'
+
+        result = await menu._handlers[0].callback(update, Mock(spec=ContextTypes.DEFAULT_TYPE))
+
+        assert result is menu
+        update.message.reply_text.assert_called_once()
+        assert update.message.reply_text.call_args.args[0] == 'Something went wrong. Try again.\n\nChoose'
@@ -1,12 +1,19 @@
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
 import pytest
 
 from cards.card import Card
-from bot.menu import create_card_locations, add_buttons_to_card_locations
+from cards.cards_reader import CardsReader, DeckIngestion
+from tests.cards.test_cards_reader import make_png, write_deck
+from bot.deck import CARD_HISTORY_SIZE, CARD_VIEW_KEY, CardLocation, Deck, get_card_with_history
 from bot.location import MenuLocation
+from bot.menu import card_view_location, main_menu_location, spread_location
 
 
-class TestMenuFunctions:
-    """Test suite for menu.py functions."""
+class TestDeck:
+    """Test suite for the deck engine."""
 
     @pytest.fixture
     def sample_cards(self) -> list[Card]:
@@ -35,64 +42,89 @@ class TestMenuFunctions:
             )
         ]
 
-    def test_create_card_locations_returns_correct_count(self, sample_cards: list[Card]) -> None:
-        """Test that create_card_locations returns the correct number of locations."""
-        locations = create_card_locations(sample_cards)
+    @pytest.fixture
+    def context(self) -> Any:
+        return SimpleNamespace(user_data={})
+
+    def test_render_contains_card_information(self, sample_cards: list[Card]) -> None:
+        """Test that a rendered card contains its name, description and hidden meaning."""
+        deck = Deck('Тест', sample_cards, 'Взять карту')
+
+        for index, card in enumerate(sample_cards):
+            message = deck.render(index)
+            assert card.name in message.text
+            assert card.description in message.text
+            assert f'<span class="tg-spoiler">{card.meaning}</span>' in message.text
+
+    def test_recent_cards_are_not_repeated(self, context: Any) -> None:
+        """Test that a card is not drawn again within the history size."""
+        cards = [Card(f'Карта {index}', '', '', '', '') for index in range(CARD_HISTORY_SIZE + 1)]
+        deck = Deck('Тест', cards, 'Взять карту')
+
+        drawn = [get_card_with_history(context, deck) for _ in range(50)]
+
+        for start in range(len(drawn) - CARD_HISTORY_SIZE):
+            assert len(set(drawn[start:start + CARD_HISTORY_SIZE + 1])) == CARD_HISTORY_SIZE + 1
 
-        assert len(locations) == len(sample_cards)
+    def test_small_deck_repeats_cards(self, sample_cards: list[Card], context: Any) -> None:
+        """Test that a deck smaller than the history still draws cards."""
+        deck = Deck('Тест', sample_cards, 'Взять карту')
 
-    def test_create_card_locations_returns_menu_locations(self, sample_cards: list[Card]) -> None:
-        """Test that create_card_locations returns MenuLocation instances."""
-        locations = create_card_locations(sample_cards)
+        assert all(0 <= get_card_with_history(context, deck) < len(deck) for _ in range(10))
 
-        assert all(isinstance(loc, MenuLocation) for loc in locations)
+    def test_card_view_shows_card_of_its_deck(self, sample_cards: list[Card], context: Any) -> None:
+        """Test that one card view location shows cards of several decks."""
+        first = Deck('Первая', sample_cards[:1], 'Первая колода')
+        second = Deck('Вторая', sample_cards[1:], 'Вторая колода')
+        view = CardLocation('Тестовая карта', {first.name: first, second.name: second})
 
-    def test_create_card_locations_sets_correct_names(self, sample_cards: list[Card]) -> None:
-        """Test that locations have correct names from cards."""
-        locations = create_card_locations(sample_cards)
+        assert view.show_card(context, first) is view
+        assert sample_cards[0].name in view.welcome_message(context).text
+        view.show_card(context, second)
+        assert context.user_data[CARD_VIEW_KEY][0] == 'Вторая'
+        view.show_next_card(context)
+        assert context.user_data[CARD_VIEW_KEY][0] == 'Вторая'
 
-        for card, location in zip(sample_cards, locations):
-            assert location._name == card.name
+    def test_unknown_card_shows_default_message(self, context: Any) -> None:
+        """Test that a card of a removed deck falls back to the default message."""
+        view = CardLocation('Тестовая карта', {})
+        context.user_data[CARD_VIEW_KEY] = ('Удалённая', 3)
 
-    def test_create_card_locations_creates_welcome_message(self, sample_cards: list[Card]) -> None:
-        """Test that welcome messages contain card information."""
-        locations = create_card_locations(sample_cards)
+        assert view.welcome_message(context) == view._welcome_message
 
-        for card, location in zip(sample_cards, locations):
-            assert card.name in location._welcome_message.text
-            assert card.description in location._welcome_message.text
-            assert card.meaning in location._welcome_message.text
+    def test_images_are_checked_on_request_only(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that reading a deck does not open its images, check_images reads every one of them."""
+        csv_path = write_deck(tmp_path, {'Лес.png': make_png(3, 2), 'Река.jpg': b'not an image'})
+        ingest = CardsReader.ingest
+        calls = []
 
-    def test_create_card_locations_with_empty_list(self) -> None:
-        """Test that create_card_locations handles empty list."""
-        locations = create_card_locations([])
+        def counting_ingest(reader: CardsReader, workers: int = 8) -> DeckIngestion:
+            calls.append(reader)
+            return ingest(reader, workers)
 
-        assert locations == []
+        monkeypatch.setattr(CardsReader, 'ingest', counting_ingest)
 
-    def test_add_buttons_to_card_locations_adds_handlers(self, sample_cards: list[Card]) -> None:
-        """Test that add_buttons_to_card_locations adds handlers to locations."""
-        locations = create_card_locations(sample_cards)
+        deck = Deck.from_csv('Проверка', csv_path, button='Проверка')
+        assert [card.name for card in deck.cards] == ['Лес', 'Река']
+        assert not calls
 
-        # Before adding buttons, handlers should be empty
-        for location in locations:
-            assert location._handlers == []
+        ingestion = deck.check_images()
+        assert ingestion and [image.card_name for image in ingestion.invalid] == ['Река']
+        assert calls == [deck.reader]
+        assert Deck('Без файлов', [], 'Без файлов').check_images() is None
 
-        add_buttons_to_card_locations(locations)
 
-        # After adding buttons, handlers should be present
-        for location in locations:
-            assert len(location._handlers) > 0
+class TestMenu:
+    """Test suite for the menu wiring."""
 
-    def test_add_buttons_to_card_locations_adds_keyboard(self, sample_cards: list[Card]) -> None:
-        """Test that add_buttons_to_card_locations adds keyboard to locations."""
-        locations = create_card_locations(sample_cards)
-        add_buttons_to_card_locations(locations)
+    def test_all_cards_share_one_state(self) -> None:
+        """Test that the whole deck is served by the main menu, a single card view state and a single spread state."""
+        states: dict[object, Any] = {}
+        main_menu_location.add_states(states)
 
-        # All locations should have keyboards
-        for location in locations:
-            assert location._keyboard is not None
+        assert set(states) == {main_menu_location, card_view_location, spread_location}
 
-    def test_add_buttons_to_card_locations_with_empty_list(self) -> None:
-        """Test that add_buttons_to_card_locations handles empty list."""
-        # Should not raise an error
-        add_buttons_to_card_locations([])
+    def test_card_view_has_buttons(self) -> None:
+        """Test that the card view has the buttons to draw again and to go back."""
+        assert isinstance(card_view_location, MenuLocation)
+        assert card_view_location._get_button_names() == ['Взять ещё одну карту', 'Вернуться в Главное меню']
@@ -0,0 +1,75 @@
+import asyncio
+import pickle
+from collections import deque
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from bot.location import MenuLocation, Message
+from bot.persistence import SqlitePersistence
+
+
+class TestSqlitePersistence:
+    """Test suite for SqlitePersistence class."""
+
+    @pytest.fixture
+    def db_path(self, tmp_path: Path) -> Path:
+        return tmp_path / 'state.sqlite'
+
+    def test_location_is_pickled_by_name(self) -> None:
+        """Test that a location survives pickling as the very same object."""
+        location = MenuLocation(name='Pickled Location', welcome_message=Message('Hello'))
+        assert pickle.loads(pickle.dumps(location)) is location
+
+    @pytest.mark.asyncio
+    async def test_user_data_round_trip(self, db_path: Path) -> None:
+        """Test that user data written by one instance is read by another one."""
+        writer = SqlitePersistence(db_path)
+        await writer.update_user_data(1, {'card_history': deque(['Лес'], maxlen=5)})
+        await writer.update_bot_data({'answer': 42})
+
+        reader = SqlitePersistence(db_path)
+        user_data = await reader.get_user_data()
+        assert list(user_data[1]['card_history']) == ['Лес']
+        assert await reader.get_bot_data() == {'answer': 42}
+
+        await writer.drop_user_data(1)
+        assert await reader.get_user_data() == {}
+
+    @pytest.mark.asyncio
+    async def test_conversation_round_trip(self, db_path: Path) -> None:
+        """Test that conversation states are stored as locations and removed on end."""
+        location = MenuLocation(name='Stored Location', welcome_message=Message('Hello'))
+        persistence = SqlitePersistence(db_path)
+        await persistence.update_conversation('oracle', (10, 20), location)
+        await persistence.update_conversation('oracle', (11, 21), location)
+        await persistence.update_conversation('oracle', (11, 21), None)
+
+        conversations = await SqlitePersistence(db_path).get_conversations('oracle')
+        assert conversations == {(10, 20): location}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writes_share_one_transaction(
+        self, db_path: Path, monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        """Test that writes issued together, as by one persistence update, are committed at once."""
+        location = MenuLocation(name='Committed Location', welcome_message=Message('Hello'))
+        persistence = SqlitePersistence(db_path)
+        transactions: list[int] = []
+        execute = persistence._execute
+
+        def counting_execute(statements: list[tuple[str, tuple[Any, ...]]]) -> None:
+            transactions.append(len(statements))
+            execute(statements)
+
+        monkeypatch.setattr(persistence, '_execute', counting_execute)
+
+        await asyncio.gather(
+            persistence.update_user_data(1, {'card_history': deque(maxlen=5)}),
+            persistence.update_chat_data(1, {'last_update_id': 100}),
+            persistence.update_conversation('oracle', (1, 1), location),
+        )
+
+        assert transactions == [3]
+        assert (await SqlitePersistence(db_path).get_chat_data()) == {1: {'last_update_id': 100}}
@@ -0,0 +1,61 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from bot.profiling import Profiler
+
+
+class TestProfiler:
+    """Test suite for Profiler class."""
+
+    @pytest.fixture
+    def profiler(self, tmp_path: Path) -> Profiler:
+        profiler = Profiler(output_dir=tmp_path, interval=0.001)
+        profiler.buttons = {'Взять карту'}
+        return profiler
+
+    def test_cpu_session_writes_folded_stacks_per_location(self, profiler: Profiler) -> None:
+        """Test that samples taken while an update is handled are written per location."""
+        profiler.start('cpu', 10)
+        profiler.begin_update('Взять карту')
+        deadline = time.monotonic() + 0.1
+        while time.monotonic() < deadline:
+            sum(range(1000))
+        profiler.finish_update()
+        files = profiler.stop()
+
+        assert not profiler.active
+        assert len(files) == 1
+        lines = files[0].read_text(encoding='utf-8').splitlines()
+        assert lines
+        assert all(';' in line and line.rsplit(' ', 1)[1].isdigit() for line in lines)
+        assert any('test_cpu_session_writes_folded_stacks_per_location' in line for line in lines)
+
+    def test_free_text_is_not_used_as_label(self, profiler: Profiler) -> None:
+        """Test that texts which are not buttons are aggregated under one label."""
+        profiler.start('cpu', 10)
+        profiler.begin_update('my secret question')
+        assert profiler._label == '<text>'
+        profiler.stop()
+
+    def test_memory_session_writes_differences(self, profiler: Profiler) -> None:
+        """Test that the memory mode writes the growth between two snapshots."""
+        profiler.start('memory', 10)
+        grown = [bytearray(1000) for _ in range(100)]
+        files = profiler.stop()
+
+        assert len(grown) == 100
+        assert files[0].name.startswith('memory-')
+        assert files[0].read_text(encoding='utf-8')
+
+    def test_only_one_session_at_a_time(self, profiler: Profiler) -> None:
+        """Test that a second session can't be started while one runs."""
+        profiler.start('cpu', 10)
+        with pytest.raises(RuntimeError):
+            profiler.start('memory', 10)
+        profiler.stop()
+
+        with pytest.raises(ValueError):
+            profiler.start('disk', 10)
+        assert not profiler.active
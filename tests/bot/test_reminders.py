@@ -0,0 +1,178 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram import ReplyKeyboardMarkup
+from telegram.error import Forbidden
+
+from bot.deck import Deck
+from bot.menu import main_menu_location
+from bot.reminders import (
+    DAY, EVENING_MINUTE, Reminder, ReminderScheduler, ReminderStore, next_time, reminder_minute, reminders,
+)
+from cards.card import Card
+
+# 2026-10-19 12:00 UTC
+NOON = 1792411200
+
+
+def make_application() -> Mock:
+    application = Mock()
+    application.context_types.context = lambda *args, **kwargs: SimpleNamespace(user_data={})
+    application.bot.send_photo = AsyncMock(return_value=Mock(photo=[]))
+    application.bot.send_message = AsyncMock()
+    return application
+
+
+@pytest.fixture
+def scheduler(tmp_path: Path) -> Any:
+    scheduler = ReminderScheduler(rate=1000)
+    scheduler.decks = {'Тест': Deck('Тест', [Card(f'Карта {index}', '', '', '', '') for index in range(10)], '')}
+    scheduler.open(tmp_path / 'reminders.sqlite')
+    yield scheduler
+    scheduler.close()
+
+
+def test_reminder_minute() -> None:
+    """Test that the subscribers are spread over every minute of the evening hour."""
+    minutes = {reminder_minute(user_id) for user_id in range(1000)}
+    assert minutes == set(range(EVENING_MINUTE, EVENING_MINUTE + 60))
+
+
+def test_next_time() -> None:
+    """Test that the next reminder is today if its minute is still ahead, else tomorrow."""
+    assert next_time(17 * 60, NOON) == NOON + 5 * 3600
+    assert next_time(9 * 60, NOON) == NOON - 3 * 3600 + DAY
+    assert next_time(12 * 60, NOON) == NOON + DAY
+
+
+class TestReminderScheduler:
+    """Test suite for ReminderScheduler class."""
+
+    @pytest.mark.asyncio
+    async def test_due_reminders_are_sent_in_batches(self, scheduler: ReminderScheduler, tmp_path: Path) -> None:
+        """Test that due reminders are sent once, in batches, late ones are skipped, and all move to the next day."""
+        scheduler.batch_size = 2
+        store = scheduler._store
+        assert store
+        for user_id in range(5):
+            store.subscribe(Reminder(user_id, user_id, 17 * 60, NOON - 60, 'Тест'))
+        store.subscribe(Reminder(10, 10, 17 * 60, NOON - 2 * 3600, 'Тест'))
+        store.subscribe(Reminder(11, 11, 17 * 60, NOON + 60, 'Тест'))
+        application = make_application()
+
+        assert await scheduler.dispatch_due(application, NOON) == 5
+        assert sorted(call.args[0] for call in application.bot.send_message.call_args_list) == list(range(5))
+        assert await scheduler.dispatch_due(application, NOON) == 0
+
+        # The schedule survives a restart without any work at startup
+        scheduler.close()
+        scheduler.open(tmp_path / 'reminders.sqlite')
+        store = scheduler._store
+        assert store
+        assert [reminder.user_id for reminder in store.due(NOON + 3600, 10)] == [11]
+        assert len(store.due(NOON + 5 * 3600, 10)) == 7
+
+    @pytest.mark.asyncio
+    async def test_draw_is_persisted(self, scheduler: ReminderScheduler) -> None:
+        """Test that the user data changed by the draw of a reminder is marked for the persistence."""
+        assert scheduler._store
+        scheduler._store.subscribe(Reminder(5, 50, 0, NOON, 'Тест'))
+        application = make_application()
+
+        assert await scheduler.dispatch_due(application, NOON) == 1
+        application.mark_data_for_update_persistence.assert_called_once_with(user_ids=[5])
+
+    @pytest.mark.asyncio
+    async def test_blocked_user_is_unsubscribed(self, scheduler: ReminderScheduler) -> None:
+        """Test that the reminder of a user who blocked the bot is removed."""
+        assert scheduler._store
+        scheduler._store.subscribe(Reminder(1, 1, 0, NOON, 'Тест'))
+        application = make_application()
+        application.bot.send_message = AsyncMock(side_effect=Forbidden('blocked'))
+
+        assert await scheduler.dispatch_due(application, NOON) == 0
+        assert scheduler._store.count() == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_reminder_does_not_stop_the_others(self, scheduler: ReminderScheduler) -> None:
+        """Test that an unexpected error while sending one reminder is logged and the others are sent."""
+        assert scheduler._store
+        for user_id in range(3):
+            scheduler._store.subscribe(Reminder(user_id, user_id, 0, NOON, 'Тест'))
+        application = make_application()
+
+        async def send_message(chat_id: int, *args: Any, **kwargs: Any) -> None:
+            if chat_id == 1:
+                raise RuntimeError('broken')
+
+        application.bot.send_message = AsyncMock(side_effect=send_message)
+
+        assert await scheduler.dispatch_due(application, NOON) == 2
+        assert scheduler._store.due(NOON, 10) == []
+
+    @pytest.mark.asyncio
+    async def test_scheduler_survives_errors(self, scheduler: ReminderScheduler) -> None:
+        """Test that the scheduler loop keeps waking up after a dispatch failed."""
+        scheduler.bucket_seconds = 0.01  # type: ignore[assignment]
+        calls = []
+
+        async def dispatch_due(application: Any, now: float) -> int:
+            calls.append(now)
+            raise ValueError('broken')
+
+        async def three_wakeups() -> None:
+            while len(calls) < 3:
+                await asyncio.sleep(0.01)
+
+        scheduler.dispatch_due = dispatch_due  # type: ignore[method-assign]
+        scheduler.start(make_application())
+        try:
+            await asyncio.wait_for(three_wakeups(), 5)
+        finally:
+            await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_toggle(self, scheduler: ReminderScheduler) -> None:
+        """Test that the menu button subscribes the user and the second press unsubscribes."""
+        update = Mock()
+        update.effective_user.id = 7
+        update.effective_chat.id = 70
+        context = Mock()
+        context.bot.send_message = AsyncMock()
+        assert scheduler._store
+
+        await scheduler.toggle(update, context)
+        assert [reminder.minute for reminder in scheduler._store.due(NOON + DAY, 10)] == [EVENING_MINUTE + 7]
+        assert 'в 20:07 по Москве' in context.bot.send_message.call_args.args[1]
+        await scheduler.toggle(update, context)
+        assert scheduler._store.count() == 0
+        assert context.bot.send_message.call_args.args == (70, 'Напоминания выключены.')
+
+
+def test_store_uses_index(tmp_path: Path) -> None:
+    """Test that due reminders are found through the index on the next reminder time."""
+    store = ReminderStore(tmp_path / 'reminders.sqlite')
+    plan = store._connection.execute(
+        'EXPLAIN QUERY PLAN SELECT user_id FROM reminders WHERE next_at <= ? ORDER BY next_at LIMIT ?', (NOON, 10),
+    ).fetchall()
+    store.close()
+    assert 'reminders_next_at' in str(plan)
+
+
+def test_button_is_shown_with_reminders_only(tmp_path: Path) -> None:
+    """Test that the menu offers "Напоминания" only while the subscriptions are kept."""
+    def shown() -> list[str]:
+        keyboard = main_menu_location.keyboard()
+        assert isinstance(keyboard, ReplyKeyboardMarkup)
+        return [button.text for row in keyboard.keyboard for button in row]
+
+    assert 'Напоминания' not in shown()
+    reminders.open(tmp_path / 'reminders.sqlite')
+    try:
+        assert 'Напоминания' in shown()
+    finally:
+        reminders.close()
@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import Mock
+
+import pytest
+from telegram import Update
+
+from bot.bot import build_application
+from bot.dedup import RecentUpdates
+from bot.deck import CARD_VIEW_KEY, CardLocation, Deck
+from bot.rendering import CARD, DEFAULT_LOCALE, LOCALE_KEY, TEMPLATES, CardRenderer, remember_locale
+from bot.offline import OfflineRequest
+from bot.throttle import COALESCED, DROPPED, NOTIFIED, FloodLimit
+from cards.card import Card
+
+# A second locale, for a deck with the texts in English
+ENGLISH = {
+    CARD: '<b>{name}</b>\n\n{description}\n\nInterpretation:\n<span class="tg-spoiler">{meaning}</span>',
+    'past': '<b>Past: {name}</b>\n<span class="tg-spoiler">{keywords}</span>',
+}
+
+
+def make_deck(name: str = 'Тест', size: int = 3) -> Deck:
+    cards = [
+        Card(f'Карта <{index}>', f'Описание & {index}', f'Толкование {index}', f'слово {index}', '')
+        for index in range(size)
+    ]
+    return Deck(name, cards, 'Взять карту')
+
+
+class TestCardRenderer:
+    """Test suite for CardRenderer class."""
+
+    def test_fields_are_escaped_and_markup_kept(self) -> None:
+        """Test that CSV text can not break the markup of the template."""
+        text = CardRenderer().render(make_deck(), 1)
+
+        assert text == (
+            '<b>Карта &lt;1&gt;</b>\n\nОписание &amp; 1\n\n'
+            'Толкование:\n<span class="tg-spoiler">Толкование 1</span>'
+        )
+
+    def test_texts_are_rendered_once_per_key(self) -> None:
+        """Test that a text is looked up after the first render, for the same deck object only."""
+        renderer = CardRenderer({**TEMPLATES, 'en': ENGLISH})
+        deck = make_deck()
+        first = renderer.render(deck, 0, 'en', 'past')
+        assert renderer.render(deck, 0, 'en', 'past') is first
+        assert (renderer.hits, renderer.misses) == (1, 1)
+        assert first.startswith('<b>Past: Карта &lt;0&gt;</b>')
+
+        rebuilt = Deck(deck.name, [Card('Другая', '', '', '', '')], 'Взять карту')
+        assert 'Другая' in renderer.render(rebuilt, 0, 'en', 'past')
+
+    def test_least_recently_used_are_evicted(self) -> None:
+        """Test that the cache keeps at most max_texts texts, the most recently used ones."""
+        renderer = CardRenderer(max_texts=2)
+        deck = make_deck()
+        renderer.render(deck, 0)
+        renderer.render(deck, 1)
+        renderer.render(deck, 0)
+        renderer.render(deck, 2)
+
+        renderer.render(deck, 0)
+        assert renderer.hits == 2
+        renderer.render(deck, 1)
+        assert renderer.misses == 4
+
+    def test_unknown_locale_falls_back(self) -> None:
+        """Test that languages without templates get the default ones."""
+        renderer = CardRenderer({**TEMPLATES, 'en': ENGLISH})
+        assert renderer.locale_for('en-US') == 'en'
+        assert renderer.locale_for('de') == renderer.locale_for(None) == DEFAULT_LOCALE
+        assert renderer.render(make_deck(), 0, 'de') == renderer.render(make_deck(), 0, DEFAULT_LOCALE)
+        # Layouts missing from a locale are taken from the default one
+        assert renderer.render(make_deck(), 0, 'en', 'future') == renderer.render(make_deck(), 0, 'ru', 'future')
+
+    def test_only_russian_is_shipped(self) -> None:
+        """Test that the texts of the cards are not half translated: the decks are in Russian only."""
+        assert CardRenderer().locale_for('en') == DEFAULT_LOCALE
+
+    @pytest.mark.parametrize('templates', [
+        {'ru': {CARD: '{name} {price}'}},
+        {'ru': {CARD: '{name!r}'}},
+        {'en': ENGLISH},
+    ])
+    def test_invalid_templates_fail_at_startup(self, templates: dict[str, dict[str, str]]) -> None:
+        """Test that templates with unknown fields or without the default locale are refused when compiled."""
+        with pytest.raises(ValueError):
+            CardRenderer(templates)
+
+
+class TestLocale:
+    """Test suite for the locale of the card texts."""
+
+    @pytest.mark.asyncio
+    async def test_card_is_shown_in_the_user_language(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the locale of the Telegram app is remembered and used by the card view."""
+        renderer = CardRenderer({**TEMPLATES, 'en': ENGLISH})
+        monkeypatch.setattr('bot.rendering.card_texts', renderer)
+        monkeypatch.setattr('bot.deck.card_texts', renderer)
+        deck = make_deck()
+        view = CardLocation('Тестовая карта', {deck.name: deck})
+        context: Any = SimpleNamespace(user_data={CARD_VIEW_KEY: (deck.name, 2)})
+
+        await remember_locale(Mock(effective_user=Mock(language_code='en')), context)
+        assert context.user_data[LOCALE_KEY] == 'en'
+        assert 'Interpretation:' in view.welcome_message(context).text
+
+        await remember_locale(Mock(effective_user=Mock(language_code='ru')), context)
+        assert 'Толкование:' in view.welcome_message(context).text
+
+    @pytest.mark.asyncio
+    async def test_throttled_update_does_not_change_the_locale(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the locale is remembered after the throttle, a dropped update does not write user_data."""
+        monkeypatch.setattr('bot.rendering.card_texts', CardRenderer({**TEMPLATES, 'en': ENGLISH}))
+        monkeypatch.setattr('bot.dedup.recent_updates', RecentUpdates())
+        monkeypatch.setattr('bot.throttle.dropped_updates', {COALESCED: 0, NOTIFIED: 0, DROPPED: 0})
+        application = build_application(
+            '0:offline', request=OfflineRequest(), flood_limit=FloodLimit(rate=0.0, burst=1),
+        )
+        async with application:
+            for update_id, (text, language) in enumerate([('/start', 'ru'), ('О нас', 'en')], start=1):
+                user = {'id': 42, 'is_bot': False, 'first_name': 'Анна', 'language_code': language}
+                await application.process_update(Update.de_json({'update_id': update_id, 'message': {
+                    'message_id': update_id, 'date': 1700000000, 'text': text, 'from': user,
+                    'chat': {'id': 42, 'type': 'private'},
+                }}, application.bot))
+
+        assert application.user_data[42].get(LOCALE_KEY, DEFAULT_LOCALE) == DEFAULT_LOCALE
@@ -0,0 +1,101 @@
+import os
+import signal
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from typing import Any
+
+from bot.bot import build_application
+from bot.offline import OfflineRequest
+from bot.sharding import ShardedRunner, create_webhook_handler, get_shard, get_shard_key, serve
+
+
+def test_shard_key_from_message_chat() -> None:
+    """Test that message updates are sharded by chat id."""
+    update = {'update_id': 1, 'message': {'chat': {'id': 42}, 'from': {'id': 7}}}
+    assert get_shard_key(update) == 42
+
+
+def test_shard_key_from_callback_query() -> None:
+    """Test that callback queries are sharded by the chat of their message."""
+    update = {'update_id': 1, 'callback_query': {'from': {'id': 7}, 'message': {'chat': {'id': 42}}}}
+    assert get_shard_key(update) == 42
+
+
+def test_shard_key_from_user() -> None:
+    """Test that updates without a chat are sharded by user id."""
+    update = {'update_id': 1, 'inline_query': {'from': {'id': 7}, 'query': 'card'}}
+    assert get_shard_key(update) == 7
+
+
+def test_shard_key_fallback_to_update_id() -> None:
+    """Test that updates without chat and user are sharded by update id."""
+    assert get_shard_key({'update_id': 5, 'poll': {'id': 'x'}}) == 5
+
+
+def test_shard_is_stable_and_in_range() -> None:
+    """Test that the same chat always lands in the same worker, also for negative ids."""
+    for chat_id in (-1001234567890, -5, 0, 3, 123456789):
+        update = {'update_id': 1, 'message': {'chat': {'id': chat_id}}}
+        shard = get_shard(update, 4)
+        assert 0 <= shard < 4
+        assert get_shard(update, 4) == shard
+
+
+def broken_application() -> Any:
+    raise RuntimeError('the worker crashed')
+
+
+def offline_application() -> Any:
+    return build_application('0:offline', request=OfflineRequest())
+
+
+class TestShardedRunner:
+    """Test suite for ShardedRunner class."""
+
+    def test_updates_of_a_chat_go_to_one_worker(self) -> None:
+        """Test that dispatch puts the updates of a chat into the queue of its worker, in order."""
+        runner = ShardedRunner(3, broken_application)
+        updates = [{'update_id': index, 'message': {'chat': {'id': 7}}} for index in range(3)]
+        for update in updates:
+            runner.dispatch(update)
+        runner.dispatch({'update_id': 3, 'message': {'chat': {'id': 8}}})
+
+        worker = runner.workers[7 % 3]
+        assert [worker.updates.get(timeout=5) for _ in updates] == updates
+        assert runner.workers[8 % 3].updates.get(timeout=5) == {'update_id': 3, 'message': {'chat': {'id': 8}}}
+        assert runner.workers[9 % 3].updates.empty()
+
+    def test_dead_worker_is_restarted(self) -> None:
+        """Test that the supervisor starts a worker again after its process died."""
+        runner = ShardedRunner(1, broken_application, check_interval=0.05)
+        runner.start()
+        try:
+            deadline = time.monotonic() + 60
+            while runner.workers[0].restarts < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert runner.workers[0].restarts >= 2
+            assert runner.status()[0]['restarts'] == runner.workers[0].restarts
+        finally:
+            runner.stop(timeout=5)
+
+    def test_sigterm_drains_the_workers(self) -> None:
+        """Test that on SIGTERM the receiver stops and the updates queued before it are handled."""
+        runner = ShardedRunner(2, offline_application)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), create_webhook_handler(runner, '/hook', 'secret'))
+        runner.start()
+        for update_id in range(4):
+            runner.dispatch({'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': 1700000000, 'text': '/start',
+                'chat': {'id': update_id, 'type': 'private'},
+                'from': {'id': update_id, 'is_bot': False, 'first_name': 'Анна'},
+            }})
+        # Sent before any worker has started handling the updates
+        threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        previous = signal.getsignal(signal.SIGTERM)
+
+        serve(server, runner, shutdown_deadline=60)
+
+        assert runner.processed() == 4
+        assert not any(worker.is_alive() for worker in runner.workers)
+        assert signal.getsignal(signal.SIGTERM) is previous
@@ -0,0 +1,76 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from bot.shutdown import ShutdownCoordinator, TrackingUpdateProcessor
+
+
+def make_application(processor: TrackingUpdateProcessor) -> Mock:
+    application = Mock()
+    application.updater = None
+    application.update_queue = asyncio.Queue()
+    application.update_processor = processor
+    return application
+
+
+class TestTrackingUpdateProcessor:
+    """Test suite for TrackingUpdateProcessor class."""
+
+    @pytest.mark.asyncio
+    async def test_running_update_is_tracked_and_abandoned(self) -> None:
+        """Test that a running update is known by id and its cancellation is not an error."""
+        processor = TrackingUpdateProcessor()
+        started = asyncio.Event()
+
+        async def handler() -> None:
+            started.set()
+            await asyncio.sleep(10)
+
+        processing = asyncio.create_task(processor.process_update(Mock(update_id=5), handler()))
+        await started.wait()
+        assert list(processor.in_flight) == [5]
+
+        assert processor.abandon() == [5]
+        await processing
+        assert processor.in_flight == {}
+
+
+class TestShutdownCoordinator:
+    """Test suite for ShutdownCoordinator class."""
+
+    @pytest.mark.asyncio
+    async def test_waits_for_running_update(self) -> None:
+        """Test that the application is stopped only after the update in flight is handled."""
+        coordinator = ShutdownCoordinator()
+        coordinator.ready = True
+        coordinator.deadline = 5
+        processor = TrackingUpdateProcessor()
+        application = make_application(processor)
+        handled = []
+
+        async def handler() -> None:
+            await asyncio.sleep(0.1)
+            handled.append(1)
+
+        processing = asyncio.create_task(processor.process_update(Mock(update_id=1), handler()))
+        await asyncio.sleep(0)
+        await coordinator.drain(application)
+
+        assert handled == [1]
+        assert not coordinator.ready
+        application.stop_running.assert_called_once()
+        await processing
+
+    @pytest.mark.asyncio
+    async def test_abandons_updates_past_deadline(self) -> None:
+        """Test that queued updates are dropped once the deadline passes."""
+        coordinator = ShutdownCoordinator()
+        coordinator.deadline = 0.1
+        application = make_application(TrackingUpdateProcessor())
+        await application.update_queue.put(Mock(update_id=2))
+
+        await coordinator.drain(application)
+
+        assert application.update_queue.empty()
+        application.stop_running.assert_called_once()
@@ -0,0 +1,36 @@
+import pytest
+
+from bot.simulation import distance, replay, simulate
+
+pytest.importorskip('numpy')
+
+
+class TestSimulate:
+    """Test suite for simulate function."""
+
+    def test_history_one_less_than_deck_cycles(self) -> None:
+        """Test that with one card out of the history the draws go round the deck."""
+        report = simulate(6, history_size=5, users=1000, draws=30, seed=1)
+
+        assert report.card_counts.tolist() == [5000] * 6
+        assert report.repeat_quantile(0.0) == report.repeat_quantile(1.0) == 6
+        assert report.covered == 1.0 and report.coverage_quantile(1.0) == 6
+
+    def test_repeats_outside_history_only(self) -> None:
+        """Test that a card repeats no sooner than after the history, and the frequencies are even."""
+        report = simulate(41, history_size=5, users=20000, draws=50, seed=2)
+
+        assert report.repeat_quantile(0.0) == 6 and report.early_repeats == 0.0
+        assert report.frequency_skew < 1.05
+        assert report.card_counts.sum() == 20000 * 50
+
+    @pytest.mark.parametrize('deck_size, history_size', [(10, 3), (4, 4)])
+    def test_matches_get_card_with_history(self, deck_size: int, history_size: int) -> None:
+        """Test that the simulator draws like the production function, also when the history holds the deck."""
+        simulated = simulate(deck_size, history_size, users=20000, draws=40, seed=3)
+        production = replay(deck_size, history_size, users=2000, draws=40, seed=3)
+
+        assert simulated.repeat_quantile(0.0) == production.repeat_quantile(0.0)
+        assert distance(simulated, production) < 0.03
+        assert simulated.early_repeats == pytest.approx(production.early_repeats, abs=0.02)
+        assert simulated.covered == pytest.approx(production.covered, abs=0.03)
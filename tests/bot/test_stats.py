@@ -0,0 +1,89 @@
+import random
+
+from bot.stats import LatencySketch, UniqueCounter, WindowedStats, format_stats
+
+
+class TestLatencySketch:
+    """Test suite for LatencySketch class."""
+
+    def test_empty_sketch_has_no_quantiles(self) -> None:
+        """Test that an empty sketch returns None."""
+        assert LatencySketch().quantile(0.5) is None
+
+    def test_quantiles_within_relative_accuracy(self) -> None:
+        """Test that quantiles match exact ones within the relative accuracy."""
+        rng = random.Random(1)
+        values = [rng.lognormvariate(4, 1) for _ in range(20000)]
+        sketch = LatencySketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        ordered = sorted(values)
+        for q in (0.5, 0.95, 0.99):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            assert abs((sketch.quantile(q) or 0) - exact) <= exact * 0.02
+
+    def test_merge_adds_counts(self) -> None:
+        """Test that merged sketches answer for both streams."""
+        first, second = LatencySketch(), LatencySketch()
+        first.add(10)
+        second.add(1000)
+        second.add(0)
+        first.merge(second)
+
+        assert first.count == 3
+        assert first.quantile(0) == 0.0
+        assert 990 <= (first.quantile(1) or 0) <= 1010
+
+
+class TestUniqueCounter:
+    """Test suite for UniqueCounter class."""
+
+    def test_small_counts_are_exact_enough(self) -> None:
+        """Test that repeated ids are counted once."""
+        counter = UniqueCounter()
+        for user_id in [1, 2, 3, 1, 2, 3]:
+            counter.add(user_id)
+        assert counter.estimate() == 3
+
+    def test_large_counts_within_error(self) -> None:
+        """Test that the estimate of many ids stays within a few percent."""
+        counter = UniqueCounter()
+        for user_id in range(100000):
+            counter.add(user_id)
+        assert abs(counter.estimate() - 100000) < 100000 * 0.1
+
+
+class TestWindowedStats:
+    """Test suite for WindowedStats class."""
+
+    def test_window_only_counts_recent_slots(self) -> None:
+        """Test that updates older than the window are not counted."""
+        windowed = WindowedStats(slot_seconds=10, slots=360)
+        windowed._started = 0
+        windowed.record_update(100, 1, now=1000)
+        windowed.record_update(200, 2, now=3930)
+        windowed.record_error(now=3950)
+
+        recent = windowed.window(60, now=3960)
+        assert recent['throughput'] == 1 / 60
+        assert recent['error_rate'] == 1.0
+        assert recent['users'] == 1
+        assert 198 <= (recent['p50'] or 0) <= 202
+
+        hour = windowed.window(3600, now=3960)
+        assert hour['users'] == 2
+
+    def test_ring_slots_are_reused(self) -> None:
+        """Test that a slot from a previous lap of the ring is reset."""
+        windowed = WindowedStats(slot_seconds=10, slots=6)
+        windowed.record_update(10, 1, now=5)
+        windowed.record_update(10, 2, now=65)
+
+        assert windowed.window(60, now=65)['users'] == 1
+
+    def test_format_stats(self) -> None:
+        """Test that the report has a row per window."""
+        text = format_stats(WindowedStats())
+        assert text.startswith('<pre>')
+        assert all(name in text for name in ('1m', '5m', '1h'))
@@ -0,0 +1,105 @@
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram.ext import ApplicationHandlerStop
+
+from bot.throttle import COALESCED, DROPPED, NOTICE, NOTIFIED, PASS, FloodLimit, Throttle, throttle_update
+
+
+class TestThrottle:
+    """Test suite for Throttle class."""
+
+    def test_burst_then_rate(self) -> None:
+        """Test that a burst passes at once and later updates pass at the refill rate."""
+        throttle = Throttle(FloodLimit(rate=1.0, burst=3))
+
+        verdicts = [throttle.check(1, str(index), now=0.0) for index in range(5)]
+
+        assert verdicts == [PASS, PASS, PASS, NOTIFIED, DROPPED]
+        assert throttle.check(1, 'later', now=1.0) == PASS
+        assert throttle.check(1, 'too soon', now=1.1) == NOTIFIED
+
+    def test_repeated_text_is_coalesced(self) -> None:
+        """Test that a double tap is handled once and does not take a token."""
+        throttle = Throttle(FloodLimit(rate=0.0, burst=2, coalesce_seconds=0.5))
+
+        assert throttle.check(1, 'Взять карту', now=0.0) == PASS
+        assert throttle.check(1, 'Взять карту', now=0.2) == COALESCED
+        assert throttle.check(1, 'О нас', now=0.3) == PASS
+        assert throttle.check(1, 'О нас', now=1.0) == NOTIFIED
+
+    def test_users_are_independent(self) -> None:
+        """Test that one user's flood does not limit the others."""
+        throttle = Throttle(FloodLimit(rate=0.0, burst=1))
+
+        assert throttle.check(1, 'a', now=0.0) == PASS
+        assert throttle.check(1, 'b', now=0.0) == NOTIFIED
+        assert throttle.check(2, 'a', now=0.0) == PASS
+
+    def test_only_recent_users_are_kept(self) -> None:
+        """Test that buckets of the least recently active users are forgotten."""
+        throttle = Throttle(FloodLimit(rate=0.0, burst=1), max_users=2)
+        for user_id in (1, 2, 3):
+            throttle.check(user_id, 'a', now=0.0)
+
+        assert throttle.check(1, 'b', now=0.0) == PASS
+        assert throttle.check(3, 'b', now=0.0) == NOTIFIED
+
+
+class TestThrottleUpdate:
+    """Test suite for throttle_update handler."""
+
+    @pytest.fixture(autouse=True)
+    def throttle(self, monkeypatch: pytest.MonkeyPatch) -> Throttle:
+        throttle = Throttle(FloodLimit(rate=0.0, burst=1))
+        monkeypatch.setattr('bot.throttle.throttle', throttle)
+        monkeypatch.setattr('bot.throttle.dropped_updates', {COALESCED: 0, NOTIFIED: 0, DROPPED: 0})
+        return throttle
+
+    @staticmethod
+    def make_update(user_id: int, text: str) -> Mock:
+        update = Mock(callback_query=None)
+        update.effective_user.id = user_id
+        update.message.text = text
+        update.message.reply_text = AsyncMock()
+        return update
+
+    @pytest.mark.asyncio
+    async def test_flood_is_stopped_with_one_notice(self) -> None:
+        """Test that updates over the limit are stopped and only the first one is answered."""
+        updates = [self.make_update(1, text) for text in ('a', 'b', 'c')]
+
+        await throttle_update(updates[0], Mock())
+        for update in updates[1:]:
+            with pytest.raises(ApplicationHandlerStop):
+                await throttle_update(update, Mock())
+
+        updates[1].message.reply_text.assert_awaited_once()
+        updates[2].message.reply_text.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_stopped_button_presses_are_answered(self) -> None:
+        """Test that stopped inline button presses are answered, only the first one with the notice."""
+        updates = []
+        for data in ('menu:0', 'menu:0', 'menu:1', 'menu:2'):
+            update = Mock(message=None)
+            update.effective_user.id = 1
+            update.callback_query.data = data
+            update.callback_query.answer = AsyncMock()
+            updates.append(update)
+
+        await throttle_update(updates[0], Mock())
+        for update in updates[1:]:
+            with pytest.raises(ApplicationHandlerStop):
+                await throttle_update(update, Mock())
+
+        updates[0].callback_query.answer.assert_not_awaited()
+        updates[1].callback_query.answer.assert_awaited_once_with(None)
+        updates[2].callback_query.answer.assert_awaited_once_with(NOTICE)
+        updates[3].callback_query.answer.assert_awaited_once_with(None)
+
+    @pytest.mark.asyncio
+    async def test_admins_are_not_throttled(self) -> None:
+        """Test that admins pass whatever they send."""
+        for text in ('a', 'b', 'c'):
+            await throttle_update(self.make_update(99, text), Mock(), admins={99})
@@ -0,0 +1,145 @@
+import gzip
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from telegram import Update
+
+from bot import dedup
+from bot.traffic import Anonymizer, TrafficRecorder, compare, read_log, replay
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict[str, Any]:
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Анна', 'last_name': 'Иванова', 'username': 'anna'}
+    message: dict[str, Any] = {
+        'message_id': update_id, 'date': 1700000000, 'text': text,
+        'chat': {'id': user_id, 'type': 'private', 'first_name': 'Анна'}, 'from': user,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'update_id': update_id, 'message': message}
+
+
+class TestAnonymizer:
+    """Test suite for Anonymizer class."""
+
+    def test_ids_are_stable_pseudonyms(self) -> None:
+        """Test that the same id always maps to the same pseudonym, keeping its sign."""
+        anonymizer = Anonymizer(set(), salt=b'salt')
+        assert anonymizer.pseudonym(42) == anonymizer.pseudonym(42) != 42
+        assert anonymizer.pseudonym(-100) < 0
+
+    def test_personal_data_is_removed(self) -> None:
+        """Test that names and free text are dropped, buttons and commands are kept."""
+        anonymizer = Anonymizer({'Взять карту'}, salt=b'salt')
+
+        secret = anonymizer.anonymize(make_update(1, 42, 'my secret'))
+        button = anonymizer.anonymize(make_update(2, 42, 'Взять карту'))
+        command = anonymizer.anonymize(make_update(3, 42, '/start'))
+
+        assert secret['message']['text'] == '<text>'
+        assert secret['message']['from'] == {'id': anonymizer.pseudonym(42), 'is_bot': False, 'first_name': 'user'}
+        assert secret['message']['chat']['id'] == anonymizer.pseudonym(42)
+        assert button['message']['text'] == 'Взять карту'
+        assert command['message']['entities'][0]['type'] == 'bot_command'
+
+    def test_caption_and_inline_query_are_removed(self) -> None:
+        """Test that captions and inline queries are replaced like free text, with the ids of their users."""
+        anonymizer = Anonymizer({'Взять карту'}, salt=b'salt')
+        update = make_update(1, 42, 'Взять карту')
+        photo = update['message']
+        del photo['text']
+        photo['caption'] = 'my secret'
+        photo['caption_entities'] = [{'type': 'bold', 'offset': 0, 'length': 2}]
+        photo['photo'] = [{'file_id': 'AgAD', 'file_unique_id': 'AQAD', 'width': 800, 'height': 600}]
+        query = {'update_id': 2, 'inline_query': {
+            'id': '77', 'from': {'id': 42, 'is_bot': False, 'first_name': 'Анна'}, 'query': 'my secret', 'offset': '',
+        }}
+
+        caption = anonymizer.anonymize(update)['message']
+        inline_query = anonymizer.anonymize(query)['inline_query']
+
+        assert caption['caption'] == '<text>' and 'caption_entities' not in caption
+        assert caption['photo'] == [{'file_id': '<text>', 'file_unique_id': '<text>', 'width': 0, 'height': 0}]
+        assert inline_query['query'] == '<text>'
+        assert inline_query['from']['id'] == anonymizer.pseudonym(42)
+        parsed = Update.de_json(anonymizer.anonymize(update), None).message
+        assert parsed is not None and parsed.caption == '<text>'
+
+    def test_ids_are_pseudonymized_everywhere(self) -> None:
+        """Test that the ids of contacts, forwarded senders and new members are pseudonymized, other data removed."""
+        anonymizer = Anonymizer(set(), salt=b'salt')
+        message = make_update(1, 42, 'Взять карту')['message']
+        del message['text']
+        message['contact'] = {'phone_number': '+79990000000', 'first_name': 'Иван', 'user_id': 7}
+        message['location'] = {'latitude': 55.75, 'longitude': 37.62}
+        message['forward_origin'] = {
+            'type': 'user', 'date': 1700000000, 'sender_user': {'id': 8, 'is_bot': False, 'first_name': 'Олег'},
+        }
+        message['new_chat_members'] = [{'id': 9, 'is_bot': False, 'first_name': 'Пётр', 'username': 'petr'}]
+
+        anonymized = anonymizer.anonymize(message)
+
+        pseudonym = anonymizer.pseudonym
+        assert anonymized['contact'] == {'phone_number': '<text>', 'first_name': 'user', 'user_id': pseudonym(7)}
+        assert anonymized['location'] == {'latitude': 0.0, 'longitude': 0.0}
+        assert anonymized['forward_origin']['sender_user']['id'] == pseudonym(8)
+        assert anonymized['new_chat_members'] == [{'id': pseudonym(9), 'is_bot': False, 'first_name': 'user'}]
+        for secret in ('7999', '55.75', 'Олег', 'petr'):
+            assert secret not in json.dumps(anonymized, ensure_ascii=False)
+
+
+class TestTrafficRecorder:
+    """Test suite for TrafficRecorder class."""
+
+    @pytest.mark.asyncio
+    async def test_recorded_log_is_read_back(self, tmp_path: Path) -> None:
+        """Test that recorded updates are written compressed and read in order."""
+        path = tmp_path / 'traffic.jsonl.gz'
+        recorder = TrafficRecorder()
+        recorder.open(path, {'Взять карту'})
+        for update_id in range(3):
+            await recorder.record(Update.de_json(make_update(update_id, 42, 'Взять карту'), None))
+        recorder.close()
+
+        entries = read_log(path)
+        assert [update['update_id'] for _, update in entries] == [0, 1, 2]
+        assert [offset for offset, _ in entries] == sorted(offset for offset, _ in entries)
+        with gzip.open(path, 'rt', encoding='utf-8') as log:
+            assert 'Анна' not in log.read()
+
+
+class TestReplay:
+    """Test suite for the traffic replay."""
+
+    @pytest.mark.asyncio
+    async def test_replay_is_deterministic(self) -> None:
+        """Test that replays with the same seed in one process make the same calls with the same cards."""
+        entries = [(0.0, make_update(1, 42, '/start'))]
+        entries += [(0.01 * i, make_update(i + 1, 42, 'Взять карту')) for i in range(1, 5)]
+
+        results = [await replay(entries, seed=7) for _ in range(2)]
+
+        assert results[0]['updates'] == results[1]['updates'] == 5
+        assert results[0]['api_calls'] == results[1]['api_calls']
+        assert results[0]['sent_bytes'] == results[1]['sent_bytes'] > 0
+
+    @pytest.mark.asyncio
+    async def test_duplicates_are_not_counted(self) -> None:
+        """Test that an update delivered twice in the log is handled and counted once."""
+        recent_updates = dedup.recent_updates
+        entries = [(0.0, make_update(1, 42, '/start')), (0.01, make_update(1, 42, '/start'))]
+
+        result = await replay(entries)
+
+        assert result['updates'] == 1
+        assert dedup.recent_updates is recent_updates
+
+    def test_compare_reports_regressions(self) -> None:
+        """Test that metrics worse than the baseline beyond the tolerance are reported."""
+        baseline = {'p95_ms': 10.0, 'allocated_blocks': 100, 'api_calls': 10, 'sent_bytes': 1000}
+        result = {'p95_ms': 10.5, 'allocated_blocks': 150, 'api_calls': 10, 'sent_bytes': 1000}
+
+        assert compare(result, baseline, tolerance=0.1) == ['allocated_blocks: 100 -> 150']
+        assert json.dumps(result)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Iterator, cast
+from unittest.mock import AsyncMock
+from urllib.parse import parse_qs
+
+import pytest
+
+from telegram import Chat, InputFile, Message as TgMessage, Update
+from telegram._utils.defaultvalue import DEFAULT_NONE
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest, RequestData
+from telegram.request._requestparameter import RequestParameter
+
+from bot.bot import build_application
+from bot.location import MenuLocation, Message
+from bot.stats import WindowedStats, format_stats
+from bot.transport import ApiServer, PoolConfig, PooledRequest, RoutingRequest, TransportConfig
+
+TOKEN = '123:abc'
+
+SENT_PHOTO = {
+    'message_id': 2, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+    'photo': [{'file_id': 'photo', 'file_unique_id': 'photo', 'width': 1, 'height': 1}],
+}
+BOT_USER = {'id': 123, 'is_bot': True, 'first_name': 'Oracle', 'username': 'oracle_bot'}
+
+
+class StandInApiServer:
+    """A local Bot API server which records the requests and answers with canned results."""
+
+    def __init__(self) -> None:
+        self.requests: list[tuple[str, str, bytes]] = []
+        requests = self.requests
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                requests.append((self.path, self.headers['Content-Type'], body))
+                result = BOT_USER if self.path.endswith('/getMe') else SENT_PHOTO
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestRoutingRequest:
+    """Test suite for RoutingRequest class."""
+
+    @pytest.fixture
+    def request_(self, monkeypatch: pytest.MonkeyPatch) -> RoutingRequest:
+        monkeypatch.setattr(HTTPXRequest, 'do_request', AsyncMock(return_value=(200, b'{}')))
+        return RoutingRequest(TransportConfig(media=PoolConfig(size=1), text=PoolConfig(size=2)))
+
+    @pytest.mark.asyncio
+    async def test_uploads_go_to_media_pool(self, request_: RoutingRequest) -> None:
+        """Test that photo uploads and text replies use different pools."""
+        await request_.do_request('https://api.telegram.org/bot0:x/sendPhoto', 'POST')
+        await request_.do_request('https://api.telegram.org/bot0:x/sendMessage', 'POST')
+
+        assert request_.media.waits.count == 1
+        assert request_.text.waits.count == 1
+
+    @pytest.mark.asyncio
+    async def test_uploads_keep_media_write_timeout(self, request_: RoutingRequest) -> None:
+        """Test that an upload is written with the timeout of the media pool, not the 20 seconds of BaseRequest."""
+        upload = RequestData([RequestParameter.from_input('photo', InputFile(b'0' * 100, attach=True))])
+        request_.media.media_write_timeout = 60.0
+        do_request = cast(AsyncMock, HTTPXRequest.do_request)
+        do_request.return_value = (200, b'{"ok": true, "result": true}')
+
+        await request_.post('https://api.telegram.org/bot0:x/sendPhoto', upload)
+        await request_.post('https://api.telegram.org/bot0:x/sendMessage', RequestData())
+
+        assert [call.args[4] for call in do_request.call_args_list] == [60.0, DEFAULT_NONE]
+
+    def test_waits_of_every_request_are_shown(self, request_: RoutingRequest) -> None:
+        """Test that /stats shows the waits of the pools of all the requests, not of the last one only."""
+        other = RoutingRequest(TransportConfig(media=PoolConfig(size=1), text=PoolConfig(size=1)))
+        request_.text.waits.add(1)
+        other.text.waits.add(1)
+
+        assert 'pool text: 2 requests' in format_stats(WindowedStats())
+
+    @pytest.mark.asyncio
+    async def test_waits_for_free_connection_are_recorded(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a request waiting behind a busy pool records its wait time."""
+        async def slow_request(*args: object) -> tuple[int, bytes]:
+            await asyncio.sleep(0.05)
+            return 200, b'{}'
+
+        monkeypatch.setattr(HTTPXRequest, 'do_request', slow_request)
+        pool = PooledRequest('test', PoolConfig(size=1))
+        await asyncio.gather(
+            pool.do_request('https://api.telegram.org/bot0:x/sendPhoto', 'POST'),
+            pool.do_request('https://api.telegram.org/bot0:x/sendPhoto', 'POST'),
+        )
+
+        assert pool.waits.count == 2
+        assert (pool.waits.quantile(1) or 0) >= 40
+        assert pool.in_use == 0
+
+    @pytest.mark.asyncio
+    async def test_saturated_pool_times_out(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that a request waiting for a busy pool longer than the pool timeout is not sent and times out."""
+        async def slow_request(*args: object) -> tuple[int, bytes]:
+            await asyncio.sleep(0.2)
+            return 200, b'{}'
+
+        monkeypatch.setattr(HTTPXRequest, 'do_request', slow_request)
+        pool = PooledRequest('test', PoolConfig(size=1, pool_timeout=0.05))
+        results = await asyncio.gather(
+            pool.do_request('https://api.telegram.org/bot0:x/sendPhoto', 'POST'),
+            pool.do_request('https://api.telegram.org/bot0:x/sendPhoto', 'POST'),
+            return_exceptions=True,
+        )
+
+        assert results[0] == (200, b'{}')
+        assert isinstance(results[1], TimedOut) and 'test pool' in str(results[1])
+        assert pool.waits.count == 2
+        assert pool.in_use == 0
+        # The slot of the request which timed out is not lost
+        assert await pool.do_request('https://api.telegram.org/bot0:x/sendPhoto', 'POST', pool_timeout=0.05)
+
+
+class TestApiServer:
+    """Test suite for sending through a self-hosted Bot API server."""
+
+    @pytest.fixture
+    def server(self) -> Iterator[StandInApiServer]:
+        server = StandInApiServer()
+        yield server
+        server.close()
+
+    @staticmethod
+    async def send_card(api_server: ApiServer, image_path: Path) -> None:
+        application = build_application(TOKEN, api_server=api_server)
+        location = MenuLocation('Карта через свой сервер', Message('Карта', image_path=str(image_path)))
+        async with application:
+            message = TgMessage(1, datetime.now(), Chat(1, 'private'), text='Взять карту')
+            message.set_bot(application.bot)
+            await location.send_welcome_message(Update(1, message=message), application.context_types.context(
+                application, chat_id=1, user_id=1,
+            ))
+
+    @pytest.mark.asyncio
+    async def test_local_mode_sends_file_path(self, server: StandInApiServer, tmp_path: Path) -> None:
+        """Test that in local mode the image is passed as an absolute file URI, without a multipart upload."""
+        image_path = tmp_path / 'card.png'
+        image_path.write_bytes(b'\x89PNG' + b'0' * 100_000)
+
+        await self.send_card(ApiServer(server.url, local_mode=True), image_path)
+
+        path, content_type, body = server.requests[-1]
+        assert path == f'/bot{TOKEN}/sendPhoto'
+        assert not content_type.startswith('multipart/')
+        assert parse_qs(body.decode())['photo'] == [image_path.absolute().as_uri()]
+        assert len(body) < 1000
+
+    @pytest.mark.asyncio
+    async def test_remote_mode_uploads_file(self, server: StandInApiServer, tmp_path: Path) -> None:
+        """Test that without local mode the same image is uploaded to the server."""
+        image_path = tmp_path / 'card.png'
+        image_path.write_bytes(b'\x89PNG' + b'0' * 100_000)
+
+        await self.send_card(ApiServer(server.url), image_path)
+
+        path, content_type, body = server.requests[-1]
+        assert path == f'/bot{TOKEN}/sendPhoto'
+        assert content_type.startswith('multipart/form-data')
+        assert len(body) > 100_000
@@ -1,10 +1,42 @@
+import csv
+import os
+import struct
+import zlib
+from typing import Any
+
 import pytest
 from pathlib import Path
 
-from cards.cards_reader import CardsReader
+from cards.cards_reader import PNG_SIGNATURE, CardsReader, image_dimensions
 from cards.card import Card
 
 
+def make_png(width: int, height: int) -> bytes:
+    """Return a valid RGB PNG image of the given size."""
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+    rows = b''.join(b'\x00' + b'\x00' * width * 3 for _ in range(height))
+    return PNG_SIGNATURE + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) + \
+        chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+
+def write_deck(directory: Path, images: dict[str, bytes]) -> Path:
+    """Write a deck with a card for every image file name, return the path of its CSV file."""
+    (directory / 'images').mkdir(parents=True)
+    csv_path = directory / 'card_descriptions.csv'
+    with open(csv_path, 'w', encoding='utf-8', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([
+            'Название', 'Описание (основной текст)', 'Совет (толкование карты)',
+            'Ключевое значение (слова, словосочетания)',
+        ])
+        for file_name, data in images.items():
+            writer.writerow([Path(file_name).stem, 'описание', 'совет', 'слово'])
+            (directory / 'images' / file_name).write_bytes(data)
+    return csv_path
+
+
 class TestCardsReader:
     """Test suite for CardsReader class."""
 
@@ -85,3 +117,56 @@ class TestCardsReader:
                 card.image_path.lower().endswith(ext)
                 for ext in ['.png', '.jpg', '.jpeg']
             )
+
+
+class TestIngest:
+    """Test suite for CardsReader.ingest method."""
+
+    def test_real_deck_images_are_valid(self) -> None:
+        """Test that every card of the deck gets the metadata of its image, in the order of the cards."""
+        csv_path = Path(__file__).parent.parent.parent / "cards" / "card_descriptions.csv"
+        ingestion = CardsReader(csv_path).ingest(workers=4)
+
+        assert ingestion.cards == CardsReader(csv_path).read_cards()
+        assert [image.card_name for image in ingestion.images] == [card.name for card in ingestion.cards]
+        assert not ingestion.invalid
+        assert {image.format for image in ingestion.images} == {'PNG', 'JPEG'}
+        assert all(image.width > 0 and image.height > 0 and image.size > 0 for image in ingestion.images)
+        assert len({image.sha256 for image in ingestion.images}) == len(ingestion.images)
+        assert ingestion.seconds >= ingestion.images_seconds > 0
+
+    def test_broken_images_are_reported(self, tmp_path: Path) -> None:
+        """Test that undecodable and truncated images are reported instead of failing the deck."""
+        image = make_png(3, 2)
+        csv_path = write_deck(tmp_path, {
+            'Лес.png': image, 'Река.jpg': b'not an image', 'Гора.PNG': image[:len(image) // 2],
+        })
+        ingestion = CardsReader(csv_path).ingest()
+
+        assert len(ingestion.cards) == 3
+        first, second, third = ingestion.images
+        assert (first.format, first.width, first.height, first.valid) == ('PNG', 3, 2, True)
+        assert not second.valid and 'not a PNG or JPEG' in str(second.error)
+        assert not third.valid and third.size == len(image) // 2
+        assert ingestion.invalid == [second, third]
+
+    def test_images_directory_is_listed_once(self, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Test that the image of every card is found in one listing of the directory."""
+        csv_path = write_deck(tmp_path, {f'Карта {index}.jpg': b'' for index in range(20)})
+        scandir = os.scandir
+        calls = []
+
+        def counting_scandir(path: Any) -> Any:
+            calls.append(path)
+            return scandir(path)
+
+        monkeypatch.setattr('cards.cards_reader.os.scandir', counting_scandir)
+
+        cards = CardsReader(csv_path).read_cards()
+        assert len(cards) == 20 and len(calls) == 1
+
+    def test_jpeg_dimensions(self) -> None:
+        """Test that the dimensions are read from the frame header after other segments."""
+        app0 = b'\xff\xe0' + struct.pack('>H', 6) + b'JFIF'
+        frame = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, 480, 640, 3) + b'\x00' * 3
+        assert image_dimensions(b'\xff\xd8' + app0 + frame + b'\xff\xd9') == ('JPEG', 640, 480)
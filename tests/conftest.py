@@ -0,0 +1,14 @@
+from typing import Iterator
+
+import pytest
+
+from bot import location
+
+
+@pytest.fixture(autouse=True)
+def locations() -> Iterator[None]:
+    """Forget the locations created by a test, so the next one can use the same names."""
+    saved = dict(location._locations_by_name)
+    yield
+    location._locations_by_name.clear()
+    location._locations_by_name.update(saved)